@@ -11,6 +11,41 @@ class Settings(BaseSettings):
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24
 
+    # Stock row locks (sales / reconcile): give up after this long and
+    # log any wait longer than the slow threshold
+    STOCK_LOCK_TIMEOUT_MS: int = 5000
+    STOCK_LOCK_SLOW_MS: int = 200
+
+    # Receipt PDFs: background render threads and LRU size (per worker)
+    RECEIPT_RENDER_WORKERS: int = 2
+    RECEIPT_CACHE_SIZE: int = 500
+
+    # Report PDFs: rows fetched/laid out per chunk, and how much of a
+    # finished document stays in memory before spilling to a temp file
+    REPORT_CHUNK_ROWS: int = 200
+    REPORT_SPOOL_MEMORY_BYTES: int = 4 * 1024 * 1024
+
+    # PDF rendering (reports and receipts) runs in its own processes so
+    # ReportLab never holds an API worker's GIL: how many processes, and
+    # how many report PDFs may be waiting or rendering at once (per worker)
+    PDF_RENDER_PROCESSES: int = 2
+    PDF_RENDER_QUEUE_LIMIT: int = 8
+
+    # Background report jobs: worker threads, how many may be queued or
+    # running at once (per process), how long a finished file is kept and
+    # shared with identical requests, and where the files are written
+    REPORT_JOB_WORKERS: int = 2
+    REPORT_JOB_QUEUE_LIMIT: int = 20
+    REPORT_JOB_TTL_SECONDS: int = 1800
+    # Each process refreshes its jobs' heartbeat this often; a queued or
+    # running job not refreshed for three intervals is failed
+    REPORT_JOB_HEARTBEAT_SECONDS: int = 15
+    REPORT_ARTIFACT_DIR: str = "/app/reports"
+
+    # Local time zone of the pharmacy: sales and stock movements are
+    # reported under the calendar day they happened on here
+    BUSINESS_TIMEZONE: str = "Africa/Nairobi"
+
     # This configures Pydantic to read from a .env file
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
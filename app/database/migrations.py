@@ -0,0 +1,118 @@
+# app/database/migrations.py
+from sqlalchemy import text
+
+from app.database.db import Base
+from app.models.sales import SALE_BUSINESS_DATE
+from app.models.stock_movement import MOVEMENT_BUSINESS_DATE
+
+# Base.metadata.create_all() only creates tables that do not exist yet.
+# Indexes declared on models and columns added to existing tables are
+# applied here, on every startup, right after create_all().
+# Every statement must be idempotent (IF NOT EXISTS / WHERE ... IS NULL);
+# backfills that would scan a whole table run in a DO block, once, guarded
+# on the column they fill not existing yet.
+
+# Raw DDL/DML applied in order before the model indexes are created.
+STATEMENTS = [
+    # Product search: prefix (text_pattern_ops) and trigram (pg_trgm) indexes
+    # on the lower-cased brand and generic names
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_products_brand_name_prefix "
+    "ON products (lower(brand_name) text_pattern_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_products_brand_name_trgm "
+    "ON products USING gin (lower(brand_name) gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_generic_drugs_name_prefix "
+    "ON generic_drugs (lower(name) text_pattern_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_generic_drugs_name_trgm "
+    "ON generic_drugs USING gin (lower(name) gin_trgm_ops)",
+
+    # Sale movements reference their transaction; older rows only carried
+    # the receipt number in the reason text ("Sale RCPT-..."); they are
+    # matched up once, when the column is added
+    "DO $$ BEGIN IF NOT EXISTS (SELECT 1 FROM information_schema.columns "
+    "WHERE table_name = 'stock_movements' AND column_name = 'transaction_id') "
+    "THEN ALTER TABLE stock_movements ADD COLUMN transaction_id INTEGER "
+    "REFERENCES sales_transactions (id) ON DELETE SET NULL; "
+    "UPDATE stock_movements AS m SET transaction_id = t.id "
+    "FROM sales_transactions AS t "
+    "WHERE m.reason LIKE 'Sale %' AND t.receipt_number = substr(m.reason, 6); "
+    "END IF; END $$",
+
+    # Clinical record search: trigram indexes on the names, full-text on
+    # the dosage instructions (expressions match app/utils/clinical_search.py)
+    "CREATE INDEX IF NOT EXISTS ix_sales_transactions_patient_name_trgm "
+    "ON sales_transactions USING gin (lower(patient_name) gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_prescription_details_prescriber_name_trgm "
+    "ON prescription_details USING gin (lower(prescriber_name) gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_prescription_details_medical_institution_trgm "
+    "ON prescription_details USING gin (lower(medical_institution) gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_prescription_details_instructions_fts "
+    "ON prescription_details USING gin "
+    "(to_tsvector('simple', coalesce(dosage_instructions, '')))",
+
+    # Local business day of sales and movements, generated from the
+    # timestamp (filling it rewrites the table once). The sales rollups
+    # and DDA checkpoints were keyed on the UTC day until then: empty them
+    # so they are refilled by business day (the rollups by the startup
+    # step, the checkpoints by the next period report).
+    "DO $$ BEGIN IF NOT EXISTS (SELECT 1 FROM information_schema.columns "
+    "WHERE table_name = 'sales_transactions' AND column_name = 'business_date') "
+    "THEN TRUNCATE sales_daily_rollup, sales_daily_totals, dda_balance_checkpoints; "
+    "END IF; END $$",
+    "ALTER TABLE sales_transactions ADD COLUMN IF NOT EXISTS business_date DATE "
+    f"GENERATED ALWAYS AS ({SALE_BUSINESS_DATE}) STORED",
+    "ALTER TABLE stock_movements ADD COLUMN IF NOT EXISTS business_date DATE "
+    f"GENERATED ALWAYS AS ({MOVEMENT_BUSINESS_DATE}) STORED",
+    # Superseded by ix_stock_movements_drug_timestamp
+    "DROP INDEX IF EXISTS ix_stock_movements_drug_id",
+
+    # Rollup history outlives deleted products (their lines are kept
+    # under product 0), so the rollup no longer references products
+    "ALTER TABLE sales_daily_rollup "
+    "DROP CONSTRAINT IF EXISTS sales_daily_rollup_product_id_fkey",
+
+    # Cost price captured on each sale line; older lines take their batch's
+    # current buying price (the best record there is), once, when the
+    # column is added
+    "DO $$ BEGIN IF NOT EXISTS (SELECT 1 FROM information_schema.columns "
+    "WHERE table_name = 'sale_items' AND column_name = 'unit_cost') "
+    "THEN ALTER TABLE sale_items ADD COLUMN unit_cost DOUBLE PRECISION; "
+    "UPDATE sale_items AS i SET unit_cost = d.buying_price FROM drugs AS d "
+    "WHERE d.id = i.drug_id; "
+    "END IF; END $$",
+
+    # Report job leases (the table is created with the column since)
+    "ALTER TABLE report_jobs ADD COLUMN IF NOT EXISTS heartbeat_at TIMESTAMPTZ",
+]
+
+
+def _pre_index_steps():
+    # Data fixes the model indexes depend on (e.g. unique ones)
+    from app.utils.catalog_names import merge_catalog_duplicates
+    return [merge_catalog_duplicates]
+
+
+def _data_steps():
+    # Imported lazily: these modules import the models, which import db.
+    from app.utils.stock_summary import seed_stock_summary
+    from app.utils.sales_rollup import seed_sales_rollup
+    return [seed_stock_summary, seed_sales_rollup]
+
+
+def run_migrations(engine):
+    """Brings an existing database up to date with the models."""
+    with engine.begin() as conn:
+        for statement in STATEMENTS:
+            conn.execute(text(statement))
+
+        for step in _pre_index_steps():
+            step(conn)
+
+        # Indexes declared in __table_args__ / index=True on existing tables
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+
+        # Derived tables that must be populated once for existing data
+        for step in _data_steps():
+            step(conn)
@@ -3,6 +3,7 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.database.db import engine, Base
+from app.database.migrations import run_migrations
 from app.routers import (
     auth_router,
     sales_router,
@@ -10,7 +11,10 @@ from app.routers import (
     alerts_router,
     audit_router,
     admin_router,
+    reports_router,
 )
+from app.utils.report_jobs import shutdown_report_jobs, start_report_jobs
+from app.utils.pdf_pool import shutdown_pdf_pool
 
 # -------------------------
 # Lifespan (startup / shutdown)
@@ -19,10 +23,15 @@ from app.routers import (
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup: create tables
+    # Startup: create tables, then apply indexes/columns to existing ones
     Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    # Fail report jobs abandoned by dead processes, start this one's heartbeat
+    start_report_jobs()
     yield
-    # Shutdown: cleanup (optional)
+    # Shutdown: drop report jobs that have not started, stop the renderers
+    shutdown_report_jobs()
+    shutdown_pdf_pool()
 
 
 # -------------------------
@@ -51,7 +60,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
-    expose_headers=["Content-Disposition"]  # Add this line
+    # Content-Disposition for downloads, X-Next-Cursor for paginated lists
+    expose_headers=["Content-Disposition", "X-Next-Cursor"]
 )
 
 # -------------------------
@@ -74,3 +84,4 @@ app.include_router(audit_router.router, prefix="/api/audit", tags=["Audit"])
 app.include_router(sales_router.router,
                    prefix="/api/analytics", tags=["Analytics"])
 app.include_router(admin_router.router, prefix="/api/admin", tags=["Admin"])
+app.include_router(reports_router.router, prefix="/api/reports", tags=["Reports"])
@@ -1,21 +1,39 @@
 # app/models/dda.py  
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from app.database.db import Base
 from datetime import datetime, timezone
 
 
 class DDARegister(Base):
+    """
+    Controlled-drug register, one row per stock movement of an is_controlled
+    product, appended in the same transaction as the movement (see
+    app/utils/dda_register.py). balance_after is the product's running
+    balance, so any period reads as a range scan.
+    """
     __tablename__ = "dda_register"
+    __table_args__ = (
+        # Per-product period reads and "latest balance" lookups
+        Index("ix_dda_register_product_timestamp_id",
+              "product_id", "timestamp", "id"),
+        # Month-range scans when building balance checkpoints
+        Index("ix_dda_register_timestamp", "timestamp"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
 
     # Links
     drug_id = Column(Integer, ForeignKey("drugs.id"), nullable=False)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    product_id = Column(Integer, ForeignKey(
+        "products.id", ondelete="SET NULL"), nullable=True)
+    movement_id = Column(Integer, ForeignKey(
+        "stock_movements.id"), nullable=True, unique=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
 
     # Transaction Details
-    entry_type = Column(String)  # "IN" (Received) or "OUT" (Sold/Dispensed)
+    # Movement type: "RECEIVE", "DISPENSE" or "RECONCILE"
+    entry_type = Column(String)
 
     # Timestamp
     timestamp = Column(DateTime(timezone=True),
@@ -39,6 +57,31 @@ class DDARegister(Base):
 
     # Relationships
     drug = relationship("Drug")
+    product = relationship("Product")
+    movement = relationship("StockMovement")
     user = relationship("User")
-    dda_audit_logs = relationship(
-        "DDAAuditLog", back_populates="dda_register", cascade="all, delete-orphan")
\ No newline at end of file
+
+
+class DDABalanceCheckpoint(Base):
+    """
+    Closing balance of one batch at the end of a calendar month, for every
+    month the batch had register entries. Period reports open from the
+    nearest checkpoint instead of replaying the whole register.
+    """
+    __tablename__ = "dda_balance_checkpoints"
+    __table_args__ = (
+        Index("ix_dda_balance_checkpoints_product_month", "product_id", "month"),
+    )
+
+    drug_id = Column(Integer, ForeignKey(
+        "drugs.id", ondelete="CASCADE"), primary_key=True)
+    # First day of the month
+    month = Column(Date, primary_key=True)
+    product_id = Column(Integer, ForeignKey(
+        "products.id", ondelete="SET NULL"), nullable=True)
+
+    quantity_in = Column(Integer, nullable=False, default=0)
+    quantity_out = Column(Integer, nullable=False, default=0)
+    closing_balance = Column(Integer, nullable=False)
+
+    drug = relationship("Drug")
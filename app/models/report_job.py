@@ -0,0 +1,41 @@
+# app/models/report_job.py
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index, Text, JSON
+from sqlalchemy.sql import func
+from app.database.db import Base
+
+
+class ReportJob(Base):
+    """
+    A report generated in the background (see app/utils/report_jobs.py).
+    The finished file is kept on disk until expires_at; identical requests
+    made before then are answered with the same job.
+    """
+    __tablename__ = "report_jobs"
+    __table_args__ = (
+        # Finding a live job for an identical request
+        Index("ix_report_jobs_request_key_expires", "request_key", "expires_at"),
+    )
+
+    id = Column(String(32), primary_key=True)
+    kind = Column(String, nullable=False)
+    params = Column(JSON, nullable=False)
+    # Hash of kind, params and requesting user
+    request_key = Column(String(64), nullable=False)
+    created_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+
+    status = Column(String, nullable=False, default="queued")  # queued, running, done, failed
+    rows_done = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+
+    filename = Column(String, nullable=True)
+    media_type = Column(String, nullable=True)
+    artifact_path = Column(String, nullable=True)
+    size_bytes = Column(Integer, nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    # Refreshed by the process holding a queued or running job; a stale
+    # one means that process is gone
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
@@ -1,15 +1,30 @@
 # app/models/sales.py
 from sqlalchemy import (
-    Column, Integer, String, DateTime,
-    Float, ForeignKey, Text
+    Column, Integer, String, Date, DateTime,
+    Float, ForeignKey, Text, Index, Computed
     )
 from sqlalchemy.orm import relationship
 from datetime import datetime
+from app.core.config import settings
 from app.database.db import Base
 
+# Local calendar day of a sale (timestamps are stored as naive UTC).
+# Generated by Postgres, so every insert path gets it for free.
+SALE_BUSINESS_DATE = ("((\"timestamp\" AT TIME ZONE 'UTC') "
+                      f"AT TIME ZONE '{settings.BUSINESS_TIMEZONE}')::date")
+
 
 class SalesTransaction(Base):
     __tablename__ = "sales_transactions"
+    __table_args__ = (
+        # Date-range listings paged newest-first on (timestamp, id)
+        Index("ix_sales_transactions_timestamp_id", "timestamp", "id"),
+        # Per-cashier totals, trend and record pages
+        Index("ix_sales_transactions_user_timestamp", "user_id", "timestamp", "id"),
+        # Day-range filters (analytics, exports, prescription book)
+        Index("ix_sales_transactions_user_business_date", "user_id", "business_date"),
+        Index("ix_sales_transactions_business_date", "business_date"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     receipt_number = Column(String, unique=True,
@@ -17,6 +32,7 @@ class SalesTransaction(Base):
     patient_name = Column(String, nullable=True)
     total_amount = Column(Float, nullable=False)
     timestamp = Column(DateTime, default=datetime.utcnow)
+    business_date = Column(Date, Computed(SALE_BUSINESS_DATE, persisted=True))
 
     # Track who sold it
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -32,12 +48,15 @@ class SaleItem(Base):
     __tablename__ = "sale_items"
 
     id = Column(Integer, primary_key=True, index=True)
-    transaction_id = Column(Integer, ForeignKey("sales_transactions.id"))
+    transaction_id = Column(Integer, ForeignKey("sales_transactions.id"),
+                            index=True)
     drug_id = Column(Integer, ForeignKey("drugs.id"))
 
     quantity = Column(Integer, nullable=False)
     unit_price = Column(Float, nullable=False)  # Price at the time of sale
     subtotal = Column(Float, nullable=False)
+    # Batch buying price at the time of sale; profit is reported from it
+    unit_cost = Column(Float, nullable=True)
 
     transaction = relationship("SalesTransaction", back_populates="items")
     drug = relationship("Drug")
@@ -47,7 +66,7 @@ class PrescriptionDetail(Base):
     __tablename__ = "prescription_details"
     id = Column(Integer, primary_key=True, index=True)
     transaction_id = Column(Integer, ForeignKey(
-        "sales_transactions.id"), nullable=False)
+        "sales_transactions.id"), nullable=False, index=True)
 
     patient_age = Column(String, nullable=True)
     patient_sex = Column(String, nullable=True)
@@ -59,3 +78,42 @@ class PrescriptionDetail(Base):
     transaction = relationship(
         "SalesTransaction", back_populates="prescription_info")
 
+
+
+class SalesDailyRollup(Base):
+    """
+    Derived sales per day, cashier and product. Added to by every sale in
+    the same transaction; see app/utils/sales_rollup.py for the rebuild.
+    """
+    __tablename__ = "sales_daily_rollup"
+    __table_args__ = (
+        Index("ix_sales_daily_rollup_user_day", "user_id", "day"),
+    )
+
+    day = Column(Date, primary_key=True)
+    # 0 when the sale has no cashier
+    user_id = Column(Integer, primary_key=True)
+    # 0 when the batch's product was deleted. Not a foreign key: the
+    # history outlives the product
+    product_id = Column(Integer, primary_key=True)
+
+    revenue = Column(Float, nullable=False, default=0.0)
+    cost = Column(Float, nullable=False, default=0.0)
+    profit = Column(Float, nullable=False, default=0.0)
+    units = Column(Integer, nullable=False, default=0)
+    # Transactions that included the product
+    transaction_count = Column(Integer, nullable=False, default=0)
+
+
+class SalesDailyTotal(Base):
+    """Derived sales totals per day and cashier (receipt totals)."""
+    __tablename__ = "sales_daily_totals"
+    __table_args__ = (
+        Index("ix_sales_daily_totals_user_day", "user_id", "day"),
+    )
+
+    day = Column(Date, primary_key=True)
+    user_id = Column(Integer, primary_key=True)
+
+    revenue = Column(Float, nullable=False, default=0.0)
+    transaction_count = Column(Integer, nullable=False, default=0)
@@ -1,9 +1,10 @@
 # app/models/stock.py
 
 from sqlalchemy import (
-    Column, Integer, String, Date, Float, Boolean, ForeignKey
+    Column, Integer, String, Date, DateTime, Float, Boolean, ForeignKey, Index
     )
 from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
 from app.database.db import Base
 
 
@@ -45,19 +46,34 @@ class Product(Base):
     batches = relationship("Drug", back_populates="product")
 
 
+# Case/space-insensitive uniqueness of catalogue names; the add endpoints
+# upsert against these (see app/utils/catalog_names.py)
+Index("uq_suppliers_name_normalised",
+      func.lower(func.trim(Supplier.name)), unique=True)
+Index("uq_generic_drugs_name_normalised",
+      func.lower(func.trim(GenericDrug.name)), unique=True)
+Index("uq_products_brand_name_normalised",
+      func.lower(func.trim(Product.brand_name)), unique=True)
+
+
 class Drug(Base):
     """Represents a specific physical Batch of a Product"""
     __tablename__ = "drugs"
+    __table_args__ = (
+        # Keyset pagination / FEFO scans of the inventory listing
+        Index("ix_drugs_expiry_date_id", "expiry_date", "id"),
+        Index("ix_drugs_quantity_id", "quantity", "id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
 
     # UPDATED: Changed nullable to True and added ondelete="SET NULL"
     # This ensures the Batch remains even if the Brand (Product) is deleted
     product_id = Column(Integer, ForeignKey(
-        "products.id", ondelete="SET NULL"), nullable=True)
+        "products.id", ondelete="SET NULL"), nullable=True, index=True)
 
     # UPDATED: Added ondelete="SET NULL"
     supplier_id = Column(Integer, ForeignKey(
-        "suppliers.id", ondelete="SET NULL"), nullable=True)
+        "suppliers.id", ondelete="SET NULL"), nullable=True, index=True)
 
     batch_number = Column(String, index=True, nullable=False)
     expiry_date = Column(Date, nullable=False)
@@ -69,3 +85,38 @@ class Drug(Base):
 
     product = relationship("Product", back_populates="batches")
     supplier_rel = relationship("Supplier", back_populates="batches")
+
+
+class ProductStockSummary(Base):
+    """
+    Derived per-product stock totals (non-placeholder batches in stock).
+    Refreshed in the same transaction as every stock write; see
+    app/utils/stock_summary.py for the rebuild and drift check.
+    """
+    __tablename__ = "product_stock_summary"
+    product_id = Column(Integer, ForeignKey(
+        "products.id", ondelete="CASCADE"), primary_key=True)
+
+    total_quantity = Column(Integer, nullable=False, default=0)
+    batch_count = Column(Integer, nullable=False, default=0)
+    nearest_expiry = Column(Date, nullable=True)
+    # Weighted by quantity on hand
+    avg_cost = Column(Float, nullable=False, default=0.0)
+    below_reorder = Column(Boolean, nullable=False, default=False, index=True)
+    updated_at = Column(DateTime(timezone=True),
+                        server_default=func.now(), onupdate=func.now())
+
+    product = relationship("Product")
+
+
+class CatalogVersion(Base):
+    """
+    Change counter per catalogue entity ("generics", "products",
+    "suppliers"). Bumped in the same transaction as every write to that
+    entity so each worker can tell whether its cached copy is current.
+    """
+    __tablename__ = "catalog_versions"
+    entity = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True),
+                        server_default=func.now(), onupdate=func.now())
@@ -1,12 +1,23 @@
 # app/models/stock_movement.py
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, Index, Computed
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
+from app.core.config import settings
 from app.database.db import Base
 
+# Local calendar day of a movement, generated by Postgres
+MOVEMENT_BUSINESS_DATE = f"(\"timestamp\" AT TIME ZONE '{settings.BUSINESS_TIMEZONE}')::date"
+
 
 class StockMovement(Base):
     __tablename__ = "stock_movements"
+    __table_args__ = (
+        # Ledger listings page newest-first on (timestamp, id)
+        Index("ix_stock_movements_timestamp_id", "timestamp", "id"),
+        # Per-batch history, and day-range filters
+        Index("ix_stock_movements_drug_timestamp", "drug_id", "timestamp"),
+        Index("ix_stock_movements_business_date", "business_date"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     drug_id = Column(Integer, ForeignKey("drugs.id"), nullable=False)
@@ -17,7 +28,13 @@ class StockMovement(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
+    business_date = Column(Date, Computed(MOVEMENT_BUSINESS_DATE, persisted=True))
     
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
     user = relationship("User")
+
+    # Set on DISPENSE movements written by a sale
+    transaction_id = Column(Integer, ForeignKey(
+        "sales_transactions.id", ondelete="SET NULL"), nullable=True, index=True)
+    transaction = relationship("SalesTransaction")
     
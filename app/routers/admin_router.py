@@ -6,8 +6,14 @@ from typing import Annotated
 
 from fastapi import APIRouter, Depends, HTTPException, status
 
-from app.utils.jwt import get_current_user
+from sqlalchemy.orm import Session
+
+from app.utils.jwt import get_current_user, get_db
 from app.models.user import User
+from app.utils import metrics
+from app.utils.stock_summary import rebuild_stock_summary, find_summary_drift
+from app.utils.dda_register import backfill_dda_register, refresh_dda_checkpoints
+from app.utils.sales_rollup import rebuild_sales_rollup
 
 router = APIRouter(tags=["Admin"])
 
@@ -82,3 +88,111 @@ def trigger_backup(
             status_code=500,
             detail=f"An unexpected error occurred: {str(e)}"
         )
+
+
+@router.get("/metrics", summary="In-process performance metrics")
+def get_metrics(
+    current_user: Annotated[User, Depends(get_current_user)]
+):
+    """
+    Returns counters and timings (e.g. stock lock waits) collected by this
+    worker process since it started.
+    """
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only administrators can view metrics."
+        )
+    return metrics.snapshot()
+
+
+@router.post("/stock-summary/rebuild", summary="Rebuild the per-product stock summary")
+def rebuild_summary(
+    current_user: Annotated[User, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_db)]
+):
+    """
+    Recomputes product_stock_summary from every batch. Use after restoring a
+    backup or when the drift check reports differences.
+    """
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only administrators can rebuild the stock summary."
+        )
+    products = rebuild_stock_summary(db)
+    db.commit()
+    return {"status": "success", "products": products}
+
+
+@router.get("/stock-summary/drift", summary="Check the stock summary for drift")
+def check_summary_drift(
+    current_user: Annotated[User, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_db)]
+):
+    """Lists products whose stored summary no longer matches their batches."""
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only administrators can check the stock summary."
+        )
+    drift = find_summary_drift(db)
+    return {"in_sync": not drift, "drifted_products": len(drift), "drift": drift}
+
+
+@router.post("/dda-register/backfill", summary="Back-fill the DDA register")
+def backfill_register(
+    current_user: Annotated[User, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_db)]
+):
+    """
+    Adds register entries for controlled-drug movements recorded before the
+    register was written (or while a product was not yet controlled) and
+    recomputes every running balance. Safe to run more than once.
+    """
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only administrators can back-fill the DDA register."
+        )
+    result = backfill_dda_register(db)
+    db.commit()
+    return {"status": "success", **result}
+
+
+@router.post("/dda-register/checkpoints/rebuild", summary="Rebuild DDA monthly balance checkpoints")
+def rebuild_dda_checkpoints(
+    current_user: Annotated[User, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_db)]
+):
+    """
+    Recomputes the per-batch monthly closing balances that period reports
+    open from. They are otherwise filled in lazily, month by month.
+    """
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only administrators can rebuild DDA checkpoints."
+        )
+    checkpoints = refresh_dda_checkpoints(db, full=True)
+    db.commit()
+    return {"status": "success", "checkpoints": checkpoints}
+
+
+@router.post("/sales-rollup/rebuild", summary="Rebuild the daily sales rollups")
+def rebuild_rollup(
+    current_user: Annotated[User, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_db)]
+):
+    """
+    Recomputes the per-day sales rollups the analytics dashboards read
+    from. Use after restoring a backup or correcting sales by hand.
+    """
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only administrators can rebuild the sales rollups."
+        )
+    days = rebuild_sales_rollup(db)
+    db.commit()
+    return {"status": "success", "days": days}
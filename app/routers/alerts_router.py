@@ -1,24 +1,24 @@
 # app/routers/alerts_router.py
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, contains_eager
 from sqlalchemy import text
 from datetime import date
-from typing import List
+from typing import List, Optional
 from pydantic import BaseModel
-import io
-
-# ReportLab Imports
-from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib import colors
 
+from app.core.config import settings
 from app.database.db import get_db
-from app.models.stock import Drug, Product
+from app.models.stock import Drug, Product, ProductStockSummary
 from app.models.stock_movement import StockMovement
 from app.models.user import User
 from app.dependencies.auth import get_current_user
+from app.utils.stock_locks import lock_rows
+from app.utils.dda_register import record_dda_movements
+from app.utils.stock_summary import refresh_product_summaries
+from app.utils.checklist_pdf import generate_checklist_pdf
+from app.utils.pdf_pool import render_pdf
+from app.utils.report_jobs import ReportFile, report_kind, track
 
 router = APIRouter(tags=["Alerts"])
 
@@ -40,10 +40,20 @@ class DrugAlertSchema(BaseModel):
         from_attributes = True
 
 
+class ProductAlertSchema(BaseModel):
+    product_id: int
+    brand_name: str
+    total_quantity: int
+    batch_count: int
+    reorder_level: int
+    nearest_expiry: Optional[date] = None
+
+
 class AlertResponseSchema(BaseModel):
     near_expiry: List[DrugAlertSchema]
-    low_stock: List[DrugAlertSchema]
-    controlled_attention: List[DrugAlertSchema]
+    # Product-level, read from product_stock_summary
+    low_stock: List[ProductAlertSchema]
+    controlled_attention: List[ProductAlertSchema]
     note: str
 
 
@@ -68,11 +78,31 @@ def map_drug_to_schema(drug: Drug) -> DrugAlertSchema:
     )
 
 
-def calculate_alert_type(item: Drug) -> str:
+def map_summary_to_schema(row) -> ProductAlertSchema:
+    return ProductAlertSchema(
+        product_id=row.product_id,
+        brand_name=row.brand_name,
+        total_quantity=row.total_quantity,
+        batch_count=row.batch_count,
+        reorder_level=row.reorder_level or 0,
+        nearest_expiry=row.nearest_expiry
+    )
+
+
+def product_summaries(db: Session):
+    return db.query(
+        ProductStockSummary.product_id, Product.brand_name,
+        ProductStockSummary.total_quantity, ProductStockSummary.batch_count,
+        Product.reorder_level, ProductStockSummary.nearest_expiry
+    ).join(Product, Product.id == ProductStockSummary.product_id)
+
+
+def calculate_alert_type(below_reorder: bool, expiry_date: date) -> str:
     """Helper to determine the status label for the checklist"""
-    is_low = item.quantity <= item.product.reorder_level
+    # Low stock is judged on the product's total on hand
+    is_low = bool(below_reorder)
     # Check if expiring within 60 days
-    is_near_expiry = (item.expiry_date - date.today()).days <= 60
+    is_near_expiry = (expiry_date - date.today()).days <= 60
 
     if is_low and is_near_expiry:
         return "LOW & EXPIRING"
@@ -89,30 +119,31 @@ def calculate_alert_type(item: Drug) -> str:
 def get_pharmacy_alerts(db: Session = Depends(get_db)):
     today = date.today()
 
-    # 1. Near Expiry (Using configured alert days)
-    near_expiry_raw = db.query(Drug).join(Product).filter(
+    # 1. Near Expiry (Using configured alert days). Expiry is per batch,
+    #    so this is the one section still read from the batches.
+    near_expiry_raw = db.query(Drug).join(Product).options(
+        contains_eager(Drug.product)
+    ).filter(
         Drug.quantity > 0,
         ~Drug.batch_number.ilike("PLACEHOLDER-%"),
         text("expiry_date - (expiry_alert_days * interval '1 day') <= CURRENT_DATE")
     ).order_by(Drug.expiry_date.asc()).all()
 
-    # 2. Low Stock
-    low_stock_raw = db.query(Drug).join(Product).filter(
-        Drug.quantity <= Product.reorder_level,
-        ~Drug.batch_number.ilike("PLACEHOLDER-%")
-    ).order_by(Drug.quantity.asc()).all()
+    # 2. Low Stock (products whose total on hand is at or below reorder level)
+    low_stock_raw = product_summaries(db).filter(
+        ProductStockSummary.below_reorder == True
+    ).order_by(ProductStockSummary.total_quantity.asc()).all()
 
-    # 3. Controlled Substances
-    controlled_raw = db.query(Drug).join(Product).filter(
+    # 3. Controlled Substances in stock
+    controlled_raw = product_summaries(db).filter(
         Product.is_controlled == True,
-        Drug.quantity > 0,
-        ~Drug.batch_number.ilike("PLACEHOLDER-%")
+        ProductStockSummary.total_quantity > 0
     ).order_by(Product.brand_name.asc()).all()
 
     return {
         "near_expiry": [map_drug_to_schema(d) for d in near_expiry_raw],
-        "low_stock": [map_drug_to_schema(d) for d in low_stock_raw],
-        "controlled_attention": [map_drug_to_schema(d) for d in controlled_raw],
+        "low_stock": [map_summary_to_schema(p) for p in low_stock_raw],
+        "controlled_attention": [map_summary_to_schema(p) for p in controlled_raw],
         "note": f"System scan complete for {today.strftime('%d %b %Y')}."
     }
 
@@ -120,25 +151,35 @@ def get_pharmacy_alerts(db: Session = Depends(get_db)):
 @router.get("/checklist")
 def get_checklist(db: Session = Depends(get_db), current_user=Depends(get_current_user)):
     """Returns ALL batches in stock for a full dispensary audit"""
-    items = db.query(Drug).join(Product).filter(
+    # Counted per batch; the low-stock flag comes from the product summary
+    items = db.query(
+        Drug.id, Product.brand_name, Drug.batch_number, Drug.expiry_date,
+        Drug.quantity, ProductStockSummary.below_reorder
+    ).join(Product, Drug.product_id == Product.id).outerjoin(
+        ProductStockSummary, ProductStockSummary.product_id == Product.id
+    ).filter(
         Drug.quantity > 0,
         ~Drug.batch_number.ilike("PLACEHOLDER-%")
     ).order_by(Product.brand_name.asc()).all()
 
     return [{
         "id": item.id,
-        "brand_name": item.product.brand_name,
+        "brand_name": item.brand_name,
         "batch_number": item.batch_number,
         "expiry_date": str(item.expiry_date),
         "quantity_digital": item.quantity,
-        "alert_type": calculate_alert_type(item)
+        "alert_type": calculate_alert_type(item.below_reorder, item.expiry_date)
     } for item in items]
 
 
 @router.post("/reconcile")
 def reconcile_stock(req: ReconcileRequest, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
     """Endpoint to update physical stock levels during audit"""
-    drug = db.query(Drug).filter(Drug.id == req.drug_id).first()
+    # Row lock: a sale on this batch waits until the count is recorded,
+    # so the logged difference always matches what was overwritten
+    locked = lock_rows(db, db.query(Drug).filter(
+        Drug.id == req.drug_id), "reconcile")
+    drug = locked[0] if locked else None
     if not drug:
         raise HTTPException(status_code=404, detail="Drug batch not found")
 
@@ -150,70 +191,54 @@ def reconcile_stock(req: ReconcileRequest, db: Session = Depends(get_db), curren
     drug.quantity = req.physical_quantity
 
     # Log the movement
-    db.add(StockMovement(
+    movement = StockMovement(
         drug_id=drug.id,
         movement_type="RECONCILE",
         quantity_changed=diff,
         reason=f"Manual audit reconciliation by {current_user.username}",
         user_id=current_user.id
-    ))
+    )
+    db.add(movement)
 
+    db.flush()
+    record_dda_movements(db, [drug.product_id], StockMovement.id == movement.id)
+    refresh_product_summaries(db, [drug.product_id])
     db.commit()
     return {"status": "success", "new_quantity": drug.quantity}
 
 
-@router.get("/checklist/pdf")
-def download_checklist_pdf(db: Session = Depends(get_db), current_user=Depends(get_current_user)):
-    """Generates a professional PDF of the full inventory checklist"""
-    items = db.query(Drug).join(Product).filter(
+class ChecklistParams(BaseModel):
+    pass
+
+
+@report_kind("checklist", ChecklistParams)
+def build_checklist_pdf(db: Session, params: ChecklistParams, user=None,
+                        progress=None) -> ReportFile:
+    """The full inventory checklist as a PDF"""
+    # Read through a server-side cursor
+    items = db.query(
+        Product.brand_name, Drug.batch_number, Drug.expiry_date, Drug.quantity
+    ).join(Product, Drug.product_id == Product.id).filter(
         Drug.quantity > 0,
         ~Drug.batch_number.ilike("PLACEHOLDER-%")
-    ).order_by(Product.brand_name.asc()).all()
+    ).order_by(Product.brand_name.asc(), Drug.id.asc())\
+     .yield_per(settings.REPORT_CHUNK_ROWS)
+
+    # Laid out in the PDF renderer pool from plain row tuples
+    pdf = render_pdf(generate_checklist_pdf,
+                     user.username if user else "System",
+                     rows=(tuple(item) for item in track(items, progress)))
+    return ReportFile([pdf], f"full_audit_{date.today()}.pdf",
+                      "application/pdf")
 
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
-    elements = []
-    styles = getSampleStyleSheet()
-
-    # Title and Meta
-    elements.append(
-        Paragraph("Full Dispensary Inventory Checklist", styles['Title']))
-    elements.append(Paragraph(
-        f"Audit Date: {date.today().strftime('%d %b %Y')}", styles['Normal']))
-    elements.append(
-        Paragraph(f"Generated by: {current_user.username}", styles['Normal']))
-    elements.append(Spacer(1, 15))
-
-    # Table Setup
-    data = [["Brand Name", "Batch", "Expiry", "System Qty", "Physical Count"]]
-    for item in items:
-        data.append([
-            item.product.brand_name,
-            item.batch_number,
-            str(item.expiry_date),
-            str(item.quantity),
-            "__________"  # Line for manual handwriting
-        ])
-
-    table = Table(data, colWidths=[180, 80, 80, 60, 80])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.whitesmoke),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-    ]))
-
-    elements.append(table)
-    doc.build(elements)
-    buffer.seek(0)
 
+@router.get("/checklist/pdf")
+def download_checklist_pdf(db: Session = Depends(get_db), current_user=Depends(get_current_user)):
+    """Generates a professional PDF of the full inventory checklist"""
+    report = build_checklist_pdf(db, ChecklistParams(), current_user)
     return StreamingResponse(
-        buffer,
-        media_type="application/pdf",
+        report.chunks,
+        media_type=report.media_type,
         headers={
-            "Content-Disposition": f"attachment; filename=full_audit_{date.today()}.pdf"}
+            "Content-Disposition": f"attachment; filename={report.filename}"}
     )
@@ -1,9 +1,8 @@
 # app/routers/audit_router.py
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.orm import Session
-from typing import List, Optional
-from datetime import date, datetime, time
+from typing import List, Literal, Optional
+from datetime import date, datetime
 from pydantic import BaseModel
 import structlog
 
@@ -13,7 +12,7 @@ from app.models.stock_movement import StockMovement
 from app.models.sales import SalesTransaction
 from app.models.user import User
 from app.dependencies.auth import get_current_user
-from app.utils.receipt_pdf import generate_receipt_pdf
+from app.utils.receipts import receipt_data, render_receipt
 
 logger = structlog.get_logger()
 router = APIRouter(tags=["Audit"])
@@ -89,11 +88,9 @@ def get_stock_audit(
     if batch_number:
         query = query.filter(Drug.batch_number == batch_number)
     if start_date:
-        query = query.filter(StockMovement.created_at >=
-                             datetime.combine(start_date, time.min))
+        query = query.filter(StockMovement.business_date >= start_date)
     if end_date:
-        query = query.filter(StockMovement.created_at <=
-                             datetime.combine(end_date, time.max))
+        query = query.filter(StockMovement.business_date <= end_date)
 
     results = query.order_by(StockMovement.id.desc()).all()
 
@@ -105,7 +102,7 @@ def get_stock_audit(
             movement_type=movement.movement_type,
             quantity_changed=movement.quantity_changed,
             reason=movement.reason or "No reason provided",
-            date=movement.created_at.date() if movement.created_at else date.today(),
+            date=movement.business_date or date.today(),
             username=user.username if user else "System"
         ) for movement, drug, user, product in results
     ]
@@ -123,11 +120,9 @@ def get_sales_history(
 
     query = db.query(SalesTransaction)
     if start_date:
-        query = query.filter(SalesTransaction.timestamp >=
-                             datetime.combine(start_date, time.min))
+        query = query.filter(SalesTransaction.business_date >= start_date)
     if end_date:
-        query = query.filter(SalesTransaction.timestamp <=
-                             datetime.combine(end_date, time.max))
+        query = query.filter(SalesTransaction.business_date <= end_date)
 
     transactions = query.order_by(SalesTransaction.timestamp.desc()).all()
 
@@ -164,6 +159,7 @@ def get_sales_history(
 @router.get("/reprint/{transaction_id}")
 def reprint_receipt(
     transaction_id: int,
+    format: Literal["pdf", "escpos", "text"] = "pdf",
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -176,38 +172,16 @@ def reprint_receipt(
         log.error("reprint_failed_not_found")
         raise HTTPException(status_code=404, detail="Transaction not found")
 
-    user = db.query(User).filter(User.id == tx.user_id).first()
-
-    pdf_data = {
-        "receipt_number": str(tx.receipt_number),
-        "ticket_number": "REPRINT",
-        "client_name": str(tx.patient_name),  # Aligned
-        "total_amount": float(tx.total_amount),
-        "date": tx.timestamp.strftime("%Y-%m-%d %H:%M"),
-        "served_by": str(user.username if user else "System"),
-        "items": []
-    }
-
-    for item in tx.items:
-        # REFACTOR: Correctly fetch name via Product relationship
-        drug_record = db.query(Drug).filter(Drug.id == item.drug_id).first()
-        name = drug_record.product.brand_name if drug_record and drug_record.product else "Item"
-
-        pdf_data["items"].append({
-            "name": str(name),
-            "qty": int(item.quantity),
-            "price": float(item.unit_price),
-            "subtotal": float(item.subtotal)
-        })
-
-    log.info("generating_reprint_pdf", receipt_no=tx.receipt_number)
-    pdf_buffer = generate_receipt_pdf(pdf_data)
-
-    return StreamingResponse(
-        pdf_buffer,
-        media_type="application/pdf",
+    # Labelled "REPRINT" and cached apart from the original print
+    log.info("serving_reprint", receipt_no=tx.receipt_number, format=format)
+    content, media_type, ext = render_receipt(
+        tx.receipt_number, format, lambda: receipt_data(db, tx), reprint=True)
+
+    return Response(
+        content=content,
+        media_type=media_type,
         headers={
-            "Content-Disposition": f"attachment; filename=reprint_{tx.receipt_number}.pdf",
+            "Content-Disposition": f"attachment; filename=reprint_{tx.receipt_number}.{ext}",
             # Added for frontend visibility
             "Access-Control-Expose-Headers": "Content-Disposition"
         }
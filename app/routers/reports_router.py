@@ -0,0 +1,89 @@
+# app/routers/reports_router.py
+import os
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+
+from app.database.db import get_db
+from app.models.report_job import ReportJob
+from app.models.user import User
+from app.utils.jwt import get_current_user
+from app.utils.report_jobs import REPORT_KINDS, job_status, submit_report_job
+
+router = APIRouter(tags=["Reports"])
+
+
+class ReportJobRequest(BaseModel):
+    kind: str
+    params: dict = {}
+
+
+def _get_job(db: Session, job_id: str, user: User) -> ReportJob:
+    job = db.get(ReportJob, job_id)
+    # Other users' jobs are only visible to admins
+    if not job or (job.created_by != user.id and user.role != "admin"):
+        raise HTTPException(status_code=404, detail="Report job not found")
+    return job
+
+
+@router.get("/kinds")
+def list_report_kinds(
+    current_user: Annotated[User, Depends(get_current_user)]
+):
+    """Reports that can be generated as jobs, with their parameters."""
+    return [{
+        "kind": name,
+        "admin_only": spec.admin_only,
+        "params": spec.params.model_json_schema()
+    } for name, spec in REPORT_KINDS.items()
+        if current_user.role == "admin" or not spec.admin_only]
+
+
+@router.post("/jobs", status_code=202)
+def create_report_job(
+    req: ReportJobRequest,
+    current_user: Annotated[User, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_db)]
+):
+    """
+    Queues a report. An identical request made while an earlier job is
+    still live (queued, running, or finished and not yet expired) returns
+    that job instead.
+    """
+    job = submit_report_job(db, req.kind, req.params, current_user)
+    return job_status(job)
+
+
+@router.get("/jobs/{job_id}")
+def get_report_job(
+    job_id: str,
+    current_user: Annotated[User, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_db)]
+):
+    """Status and progress (rows written so far) of a report job."""
+    return job_status(_get_job(db, job_id, current_user))
+
+
+@router.get("/jobs/{job_id}/download")
+def download_report_job(
+    job_id: str,
+    current_user: Annotated[User, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_db)]
+):
+    """Serves the finished report file."""
+    job = _get_job(db, job_id, current_user)
+    if job.status != "done":
+        raise HTTPException(
+            status_code=409, detail=f"Report is not ready (status: {job.status})")
+    if not job.artifact_path or not os.path.exists(job.artifact_path):
+        raise HTTPException(status_code=410, detail="Report file has expired")
+
+    return FileResponse(
+        job.artifact_path,
+        media_type=job.media_type,
+        filename=job.filename,
+        headers={"Access-Control-Expose-Headers": "Content-Disposition"}
+    )
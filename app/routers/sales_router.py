@@ -1,132 +1,243 @@
 # app/routers/sales_router.py
-from sqlalchemy.orm import joinedload  # <--- Add this import
-from fastapi import APIRouter, Depends, Query, HTTPException
+from fastapi import APIRouter, Depends, Query, HTTPException, Response
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from datetime import date
-from typing import Annotated
+from sqlalchemy import Date, cast, func, literal, select, tuple_
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from datetime import date, datetime
+from typing import Annotated, Literal, Optional
+from pydantic import BaseModel
 from fastapi.responses import StreamingResponse
-from app.utils.reports import generate_excel_report, generate_pdf_report
+import structlog
+from app.core.config import settings
+from app.utils.reports import (
+    SalesReportRows, generate_excel_report, generate_pdf_report, iter_csv)
+from app.utils.pdf_stream import iter_file
+from app.utils.pdf_pool import render_pdf
+from app.utils.report_jobs import ReportFile, report_kind, track
 
 from app.database.db import get_db
 from app.models.user import User
-from app.models.sales import SalesTransaction, SaleItem
+from app.models.sales import SalesTransaction, SaleItem, SalesDailyRollup, SalesDailyTotal
 # Import Product to get names for charts
 from app.models.stock import Drug, Product
 from app.utils.jwt import get_current_user
+from app.utils.sales_rollup import LINE_PROFIT, rollup_complete_before
+from app.utils.pagination import NEXT_CURSOR_HEADER, encode_cursor, decode_cursor
 
 # Keep the internal router clean; prefixing happens in main.py
 router = APIRouter()
+logger = structlog.get_logger()
 
+# Records embedded in the /my-sales summary; the rest are paged separately
+RECENT_RECORDS = 20
 
-@router.get("/my-sales")
-def get_personal_sales(
-    current_user: Annotated[User, Depends(get_current_user)],
-    db: Annotated[Session, Depends(get_db)],
-    start_date: date = Query(None),
-    end_date: date = Query(None)
-):
-    query = db.query(SalesTransaction).filter(
-        SalesTransaction.user_id == current_user.id)
 
+def _filter_sales(query, user_id=None, start_date=None, end_date=None):
+    # Local business days, served by the (user_id, business_date) index
+    if user_id:
+        query = query.filter(SalesTransaction.user_id == user_id)
     if start_date:
-        query = query.filter(
-            func.date(SalesTransaction.timestamp) >= start_date)
+        query = query.filter(SalesTransaction.business_date >= start_date)
     if end_date:
-        query = query.filter(func.date(SalesTransaction.timestamp) <= end_date)
+        query = query.filter(SalesTransaction.business_date <= end_date)
+    return query
 
-    transactions = query.all()
 
-    # Calculate revenue
-    total_revenue = sum(t.total_amount for t in transactions)
+def _from_rollup(end_date) -> bool:
+    # Past ranges are read from the daily rollups; anything reaching today
+    # still aggregates the raw sales
+    return end_date is not None and end_date < rollup_complete_before()
 
-    # Format chart data so the frontend can actually display the trend
-    # This groups sales by date
-    trend_data = db.query(
-        func.date(SalesTransaction.timestamp).label("date"),
-        func.sum(SalesTransaction.total_amount).label("sales")
-    ).filter(SalesTransaction.user_id == current_user.id)
 
+def _filter_days(stmt, model, user_id=None, start_date=None, end_date=None):
+    if user_id:
+        stmt = stmt.where(model.user_id == user_id)
     if start_date:
-        trend_data = trend_data.filter(
-            func.date(SalesTransaction.timestamp) >= start_date)
+        stmt = stmt.where(model.day >= start_date)
     if end_date:
-        trend_data = trend_data.filter(
-            func.date(SalesTransaction.timestamp) <= end_date)
+        stmt = stmt.where(model.day <= end_date)
+    return stmt
+
+
+def _daily_sales(user_id=None, start_date=None, end_date=None):
+    """CTE of (day, sales, transactions): per rolled-up day or per sale."""
+    if _from_rollup(end_date):
+        stmt = _filter_days(select(
+            SalesDailyTotal.day.label("day"),
+            SalesDailyTotal.revenue.label("sales"),
+            SalesDailyTotal.transaction_count.label("transactions")
+        ), SalesDailyTotal, user_id, start_date, end_date)
+    else:
+        stmt = _filter_sales(select(
+            SalesTransaction.business_date.label("day"),
+            SalesTransaction.total_amount.label("sales"),
+            literal(1).label("transactions")
+        ), user_id, start_date, end_date)
+    return stmt.cte("days")
+
+
+def _sale_lines(user_id=None, start_date=None, end_date=None):
+    """CTE of (product_id, subtotal, profit): per rolled-up day or per item."""
+    if _from_rollup(end_date):
+        return _filter_days(select(
+            SalesDailyRollup.product_id,
+            SalesDailyRollup.revenue.label("subtotal"),
+            SalesDailyRollup.profit
+        ), SalesDailyRollup, user_id, start_date, end_date).cte("lines")
+
+    tx = _filter_sales(select(SalesTransaction.id),
+                       user_id, start_date, end_date).cte("tx")
+    return select(
+        Drug.product_id,
+        SaleItem.subtotal,
+        LINE_PROFIT.label("profit")
+    ).join(tx, SaleItem.transaction_id == tx.c.id)\
+     .join(Drug, SaleItem.drug_id == Drug.id).cte("lines")
+
+
+def _records_page(query, limit: int, cursor: Optional[str] = None):
+    """One page of transactions, newest first, keyset on (timestamp, id)."""
+    if cursor:
+        last_ts, last_id = decode_cursor(cursor, datetime, int)
+        query = query.filter(tuple_(SalesTransaction.timestamp, SalesTransaction.id)
+                             < tuple_(last_ts, last_id))
+    rows = query.order_by(SalesTransaction.timestamp.desc(),
+                          SalesTransaction.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].timestamp, rows[-1].id)
+    return [dict(r._mapping) for r in rows], next_cursor
+
+
+def _record_columns(db: Session):
+    return db.query(
+        SalesTransaction.id,
+        SalesTransaction.receipt_number,
+        SalesTransaction.patient_name,
+        SalesTransaction.total_amount,
+        SalesTransaction.timestamp,
+        SalesTransaction.user_id
+    )
 
-    chart_results = trend_data.group_by(
-        func.date(SalesTransaction.timestamp)).all()
+
+@router.get("/my-sales")
+def get_personal_sales(
+    current_user: Annotated[User, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+    start_date: date = Query(None),
+    end_date: date = Query(None),
+    interval: Literal["day", "week", "month"] = "day"
+):
+    """
+    The cashier's own totals and sales trend, aggregated in SQL, plus the
+    most recent records (past ranges read the daily rollups). The full
+    record list is paged through /my-sales/records.
+    """
+    days = _daily_sales(current_user.id, start_date, end_date)
+
+    # 1. Totals
+    totals = db.query(
+        func.coalesce(func.sum(days.c.transactions), 0).label("count"),
+        func.coalesce(func.sum(days.c.sales), 0).label("revenue")
+    ).one()
+
+    # 2. Trend, bucketed by the requested interval
+    bucket = cast(func.date_trunc(interval, days.c.day), Date)
+    chart_results = db.query(
+        bucket.label("date"),
+        func.sum(days.c.sales).label("sales")
+    ).group_by(bucket).order_by(bucket).all()
+
+    # 3. Latest records only
+    records, _ = _records_page(
+        _filter_sales(_record_columns(db), current_user.id, start_date, end_date),
+        RECENT_RECORDS)
 
     return {
-        "revenue": total_revenue,  # Changed from total_revenue to revenue
-        "transaction_count": len(transactions),  # Changed from count
+        "revenue": float(totals.revenue),
+        "transaction_count": totals.count,
         "chart_data": [{"date": str(r.date), "sales": float(r.sales)} for r in chart_results],
-        "records": transactions
+        "records": records
     }
 
 
+@router.get("/my-sales/records")
+def get_personal_sales_records(
+    response: Response,
+    current_user: Annotated[User, Depends(get_current_user)],
+    db: Annotated[Session, Depends(get_db)],
+    start_date: date = Query(None),
+    end_date: date = Query(None),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None
+):
+    """
+    The cashier's transactions, newest first. The cursor for the next page
+    is returned in the X-Next-Cursor header.
+    """
+    query = _filter_sales(_record_columns(db), current_user.id, start_date, end_date)
+    records, next_cursor = _records_page(query, limit, cursor)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return records
+
+
 @router.get("/admin/overview")
 def get_admin_overview(
     current_user: Annotated[User, Depends(get_current_user)],
     db: Annotated[Session, Depends(get_db)],
     user_id: int = Query(None),
     start_date: date = Query(None),
-    end_date: date = Query(None)
+    end_date: date = Query(None),
+    interval: Literal["day", "week", "month"] = "day"
 ):
+    """
+    Totals, revenue trend and the five most profitable products, computed
+    from the filters in a single statement (one round trip). Past ranges
+    read the daily rollups.
+    """
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
 
-    tx_query = db.query(SalesTransaction)
-    if user_id:
-        tx_query = tx_query.filter(SalesTransaction.user_id == user_id)
-    if start_date:
-        tx_query = tx_query.filter(
-            func.date(SalesTransaction.timestamp) >= start_date)
-    if end_date:
-        tx_query = tx_query.filter(
-            func.date(SalesTransaction.timestamp) <= end_date)
-
-    transactions = tx_query.all()
-    tx_ids = [t.id for t in transactions]
-
-    if not tx_ids:
-        return {"revenue": 0, "profit": 0, "transaction_count": 0, "chart_data": [], "pie_data": []}
-
-    # 1. Financial Totals
-    profit_stats = db.query(
-        func.sum(SaleItem.subtotal).label("revenue"),
-        func.sum((SaleItem.unit_price - Drug.buying_price)
-                 * SaleItem.quantity).label("profit")
-    ).join(Drug, SaleItem.drug_id == Drug.id)\
-     .filter(SaleItem.transaction_id.in_(tx_ids)).first()
-
-    # 2. Line Chart: Revenue Trend
-    trend_data = db.query(
-        func.date(SalesTransaction.timestamp).label("date"),
-        func.sum(SalesTransaction.total_amount).label("sales")
-    ).filter(SalesTransaction.id.in_(tx_ids))\
-     .group_by(func.date(SalesTransaction.timestamp))\
-     .order_by(func.date(SalesTransaction.timestamp)).all()
-
-    # 3. Pie Chart: Profit by Product (Top 5)
-    # This helps see which brands are actually making money
-    pie_data = db.query(
-        Product.brand_name.label("name"),
-        func.sum((SaleItem.unit_price - Drug.buying_price)
-                 * SaleItem.quantity).label("value")
-    ).join(Drug, SaleItem.drug_id == Drug.id)\
-     .join(Product, Drug.product_id == Product.id)\
-     .filter(SaleItem.transaction_id.in_(tx_ids))\
-     .group_by(Product.brand_name)\
-     .order_by(func.sum((SaleItem.unit_price - Drug.buying_price) * SaleItem.quantity).desc())\
-     .limit(5).all()
+    # 1. The matching days (or sales) and line items, as CTEs
+    days = _daily_sales(user_id, start_date, end_date)
+    lines = _sale_lines(user_id, start_date, end_date)
+
+    # 2. Line chart: revenue per bucket
+    bucket = cast(func.date_trunc(interval, days.c.day), Date)
+    trend = select(bucket.label("date"), func.sum(days.c.sales).label("sales"))\
+        .group_by(bucket).subquery("trend")
+
+    # 3. Pie chart: profit by product (top 5)
+    pie = select(Product.brand_name.label("name"), func.sum(lines.c.profit).label("value"))\
+        .join(Product, lines.c.product_id == Product.id)\
+        .group_by(Product.brand_name)\
+        .order_by(func.sum(lines.c.profit).desc())\
+        .limit(5).subquery("pie")
+
+    # 4. Everything as one row; the series come back as JSON arrays
+    row = db.execute(select(
+        select(func.coalesce(func.sum(days.c.transactions), 0))
+        .scalar_subquery().label("transaction_count"),
+        select(func.coalesce(func.sum(lines.c.subtotal), 0))
+        .scalar_subquery().label("revenue"),
+        select(func.coalesce(func.sum(lines.c.profit), 0))
+        .scalar_subquery().label("profit"),
+        select(func.json_agg(aggregate_order_by(
+            func.json_build_object("date", trend.c.date, "sales", trend.c.sales),
+            trend.c.date))).scalar_subquery().label("chart_data"),
+        select(func.json_agg(aggregate_order_by(
+            func.json_build_object("name", pie.c.name, "value", pie.c.value),
+            pie.c.value.desc()))).scalar_subquery().label("pie_data"),
+    )).one()
 
     return {
-        "revenue": profit_stats.revenue or 0,
-        "profit": profit_stats.profit or 0,
-        "transaction_count": len(transactions),
-        "chart_data": [{"date": str(d.date), "sales": d.sales} for d in trend_data],
-        "pie_data": [{"name": p.name, "value": p.value} for p in pie_data]
+        "revenue": row.revenue,
+        "profit": row.profit,
+        "transaction_count": row.transaction_count,
+        "chart_data": row.chart_data or [],
+        "pie_data": row.pie_data or []
     }
 
 '''
@@ -212,101 +323,89 @@ def export_sales_report(
 '''
 
 
+class SalesExportParams(BaseModel):
+    format: Literal["pdf", "excel", "csv"]
+    user_id: Optional[int] = None
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+
+
+@report_kind("sales-export", SalesExportParams, admin_only=True)
+def build_sales_export(db: Session, params: SalesExportParams, user=None,
+                       progress=None) -> ReportFile:
+    """
+    Sales with their profit, newest first, as PDF, XLSX or CSV. Rows are
+    read through a server-side cursor; the CSV pieces are produced as the
+    rows are read.
+    """
+    # 1. One row per sale, its profit summed from the captured line costs
+    profits = select(
+        SaleItem.transaction_id,
+        func.sum(LINE_PROFIT).label("profit")
+    ).group_by(SaleItem.transaction_id).subquery()
+    query = db.query(
+        SalesTransaction.timestamp,
+        SalesTransaction.receipt_number,
+        SalesTransaction.patient_name,
+        User.username,
+        SalesTransaction.total_amount,
+        func.coalesce(profits.c.profit, 0).label("profit")
+    ).outerjoin(User, SalesTransaction.user_id == User.id)\
+     .outerjoin(profits, profits.c.transaction_id == SalesTransaction.id)
+    query = _filter_sales(query, params.user_id, params.start_date, params.end_date)\
+        .order_by(SalesTransaction.timestamp.desc(), SalesTransaction.id.desc())\
+        .yield_per(settings.REPORT_CHUNK_ROWS)
+
+    rows = track(query, progress)
+    stamp = date.today()
+
+    # 2. CSV is written lazily and XLSX finished into a spooled file; the
+    #    PDF is laid out in the renderer pool from plain row tuples
+    if params.format == "csv":
+        return ReportFile(iter_csv(SalesReportRows(rows)), f"Report_{stamp}.csv",
+                          "text/csv; charset=utf-8")
+    if params.format == "excel":
+        return ReportFile(
+            iter_file(generate_excel_report(SalesReportRows(rows))), f"Report_{stamp}.xlsx",
+            "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+    pdf = render_pdf(generate_pdf_report, "Pharmacy Sales & Profit Report",
+                     rows=(tuple(r) for r in rows))
+    return ReportFile([pdf], f"Report_{stamp}.pdf", "application/pdf")
+
+
 @router.get("/export-report")
 def export_sales_report(
-    format: str,
+    format: Literal["pdf", "excel", "csv"],
     db: Annotated[Session, Depends(get_db)],
     current_user: Annotated[User, Depends(get_current_user)],
     user_id: int = Query(None),
     start_date: date = Query(None),
     end_date: date = Query(None)
 ):
+    """
+    Sales export, built inside the request (CSV reaches the client as it is
+    written; the session stays open until the response has been sent).
+    Large ranges can run as a "sales-export" job under /api/reports.
+    """
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
 
+    params = SalesExportParams(
+        format=format, user_id=user_id, start_date=start_date, end_date=end_date)
     try:
-        # Deep eager loading to prevent "DetachedInstanceError" (500 error)
-        query = db.query(SalesTransaction).options(
-            joinedload(SalesTransaction.user),
-            joinedload(SalesTransaction.items)
-            .joinedload(SaleItem.drug)
-            .joinedload(Drug.product)
-        )
-
-        if user_id:
-            query = query.filter(SalesTransaction.user_id == user_id)
-        if start_date:
-            query = query.filter(
-                func.date(SalesTransaction.timestamp) >= start_date)
-        if end_date:
-            query = query.filter(
-                func.date(SalesTransaction.timestamp) <= end_date)
-
-        transactions = query.order_by(SalesTransaction.timestamp.desc()).all()
-
-        report_data = []
-        g_revenue = 0.0
-        g_profit = 0.0
-
-        for tx in transactions:
-            tx_rev = float(tx.total_amount or 0)
-            tx_prof = 0.0
-
-            for item in tx.items:
-                # Profit = (Selling Price - Buying Price) * Quantity
-                # We use getattr to safely handle deleted products or missing batches
-                buy_price = 0.0
-                if item.drug:
-                    buy_price = float(item.drug.buying_price or 0)
-
-                tx_prof += (float(item.unit_price) - buy_price) * item.quantity
-
-            g_revenue += tx_rev
-            g_profit += tx_prof
-
-            report_data.append({
-                "Date": tx.timestamp.strftime("%Y-%m-%d %H:%M"),
-                "Receipt #": tx.receipt_number,
-                "Patient": tx.patient_name or "Walk-in",
-                "Staff": tx.user.username if tx.user else "System",
-                "Revenue": round(tx_rev, 2),
-                "Profit": round(tx_prof, 2)
-            })
-
-        # Add Summary Totals Row
-        if report_data:
-            report_data.append({
-                "Date": "TOTALS",
-                "Receipt #": f"{len(transactions)} Sales",
-                "Patient": "-",
-                "Staff": "-",
-                "Revenue": round(g_revenue, 2),
-                "Profit": round(g_profit, 2)
-            })
-        else:
-            report_data = [{"Message": "No data found"}]
-
-        # Response handling
-        if format == "excel":
-            file_out = generate_excel_report(report_data)
-            m_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            ext = "xlsx"
-        else:
-            file_out = generate_pdf_report(
-                report_data, title="Pharmacy Sales & Profit Report")
-            m_type = "application/pdf"
-            ext = "pdf"
-
-        return StreamingResponse(
-            file_out,
-            media_type=m_type,
-            headers={
-                "Content-Disposition": f"attachment; filename=Report_{date.today()}.{ext}"}
-        )
-
+        report = build_sales_export(db, params)
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"EXPORT CRASH: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.error("sales_export_failed", format=format, error=str(e))
         raise HTTPException(
-            status_code=500, detail="Check server logs for relationship errors.")
+            status_code=500, detail="Internal server error during report generation.")
+
+    return StreamingResponse(
+        report.chunks,
+        media_type=report.media_type,
+        headers={
+            "Content-Disposition": f"attachment; filename={report.filename}",
+            "Access-Control-Expose-Headers": "Content-Disposition"
+        }
+    )
@@ -1,25 +1,44 @@
 # app/routers/stock_router.py
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, Response, UploadFile
 from fastapi.responses import StreamingResponse
+from sqlalchemy import and_, case, func, insert, literal_column, or_, tuple_, update
 from sqlalchemy.orm import Session
 from datetime import date, datetime
-from typing import List, Optional
-from pydantic import BaseModel
+from typing import List, Literal, Optional
+from pydantic import BaseModel, Field, model_validator
 
 # import Models to avoid circular imports
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import contains_eager
 import uuid
 import io
 import structlog
 
 from app.database.db import get_db
-from app.models.stock import Drug, GenericDrug, Supplier, Product
+from app.models.stock import Drug, GenericDrug, Supplier, Product, ProductStockSummary
 from app.models.stock_movement import StockMovement
+from app.models.dda import DDARegister
 from app.models.user import User
 from app.models.sales import SalesTransaction, SaleItem, PrescriptionDetail
 from app.dependencies.auth import get_current_user
-from app.utils.receipt_pdf import generate_receipt_pdf
+from app.utils.receipts import receipt_data, render_receipt, schedule_receipt_pdf
 from app.utils.dda_pdf import generate_dda_pdf
+from app.utils.prescription_pdf import generate_prescription_book_pdf
+from app.utils.pdf_pool import render_pdf
+from app.utils.report_jobs import ReportFile, report_kind, track
+from app.core.config import settings
+from app.utils.allocation import allocate_fefo, InsufficientStockError
+from app.utils.stock_locks import lock_rows
+from app.utils.stock_import import StockImporter, iter_rows
+from app.utils.stock_summary import refresh_product_summaries
+from app.utils.sales_rollup import add_sale_to_rollup
+from app.utils.dda_register import (
+    period_opening_balances, record_dda_movements, refresh_dda_checkpoints, register_query
+)
+from app.utils.product_search import normalise, product_index
+from app.utils.catalog_cache import bump_catalog_version, catalog_response
+from app.utils.clinical_search import clinical_search_query
+from app.utils.catalog_names import catalog_rename, commit_catalog_rename, upsert_by_name
+from app.utils.pagination import NEXT_CURSOR_HEADER, encode_cursor, decode_cursor
 
 router = APIRouter(tags=["Stock"])
 logger = structlog.get_logger()
@@ -88,9 +107,41 @@ class DrugSchema(DrugCreateSchema):
         from_attributes = True
 
 
+class ProductStockSummarySchema(BaseModel):
+    product_id: int
+    brand_name: str
+    is_controlled: bool = False
+    reorder_level: int = 0
+    total_quantity: int
+    batch_count: int
+    nearest_expiry: Optional[date] = None
+    avg_cost: float
+    below_reorder: bool
+
+    class Config:
+        from_attributes = True
+
+
+class ProductSearchResult(BaseModel):
+    id: int
+    brand_name: str
+    generic_name: Optional[str] = None
+    is_controlled: bool = False
+    in_stock: int = 0
+    nearest_expiry: Optional[date] = None
+
+
 class CartItem(BaseModel):
-    batch_id: int
-    quantity: int
+    # Either a specific batch, or a product to be allocated FEFO across batches
+    batch_id: Optional[int] = None
+    product_id: Optional[int] = None
+    quantity: int = Field(..., gt=0)
+
+    @model_validator(mode="after")
+    def check_target(self):
+        if (self.batch_id is None) == (self.product_id is None):
+            raise ValueError("Provide exactly one of batch_id or product_id")
+        return self
 
 
 class BulkSaleRequest(BaseModel):
@@ -101,7 +152,8 @@ class BulkSaleRequest(BaseModel):
     prescriber_name: Optional[str] = None
     medical_institution: Optional[str] = None
     dosage_instructions: Optional[str] = None
-    items: List[CartItem]
+    # An empty cart would leave the stock lock query unfiltered
+    items: List[CartItem] = Field(..., min_length=1)
 
 
 class DDALedgerEntry(BaseModel):
@@ -121,40 +173,82 @@ class DDALedgerEntry(BaseModel):
 
 
 @router.get("/generics", response_model=List[GenericDrugSchema])
-def get_generics(db: Session = Depends(get_db)):
-    return db.query(GenericDrug).order_by(GenericDrug.name.asc()).all()
+def get_generics(request: Request, db: Session = Depends(get_db)):
+    return catalog_response(
+        request, db, "generics", GenericDrugSchema,
+        lambda: db.query(GenericDrug).order_by(GenericDrug.name.asc()).all())
 
 
 @router.post("/generics", response_model=GenericDrugSchema)
 def add_generic(data: GenericDrugCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    existing = db.query(GenericDrug).filter(
-        GenericDrug.name.ilike(data.name)).first()
-    if existing:
-        return existing
-    db_generic = GenericDrug(name=data.name)
-    db.add(db_generic)
+    # An existing generic with the same normalised name is returned unchanged
+    db_generic = upsert_by_name(
+        db, GenericDrug, GenericDrug.name, {"name": data.name.strip()}, {})
+    bump_catalog_version(db, "generics")
     db.commit()
-    db.refresh(db_generic)
     return db_generic
 
 
 @router.get("/products", response_model=List[ProductSchema])
-def get_products(db: Session = Depends(get_db)):
-    return db.query(Product).order_by(Product.brand_name.asc()).all()
+def get_products(request: Request, db: Session = Depends(get_db)):
+    return catalog_response(
+        request, db, "products", ProductSchema,
+        lambda: db.query(Product).order_by(Product.brand_name.asc()).all())
+
+
+@router.get("/products/search", response_model=List[ProductSearchResult])
+def search_products(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=50),
+    db: Session = Depends(get_db)
+):
+    """
+    Type-ahead product lookup by brand or generic name with stock on hand.
+    Word-prefix matches come from the in-process index; short result lists
+    are topped up with fuzzy (trigram) matches from the database.
+    """
+    product_index.ensure_fresh(db)
+    ids = product_index.search(q, limit)
+
+    term = normalise(q)
+    if len(ids) < limit and len(term) >= 3:
+        generic_name = func.lower(GenericDrug.name)
+        brand_name = func.lower(Product.brand_name)
+        score = func.greatest(func.similarity(brand_name, term),
+                              func.coalesce(func.similarity(generic_name, term), 0))
+        fuzzy = db.query(Product.id)\
+            .outerjoin(GenericDrug, Product.generic_id == GenericDrug.id)\
+            .filter(or_(brand_name.op("%")(term), generic_name.op("%")(term)))
+        if ids:
+            fuzzy = fuzzy.filter(Product.id.notin_(ids))
+        ids += [r.id for r in fuzzy.order_by(score.desc()).limit(limit - len(ids))]
+
+    if not ids:
+        return []
+
+    rows = db.query(
+        Product.id, Product.brand_name, GenericDrug.name.label("generic_name"),
+        Product.is_controlled,
+        func.coalesce(ProductStockSummary.total_quantity, 0).label("in_stock"),
+        ProductStockSummary.nearest_expiry
+    ).outerjoin(GenericDrug, Product.generic_id == GenericDrug.id)\
+     .outerjoin(ProductStockSummary, ProductStockSummary.product_id == Product.id)\
+     .filter(Product.id.in_(ids)).all()
+
+    by_id = {r.id: r for r in rows}
+    return [by_id[i] for i in ids if i in by_id]
 
 
 @router.post("/products", response_model=ProductSchema)
 def add_product(prod: ProductCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    existing = db.query(Product).filter(
-        Product.brand_name.ilike(prod.brand_name)).first()
-    if existing:
-        existing.reorder_level = prod.reorder_level
-        db.commit()
-        return existing
-    db_prod = Product(**prod.model_dump())
-    db.add(db_prod)
+    # An existing product with the same normalised name only takes the new reorder level
+    values = {**prod.model_dump(), "brand_name": prod.brand_name.strip()}
+    db_prod = upsert_by_name(
+        db, Product, Product.brand_name, values,
+        {"reorder_level": prod.reorder_level})
+    refresh_product_summaries(db, [db_prod.id])
+    bump_catalog_version(db, "products")
     db.commit()
-    db.refresh(db_prod)
     return db_prod
 
 
@@ -177,8 +271,12 @@ def add_stock_batch(item: DrugCreateSchema, current_user: User = Depends(get_cur
     try:
         db.commit()
         db.refresh(db_batch)
-        db.add(StockMovement(drug_id=db_batch.id, movement_type="RECEIVE", quantity_changed=item.quantity,
-               reason=f"Batch {item.batch_number} received", user_id=current_user.id))
+        movement = StockMovement(drug_id=db_batch.id, movement_type="RECEIVE", quantity_changed=item.quantity,
+                                 reason=f"Batch {item.batch_number} received", user_id=current_user.id)
+        db.add(movement)
+        db.flush()
+        record_dda_movements(db, [product.id], StockMovement.id == movement.id)
+        refresh_product_summaries(db, [product.id])
         db.commit()
         db_batch.brand_name = product.brand_name
         return db_batch
@@ -188,13 +286,146 @@ def add_stock_batch(item: DrugCreateSchema, current_user: User = Depends(get_cur
             status_code=500, detail="Database error while saving batch")
 
 
+@router.post("/import")
+def import_stock_batches(
+    file: UploadFile = File(...),
+    dry_run: bool = False,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Bulk goods-received intake from a CSV or XLSX invoice.
+    Columns: product (or product_id), supplier (or supplier_id), batch_number,
+    expiry_date, quantity, buying_price, unit_price[, expiry_alert_days].
+    Valid rows are applied in one transaction; invalid rows are reported by
+    row number. With dry_run the file is only validated.
+    """
+    log = logger.bind(user=current_user.username, filename=file.filename)
+    if not file.filename.lower().endswith((".csv", ".xlsx", ".xlsm")):
+        raise HTTPException(
+            status_code=400, detail="Upload a .csv or .xlsx file")
+
+    importer = StockImporter(db, current_user.id)
+    try:
+        importer.run(iter_rows(file.filename, file.file))
+        product_ids = {product_id for _, product_id, _ in importer.received}
+        record_dda_movements(
+            db, product_ids, StockMovement.id.in_(importer.movement_ids))
+        refresh_product_summaries(db, product_ids)
+        if dry_run:
+            db.rollback()
+        else:
+            db.commit()
+    except HTTPException:
+        # Lock timeout (409): the till can retry the upload
+        db.rollback()
+        raise
+    except Exception as e:
+        db.rollback()
+        log.error("stock_import_failed", error=str(e))
+        raise HTTPException(
+            status_code=500, detail="Database error while importing stock")
+
+    summary = importer.summary()
+    log.info("stock_import_done", dry_run=dry_run,
+             **{k: v for k, v in summary.items() if k != "errors"})
+    return {"dry_run": dry_run, **summary}
+
+
+INVENTORY_SORT_COLUMNS = {
+    "id": Drug.id,
+    "expiry_date": Drug.expiry_date,
+    "quantity": Drug.quantity,
+    "brand_name": Product.brand_name,
+}
+
+
 @router.get("/", response_model=List[DrugSchema])
-def view_inventory(db: Session = Depends(get_db)):
-    batches = db.query(Drug).all()
-    for b in batches:
-        b.brand_name = b.product.brand_name
-        b.is_controlled = b.product.is_controlled
-    return batches
+def view_inventory(
+    response: Response,
+    product_id: Optional[int] = None,
+    supplier_id: Optional[int] = None,
+    in_stock: bool = False,
+    expires_before: Optional[date] = None,
+    expires_after: Optional[date] = None,
+    sort: Literal["id", "expiry_date", "quantity", "brand_name"] = "id",
+    order: Literal["asc", "desc"] = "asc",
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Lists stock batches with their product fields in a single query.
+    Pass `limit` to page through the results; the cursor for the next page
+    is returned in the X-Next-Cursor header (absent on the last page).
+    """
+    sort_col = INVENTORY_SORT_COLUMNS[sort]
+
+    # Only the columns DrugSchema needs, Product joined in the same query
+    query = db.query(
+        Drug.id, Drug.product_id, Drug.supplier_id, Drug.batch_number,
+        Drug.expiry_date, Drug.quantity, Drug.buying_price, Drug.unit_price,
+        Drug.expiry_alert_days, Product.brand_name, Product.is_controlled,
+        Product.reorder_level
+    ).join(Product, Drug.product_id == Product.id)
+
+    if product_id:
+        query = query.filter(Drug.product_id == product_id)
+    if supplier_id:
+        query = query.filter(Drug.supplier_id == supplier_id)
+    if in_stock:
+        query = query.filter(Drug.quantity > 0)
+    if expires_before:
+        query = query.filter(Drug.expiry_date <= expires_before)
+    if expires_after:
+        query = query.filter(Drug.expiry_date >= expires_after)
+
+    # Keyset: continue strictly after the (sort value, id) of the last row
+    if cursor:
+        last_value, last_id = decode_cursor(cursor, sort_col.type.python_type, int)
+        key = tuple_(sort_col, Drug.id)
+        query = query.filter(key > tuple_(last_value, last_id) if order == "asc"
+                             else key < tuple_(last_value, last_id))
+
+    if order == "asc":
+        query = query.order_by(sort_col.asc(), Drug.id.asc())
+    else:
+        query = query.order_by(sort_col.desc(), Drug.id.desc())
+
+    if limit is None:
+        return query.all()
+
+    # Fetch one extra row to know whether another page exists
+    rows = query.limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(
+            getattr(last, sort), last.id)
+    return rows
+
+
+@router.get("/summary", response_model=List[ProductStockSummarySchema])
+def view_stock_summary(
+    below_reorder: Optional[bool] = None,
+    expires_before: Optional[date] = None,
+    db: Session = Depends(get_db)
+):
+    """Per-product stock totals read from the maintained summary table"""
+    query = db.query(
+        ProductStockSummary.product_id, Product.brand_name,
+        Product.is_controlled, Product.reorder_level,
+        ProductStockSummary.total_quantity, ProductStockSummary.batch_count,
+        ProductStockSummary.nearest_expiry, ProductStockSummary.avg_cost,
+        ProductStockSummary.below_reorder
+    ).join(Product, Product.id == ProductStockSummary.product_id)
+
+    if below_reorder is not None:
+        query = query.filter(ProductStockSummary.below_reorder == below_reorder)
+    if expires_before:
+        query = query.filter(ProductStockSummary.nearest_expiry <= expires_before)
+
+    return query.order_by(Product.brand_name.asc()).all()
 
 
 @router.post("/bulk-sell")
@@ -205,22 +436,85 @@ def bulk_sell_stock(req: BulkSaleRequest, db: Session = Depends(get_db), current
     validated_entries = []
 
     try:
+        today = date.today()
+        batch_ids = {i.batch_id for i in req.items if i.batch_id is not None}
+        product_ids = {i.product_id for i in req.items if i.product_id is not None}
+
+        def is_sellable(b):
+            return (b.product_id in product_ids and b.quantity > 0
+                    and b.expiry_date >= today
+                    and not b.batch_number.upper().startswith("PLACEHOLDER-"))
+
+        # 1. Lock every batch the cart can touch (with its product) in one
+        #    query, ordered by id so that tills selling overlapping batches
+        #    queue instead of deadlocking. Quantities read below cannot
+        #    change until commit.
+        lock_filters = []
+        if batch_ids:
+            lock_filters.append(Drug.id.in_(batch_ids))
+        if product_ids:
+            lock_filters.append(and_(
+                Drug.product_id.in_(product_ids),
+                Drug.quantity > 0,
+                Drug.expiry_date >= today,
+                ~Drug.batch_number.ilike("PLACEHOLDER-%")
+            ))
+        locked = lock_rows(
+            db,
+            db.query(Drug)
+            .join(Drug.product)
+            .options(contains_eager(Drug.product))
+            .filter(or_(*lock_filters))
+            .order_by(Drug.id),
+            "bulk_sell",
+            of=Drug)
+        batches_by_id = {b.id: b for b in locked}
+
+        # Units still free per batch in this cart, shared by every line
+        available = {b.id: b.quantity for b in locked}
+        sale_lines = []
+
+        # 2. Lines that name a specific batch
         for item in req.items:
-            batch = db.query(Drug).get(item.batch_id)
-            if not batch or batch.quantity < item.quantity:
+            if item.batch_id is None:
+                continue
+            batch = batches_by_id.get(item.batch_id)
+            if not batch or available[batch.id] < item.quantity:
                 raise HTTPException(
                     status_code=400, detail="Stock error or insufficient quantity")
+            available[batch.id] -= item.quantity
+            sale_lines.append((batch, item.quantity))
 
-            line_total = float(batch.unit_price * item.quantity)
+        # 3. Lines that name a product: split each quantity across that
+        #    product's batches in memory, earliest expiry first
+        batches_by_product = {}
+        for b in sorted(filter(is_sellable, locked),
+                        key=lambda b: (b.expiry_date, b.id)):
+            batches_by_product.setdefault(b.product_id, []).append(b)
+
+        for item in req.items:
+            if item.product_id is None:
+                continue
+            try:
+                sale_lines.extend(allocate_fefo(
+                    item.product_id,
+                    batches_by_product.get(item.product_id, []),
+                    item.quantity,
+                    available))
+            except InsufficientStockError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+
+        for batch, qty in sale_lines:
+            line_total = float(batch.unit_price * qty)
             total_amount += line_total
             items_for_pdf.append({
                 "name": str(batch.product.brand_name),
-                "qty": int(item.quantity),
+                "qty": int(qty),
                 "price": float(batch.unit_price),
                 "subtotal": float(line_total)
             })
             validated_entries.append(
-                {"batch": batch, "qty": item.quantity, "sub": line_total})
+                {"batch": batch, "qty": qty, "sub": line_total})
 
         receipt_no = f"RCPT-{uuid.uuid4().hex[:6].upper()}"
 
@@ -233,6 +527,7 @@ def bulk_sell_stock(req: BulkSaleRequest, db: Session = Depends(get_db), current
         )
         db.add(new_trans)
         db.flush()
+        transaction_id, sold_at = new_trans.id, new_trans.timestamp
 
         # 2. Add Prescription Details if clinical info provided
         if req.prescriber_name or req.patient_age:
@@ -246,160 +541,357 @@ def bulk_sell_stock(req: BulkSaleRequest, db: Session = Depends(get_db), current
             )
             db.add(p_detail)
 
-        # 3. Process items and movements
+        # 3. Items, movements and stock decrements as one statement each,
+        #    however long the cart is
+        sold_per_batch = {}
         for entry in validated_entries:
-            b = entry["batch"]
-            db.add(SaleItem(
-                transaction_id=new_trans.id,
-                drug_id=b.id,
-                quantity=entry["qty"],
-                unit_price=b.unit_price,
-                subtotal=entry["sub"]
-            ))
-            b.quantity -= entry["qty"]
-            db.add(StockMovement(
-                drug_id=b.id,
-                movement_type="DISPENSE",
-                quantity_changed=-entry["qty"],
-                reason=f"Sale {receipt_no}",
-                user_id=current_user.id
-            ))
+            batch_id = entry["batch"].id
+            sold_per_batch[batch_id] = sold_per_batch.get(batch_id, 0) + entry["qty"]
+
+        db.execute(insert(SaleItem), [{
+            "transaction_id": transaction_id,
+            "drug_id": entry["batch"].id,
+            "quantity": entry["qty"],
+            "unit_price": entry["batch"].unit_price,
+            "unit_cost": entry["batch"].buying_price,
+            "subtotal": entry["sub"]
+        } for entry in validated_entries])
+
+        db.execute(insert(StockMovement), [{
+            "drug_id": entry["batch"].id,
+            "movement_type": "DISPENSE",
+            "quantity_changed": -entry["qty"],
+            "reason": f"Sale {receipt_no}",
+            "user_id": current_user.id,
+            "transaction_id": transaction_id
+        } for entry in validated_entries])
+
+        # Decrement in SQL, guarded so a batch can never go negative
+        sold_qty = case(sold_per_batch, value=Drug.id)
+        result = db.execute(
+            update(Drug)
+            .where(Drug.id.in_(sold_per_batch), Drug.quantity >= sold_qty)
+            .values(quantity=Drug.quantity - sold_qty)
+            .execution_options(synchronize_session=False))
+        if result.rowcount != len(sold_per_batch):
+            raise HTTPException(
+                status_code=409, detail="Stock changed during sale, please retry")
+
+        sold_products = {entry["batch"].product_id for entry in validated_entries}
+        record_dda_movements(
+            db, sold_products, StockMovement.transaction_id == transaction_id)
+        refresh_product_summaries(db, sold_products)
+        add_sale_to_rollup(db, transaction_id)
 
         db.commit()
 
-        pdf_data = {
+        receipt = {
             "receipt_number": receipt_no,
             "client_name": req.client_name,
             "total_amount": total_amount,
             "items": items_for_pdf,
-            "date": datetime.now().strftime("%Y-%m-%d %H:%M"),
+            "date": sold_at.strftime("%Y-%m-%d %H:%M"),
             "served_by": current_user.username
         }
-        pdf_buffer = generate_receipt_pdf(pdf_data)
-
-        return StreamingResponse(
-            pdf_buffer,
-            media_type="application/pdf",
-            headers={
-                "Content-Disposition": f"attachment; filename=receipt_{receipt_no}.pdf",
-                "Access-Control-Expose-Headers": "Content-Disposition"
-            }
-        )
+        # The PDF is rendered in the background; the till fetches it from
+        # receipt_url (served from the receipt cache) when it prints
+        schedule_receipt_pdf(receipt)
+
+        return {
+            **receipt,
+            "transaction_id": transaction_id,
+            "receipt_url": f"/api/stock/receipts/{receipt_no}"
+        }
 
+    except HTTPException:
+        db.rollback()
+        raise
     except Exception as e:
         db.rollback()
         log.error("sale_failed", error=str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.get("/dda-ledger", response_model=List[DDALedgerEntry])
-def get_dda_ledger(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    try:
-        # 1. Eager load to prevent LazyLoad errors
-        movements = (
-            db.query(StockMovement)
-            .join(Drug)
-            .join(Product)
-            .options(
-                joinedload(StockMovement.drug).joinedload(Drug.product),
-                joinedload(StockMovement.drug).joinedload(Drug.supplier_rel),
-                joinedload(StockMovement.user)
-            )
-            .filter(Product.is_controlled == True)
-            .order_by(StockMovement.timestamp.desc())
-            .all()
-        )
+@router.get("/receipts/{receipt_number}")
+def get_receipt(
+    receipt_number: str,
+    format: Literal["pdf", "escpos", "text"] = "pdf",
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Serves a sale receipt as a (cached) PDF, ESC/POS bytes or plain text"""
+    tx = db.query(SalesTransaction).filter(
+        SalesTransaction.receipt_number == receipt_number).first()
+    if not tx:
+        raise HTTPException(status_code=404, detail="Receipt not found")
+
+    content, media_type, ext = render_receipt(
+        receipt_number, format, lambda: receipt_data(db, tx))
+
+    return Response(
+        content=content,
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f"attachment; filename=receipt_{receipt_number}.{ext}",
+            "Access-Control-Expose-Headers": "Content-Disposition"
+        }
+    )
 
-        ledger = []
-        for m in movements:
-            # Safety Check A: Ensure drug and product exist
-            if not m.drug or not m.drug.product:
-                logger.warning("skipping_orphaned_movement", movement_id=m.id)
-                continue
 
-            brand = m.drug.product.brand_name
-            batch = m.drug.batch_number
-
-            # Default values for safety
-            entity, ref, age, prescriber = "Unknown", m.reason or "N/A", None, None
-            user_name = m.user.username if m.user else "System"
-
-            if m.movement_type == "RECEIVE":
-                entity = m.drug.supplier_rel.name if m.drug.supplier_rel else "Direct Entry"
-                ref = batch
-            elif m.movement_type == "DISPENSE" and "Sale " in (m.reason or ""):
-                r_no = m.reason.replace("Sale ", "").strip()
-
-                # Safety Check B: Use direct query for Sale and Prescription
-                sale = db.query(SalesTransaction).filter(
-                    SalesTransaction.receipt_number == r_no).first()
-                if sale:
-                    entity = sale.patient_name or "Walk-in Client"
-                    ref = sale.receipt_number
-
-                    # Manual join for prescription details to avoid recursion
-                    p_info = db.query(PrescriptionDetail).filter(
-                        PrescriptionDetail.transaction_id == sale.id).first()
-                    if p_info:
-                        age = p_info.patient_age
-                        prescriber = p_info.prescriber_name
-
-            ledger.append({
-                "timestamp": m.timestamp,
-                "brand_name": brand,
-                "batch_number": batch,
-                "entry_type": m.movement_type,
-                "entity_name": entity,
-                "ref_number": ref,
-                "quantity": abs(m.quantity_changed or 0),
-                "user_name": user_name,
-                "age": age,
-                "prescriber": prescriber
-            })
+def _dda_ledger_query(db: Session, start_date=None, end_date=None, product_id=None):
+    """
+    Controlled-drug movements with their batch, supplier, user, sale and
+    prescription columns, all joined in one query.
+    """
+    query = db.query(
+        StockMovement.id, StockMovement.timestamp, StockMovement.movement_type,
+        StockMovement.quantity_changed, StockMovement.reason,
+        Product.brand_name, Drug.batch_number,
+        Supplier.name.label("supplier_name"),
+        User.username.label("user_name"),
+        SalesTransaction.receipt_number, SalesTransaction.patient_name,
+        PrescriptionDetail.patient_age, PrescriptionDetail.prescriber_name
+    ).join(Drug, StockMovement.drug_id == Drug.id)\
+     .join(Product, Drug.product_id == Product.id)\
+     .outerjoin(Supplier, Drug.supplier_id == Supplier.id)\
+     .outerjoin(User, StockMovement.user_id == User.id)\
+     .outerjoin(SalesTransaction, StockMovement.transaction_id == SalesTransaction.id)\
+     .outerjoin(PrescriptionDetail, PrescriptionDetail.transaction_id == SalesTransaction.id)\
+     .filter(Product.is_controlled == True)
+
+    if start_date:
+        query = query.filter(StockMovement.business_date >= start_date)
+    if end_date:
+        query = query.filter(StockMovement.business_date <= end_date)
+    if product_id:
+        query = query.filter(Drug.product_id == product_id)
+    return query
+
+
+def _dda_ledger_entry(row) -> dict:
+    entity, ref = "Unknown", row.reason or "N/A"
+    if row.movement_type == "RECEIVE":
+        entity = row.supplier_name or "Direct Entry"
+        ref = row.batch_number
+    elif row.receipt_number:
+        entity = row.patient_name or "Walk-in Client"
+        ref = row.receipt_number
+
+    return {
+        "timestamp": row.timestamp,
+        "brand_name": row.brand_name,
+        "batch_number": row.batch_number,
+        "entry_type": row.movement_type,
+        "entity_name": entity,
+        "ref_number": ref,
+        "quantity": abs(row.quantity_changed or 0),
+        "user_name": row.user_name or "System",
+        "age": row.patient_age,
+        "prescriber": row.prescriber_name
+    }
 
-        return ledger
 
-    except Exception as e:
-        # This is vital: Check your terminal for this output!
-        print(f"\n--- DDA LEDGER ERROR ---\n{str(e)}\n")
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(
-            status_code=500, detail=f"Internal Server Error: {str(e)}")
+@router.get("/dda-ledger", response_model=List[DDALedgerEntry])
+def get_dda_ledger(
+    response: Response,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    product_id: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Controlled-drug register, newest first. Pass `limit` to page through it;
+    the cursor for the next page is returned in the X-Next-Cursor header.
+    """
+    query = _dda_ledger_query(db, start_date, end_date, product_id)
+
+    # Keyset on (timestamp, id), newest first
+    if cursor:
+        last_ts, last_id = decode_cursor(cursor, datetime, int)
+        query = query.filter(tuple_(StockMovement.timestamp, StockMovement.id)
+                             < tuple_(last_ts, last_id))
+    query = query.order_by(StockMovement.timestamp.desc(), StockMovement.id.desc())
+
+    if limit is None:
+        return [_dda_ledger_entry(r) for r in query.all()]
+
+    rows = query.limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(
+            rows[-1].timestamp, rows[-1].id)
+    return [_dda_ledger_entry(r) for r in rows]
+
+
+def _prescription_book_query(db: Session, start_date=None, end_date=None,
+                             prescriber=None, patient=None):
+    """Sales with prescription details, one row each, medicines joined by string_agg."""
+    query = db.query(
+        SalesTransaction.id, SalesTransaction.timestamp,
+        SalesTransaction.receipt_number, SalesTransaction.patient_name,
+        PrescriptionDetail.patient_age, PrescriptionDetail.patient_sex,
+        PrescriptionDetail.prescriber_name, PrescriptionDetail.medical_institution,
+        PrescriptionDetail.dosage_instructions,
+        func.string_agg(Product.brand_name, literal_column("', '")).label("drugs")
+    ).join(PrescriptionDetail, PrescriptionDetail.transaction_id == SalesTransaction.id)\
+     .outerjoin(SaleItem, SaleItem.transaction_id == SalesTransaction.id)\
+     .outerjoin(Drug, SaleItem.drug_id == Drug.id)\
+     .outerjoin(Product, Drug.product_id == Product.id)\
+     .group_by(SalesTransaction.id, PrescriptionDetail.id)
+
+    if start_date:
+        query = query.filter(SalesTransaction.business_date >= start_date)
+    if end_date:
+        query = query.filter(SalesTransaction.business_date <= end_date)
+    if prescriber:
+        query = query.filter(PrescriptionDetail.prescriber_name.ilike(f"%{prescriber}%"))
+    if patient:
+        query = query.filter(SalesTransaction.patient_name.ilike(f"%{patient}%"))
+    return query
 
 
 @router.get("/prescription-book")
-def get_prescription_book(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    # Get all transactions that have clinical info
-    results = (
-        db.query(SalesTransaction)
-        .join(PrescriptionDetail)
-        .order_by(SalesTransaction.timestamp.desc())
-        .all()
-    )
-
-    book = []
-    for s in results:
-        drugs = ", ".join([item.drug.product.brand_name for item in s.items])
-        book.append({
-            "id": s.id,
-            "date": s.timestamp,
-            "receipt_number": s.receipt_number,
-            "patient_name": s.patient_name,
-            "age": s.prescription_info.patient_age,
-            "sex": s.prescription_info.patient_sex,
-            "prescriber": s.prescription_info.prescriber_name,
-            "institution": s.prescription_info.medical_institution,
-            "drugs": drugs,
-            "instructions": s.prescription_info.dosage_instructions
-        })
-    return book
+def get_prescription_book(
+    response: Response,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    prescriber: Optional[str] = None,
+    patient: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Transactions that have clinical info, newest first, one query with the
+    medicine names aggregated in SQL. Pass `limit` to page through them; the
+    cursor for the next page is returned in the X-Next-Cursor header.
+    """
+    query = _prescription_book_query(db, start_date, end_date, prescriber, patient)
+
+    # Keyset on (timestamp, id), newest first
+    if cursor:
+        last_ts, last_id = decode_cursor(cursor, datetime, int)
+        query = query.filter(tuple_(SalesTransaction.timestamp, SalesTransaction.id)
+                             < tuple_(last_ts, last_id))
+    query = query.order_by(SalesTransaction.timestamp.desc(), SalesTransaction.id.desc())
+
+    if limit is None:
+        rows = query.all()
+    else:
+        rows = query.limit(limit + 1).all()
+        if len(rows) > limit:
+            rows = rows[:limit]
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor(
+                rows[-1].timestamp, rows[-1].id)
+
+    return [{
+        "id": r.id,
+        "date": r.timestamp,
+        "receipt_number": r.receipt_number,
+        "patient_name": r.patient_name,
+        "age": r.patient_age,
+        "sex": r.patient_sex,
+        "prescriber": r.prescriber_name,
+        "institution": r.medical_institution,
+        "drugs": r.drugs or "",
+        "instructions": r.dosage_instructions
+    } for r in rows]
+
+
+@router.get("/prescription-book/search")
+def search_clinical_records(
+    response: Response,
+    q: str = Query(..., min_length=3, max_length=100),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Finds sales by patient, prescriber, institution or dosage instructions,
+    best match first. The cursor for the next page is returned in the
+    X-Next-Cursor header.
+    """
+    query = clinical_search_query(
+        db, q, decode_cursor(cursor, float, int) if cursor else None)
+
+    rows = query.limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(
+            rows[-1].rank, rows[-1].id)
+
+    return [{
+        "id": r.id,
+        "date": r.timestamp,
+        "receipt_number": r.receipt_number,
+        "patient_name": r.patient_name,
+        "age": r.patient_age,
+        "sex": r.patient_sex,
+        "prescriber": r.prescriber_name,
+        "institution": r.medical_institution,
+        "drugs": r.drugs or "",
+        "instructions": r.dosage_instructions,
+        "rank": round(r.rank, 4)
+    } for r in rows]
+
+
+class DDARegisterParams(BaseModel):
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    product_id: Optional[int] = None
+
+
+@report_kind("dda-register", DDARegisterParams)
+def build_dda_register_pdf(db: Session, params: DDARegisterParams, user=None,
+                           progress=None) -> ReportFile:
+    """The controlled-drug register for a period as a PDF."""
+    # 1. Batch balances at the period start, from the nearest monthly checkpoint
+    opening_balances = None
+    if params.start_date:
+        if refresh_dda_checkpoints(db):
+            db.commit()
+        opening_balances = period_opening_balances(
+            db, params.start_date, params.product_id)
+
+    # 2. Register rows carry their stored running balance: one range scan,
+    #    read through a server-side cursor and spooled for the renderer
+    rows = register_query(db, params.start_date, params.end_date, params.product_id)\
+        .order_by(DDARegister.timestamp.desc(), DDARegister.id.desc())\
+        .yield_per(settings.REPORT_CHUNK_ROWS)
+
+    # Newest first for the PDF document
+    ledger_data = ({
+        "timestamp": row.timestamp.strftime("%Y-%m-%d %H:%M") if row.timestamp else "N/A",
+        "brand_name": row.brand_name,
+        "batch_number": row.batch_number,
+        "entry_type": row.entry_type,
+        "entity_name": row.person_entity_name,
+        "ref_number": row.prescription_invoice_ref or "N/A",
+        "quantity": row.quantity_in or row.quantity_out,
+        "running_balance": row.balance_after,
+        "user_name": row.user_name or "System",
+        "age": row.patient_age,
+        "prescriber": row.prescriber_name
+    } for row in track(rows, progress))
+
+    # Laid out in the PDF renderer pool
+    pdf = render_pdf(generate_dda_pdf, params.start_date, params.end_date,
+                     opening_balances, rows=ledger_data)
+    return ReportFile([pdf],
+                      f"DDA_Register_{datetime.now().strftime('%Y%m%d')}.pdf",
+                      "application/pdf")
 
 
 @router.get("/dda-ledger/download")
 def download_dda_pdf(
-    start_date: Optional[str] = None,
-    end_date: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    product_id: Optional[int] = None,
     token: Optional[str] = Query(None),  # Get token from URL
     db: Session = Depends(get_db)
 ):
@@ -412,91 +904,59 @@ def download_dda_pdf(
     # user = verify_token(token, db)
 
     try:
-        # 2. Fetch movements with eager loading
-        query = db.query(StockMovement).join(Drug).join(Product).options(
-            joinedload(StockMovement.drug).joinedload(Drug.product),
-            joinedload(StockMovement.drug).joinedload(Drug.supplier_rel),
-            joinedload(StockMovement.user)
-        ).filter(Product.is_controlled == True)
-
-        if start_date and end_date:
-            # Handle potential string to datetime conversion if necessary
-            query = query.filter(
-                StockMovement.timestamp.between(start_date, end_date))
-
-        # Order by ASC for correct chronological balance calculation
-        movements = query.order_by(StockMovement.timestamp.asc()).all()
-
-        ledger_data, balances = [], {}
-        for m in movements:
-            if not m.drug or not m.drug.product:
-                continue
-
-            brand = m.drug.product.brand_name
-            if brand not in balances:
-                balances[brand] = 0
-
-            qty_abs = abs(m.quantity_changed or 0)
-            age, prescriber = None, None
-
-            # Calculate Running Balance
-            if m.movement_type == "RECEIVE":
-                balances[brand] += qty_abs
-                entity = m.drug.supplier_rel.name if m.drug.supplier_rel else "Direct Entry"
-                ref = m.drug.batch_number
-            else:
-                balances[brand] -= qty_abs
-                entity, ref = "Unknown Client", m.reason or "N/A"
-                if "Sale " in ref:
-                    r_no = ref.replace("Sale ", "").strip()
-                    sale = db.query(SalesTransaction).filter(
-                        SalesTransaction.receipt_number == r_no).first()
-                    if sale:
-                        entity = sale.patient_name or "Walk-in"
-                        ref = sale.receipt_number
-                        p_info = db.query(PrescriptionDetail).filter(
-                            PrescriptionDetail.transaction_id == sale.id).first()
-                        if p_info:
-                            age, prescriber = p_info.patient_age, p_info.prescriber_name
-
-            ledger_data.append({
-                "timestamp": m.timestamp.strftime("%Y-%m-%d %H:%M") if m.timestamp else "N/A",
-                "brand_name": brand,
-                "batch_number": m.drug.batch_number,
-                "entry_type": m.movement_type,
-                "entity_name": entity,
-                "ref_number": ref,
-                "quantity": qty_abs,
-                "running_balance": balances[brand],
-                "user_name": m.user.username if m.user else "System",
-                "age": age,
-                "prescriber": prescriber
-            })
-
-        # Reverse to show newest first for the PDF document
-        ledger_data.reverse()
-
-        # Ensure generate_dda_pdf is updated to handle 'age' and 'prescriber' keys
-        pdf_buffer = generate_dda_pdf(ledger_data, start_date, end_date)
-
+        report = build_dda_register_pdf(db, DDARegisterParams(
+            start_date=start_date, end_date=end_date, product_id=product_id))
         return StreamingResponse(
-            pdf_buffer,
-            media_type="application/pdf",
+            report.chunks,
+            media_type=report.media_type,
             headers={
-                "Content-Disposition": f"attachment; filename=DDA_Register_{datetime.now().strftime('%Y%m%d')}.pdf"
+                "Content-Disposition": f"attachment; filename={report.filename}"
             }
         )
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"PDF Error: {str(e)}")
         raise HTTPException(
             status_code=500, detail=f"PDF Generation Failed: {str(e)}")
-        
+
+
+class PrescriptionBookParams(BaseModel):
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+
+
+@report_kind("prescription-book", PrescriptionBookParams)
+def build_prescription_book_pdf(db: Session, params: PrescriptionBookParams, user=None,
+                                progress=None) -> ReportFile:
+    """The prescription register for a period as a PDF."""
+    # One row per prescription with its medicines aggregated in SQL,
+    # read through a server-side cursor and spooled for the renderer
+    rows = _prescription_book_query(db, params.start_date, params.end_date)\
+        .order_by(SalesTransaction.timestamp.asc(), SalesTransaction.id.asc())\
+        .yield_per(settings.REPORT_CHUNK_ROWS)
+
+    pdf_data = ({
+        "date": r.timestamp.strftime("%Y-%m-%d") if r.timestamp else "N/A",
+        "receipt_number": r.receipt_number,
+        "patient_name": r.patient_name,
+        "age_sex": f"{r.patient_age or 'N/A'} | {r.patient_sex or 'N/A'}",
+        "prescriber": f"{r.prescriber_name}\n({r.medical_institution or 'Private'})",
+        "drugs": r.drugs or "",
+        "instructions": r.dosage_instructions or "As directed"
+    } for r in track(rows, progress))
+
+    pdf = render_pdf(generate_prescription_book_pdf,
+                     params.start_date, params.end_date, rows=pdf_data)
+    return ReportFile([pdf],
+                      f"Prescription_Register_{datetime.now().strftime('%Y%m%d')}.pdf",
+                      "application/pdf")
 
 
 @router.get("/prescription-book/download")
 def download_prescription_pdf(
-    start_date: Optional[str] = None,
-    end_date: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
     token: Optional[str] = Query(None),
     db: Session = Depends(get_db)
 ):
@@ -506,48 +966,23 @@ def download_prescription_pdf(
             status_code=401, detail="Authentication token missing")
 
     try:
-        # 2. Query transactions with clinical info
-        query = db.query(SalesTransaction).join(PrescriptionDetail)
-
-        if start_date and end_date:
-            query = query.filter(
-                SalesTransaction.timestamp.between(start_date, end_date))
-
-        results = query.order_by(SalesTransaction.timestamp.asc()).all()
-
-        pdf_data = []
-        for s in results:
-            drugs = ", ".join(
-                [item.drug.product.brand_name for item in s.items])
-            pdf_data.append({
-                "date": s.timestamp.strftime("%Y-%m-%d") if s.timestamp else "N/A",
-                "receipt_number": s.receipt_number,
-                "patient_name": s.patient_name,
-                "age_sex": f"{s.prescription_info.patient_age or 'N/A'} | {s.prescription_info.patient_sex or 'N/A'}",
-                "prescriber": f"{s.prescription_info.prescriber_name}\n({s.prescription_info.medical_institution or 'Private'})",
-                "drugs": drugs,
-                "instructions": s.prescription_info.dosage_instructions or "As directed"
-            })
-
-        # You will need to create this util function in app/utils/prescription_pdf.py
-        from app.utils.prescription_pdf import generate_prescription_book_pdf
-        pdf_buffer = generate_prescription_book_pdf(
-            pdf_data, start_date, end_date)
-
+        report = build_prescription_book_pdf(db, PrescriptionBookParams(
+            start_date=start_date, end_date=end_date))
         return StreamingResponse(
-            pdf_buffer,
-            media_type="application/pdf",
+            report.chunks,
+            media_type=report.media_type,
             headers={
-                "Content-Disposition": f"attachment; filename=Prescription_Register_{datetime.now().strftime('%Y%m%d')}.pdf"
+                "Content-Disposition": f"attachment; filename={report.filename}"
             }
         )
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Prescription PDF Error: {str(e)}")
         raise HTTPException(
             status_code=500, detail=f"Failed to generate PDF: {str(e)}")
-        
 
-        
+
 @router.get("/products/{product_id}", response_model=ProductSchema)
 def get_product(product_id: int, db: Session = Depends(get_db)):
     # Use 'Product' directly since we imported it specifically
@@ -569,7 +1004,12 @@ def update_product(product_id: int, product_data: ProductSchema, db: Session = D
     for key, value in product_data.dict().items():
         setattr(db_product, key, value)
 
-    db.commit()
+    # The flush already hits the unique name index
+    with catalog_rename(db, "Product"):
+        db.flush()
+        refresh_product_summaries(db, [db_product.id])
+        bump_catalog_version(db, "products")
+        db.commit()
     db.refresh(db_product)
     return db_product
 
@@ -594,7 +1034,8 @@ def update_generic(id: int, data: GenericDrugCreate, db: Session = Depends(get_d
     item.name = data.name
     item.description = data.description
 
-    db.commit()
+    bump_catalog_version(db, "generics")
+    commit_catalog_rename(db, "Generic")
     db.refresh(item)
     return item
 
@@ -602,29 +1043,24 @@ def update_generic(id: int, data: GenericDrugCreate, db: Session = Depends(get_d
 
 
 @router.get("/suppliers", response_model=List[SupplierSchema])
-def get_suppliers(db: Session = Depends(get_db)):
-    return db.query(Supplier).order_by(Supplier.name.asc()).all()
+def get_suppliers(request: Request, db: Session = Depends(get_db)):
+    return catalog_response(
+        request, db, "suppliers", SupplierSchema,
+        lambda: db.query(Supplier).order_by(Supplier.name.asc()).all())
 
 
 @router.post("/suppliers", response_model=SupplierSchema)
 def add_supplier(data: SupplierCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    # 1. Case-insensitive check
-    existing = db.query(Supplier).filter(
-        Supplier.name.ilike(data.name)).first()
-
-    if existing:
-        # 2. Update existing supplier's info (Harmonization)
-        for key, value in data.model_dump(exclude_unset=True).items():
-            setattr(existing, key, value)
-        db.commit()
-        db.refresh(existing)
-        return existing
-
-    # 3. Create new with all fields
-    db_supplier = Supplier(**data.model_dump())
-    db.add(db_supplier)
+    # 1. Insert, or update the existing supplier (same name ignoring case
+    #    and surrounding spaces) with the fields sent (Harmonization)
+    fields = data.model_dump(exclude_unset=True)
+    fields["name"] = data.name.strip()
+    db_supplier = upsert_by_name(
+        db, Supplier, Supplier.name, {**data.model_dump(), **fields}, fields)
+
+    # 2. Commit together with the catalog version
+    bump_catalog_version(db, "suppliers")
     db.commit()
-    db.refresh(db_supplier)
     return db_supplier
 
 
@@ -638,7 +1074,8 @@ def update_supplier(id: int, data: SupplierCreate, db: Session = Depends(get_db)
     for key, value in data.model_dump().items():
         setattr(item, key, value)
 
-    db.commit()
+    bump_catalog_version(db, "suppliers")
+    commit_catalog_rename(db, "Supplier")
     db.refresh(item)
     return item
 
@@ -0,0 +1,47 @@
+# app/utils/allocation.py
+from typing import Dict, List, Tuple
+
+
+class InsufficientStockError(Exception):
+    """Raised when the sellable batches cannot cover the requested quantity."""
+
+    def __init__(self, product_id: int, requested: int, available: int):
+        self.product_id = product_id
+        self.requested = requested
+        self.available = available
+        super().__init__(
+            f"Insufficient stock for product {product_id}: "
+            f"requested {requested}, available {available}")
+
+
+def allocate_fefo(product_id: int, batches: list, quantity: int,
+                  available: Dict[int, int]) -> List[Tuple[object, int]]:
+    """
+    First-Expiry-First-Out allocation of `quantity` units of one product.
+
+    `batches` must already be in FEFO order (expiry_date, id). `available`
+    maps batch id to units still free in this cart; it is decremented in
+    place so that several cart lines touching the same batches never
+    double-allocate.
+    Returns a list of (batch, units) pairs.
+    """
+    allocation = []
+    remaining = quantity
+    for batch in batches:
+        if remaining == 0:
+            break
+        free = available.get(batch.id, 0)
+        if free <= 0:
+            continue
+        take = min(free, remaining)
+        available[batch.id] = free - take
+        allocation.append((batch, take))
+        remaining -= take
+
+    if remaining > 0:
+        # Roll back this line's claims before reporting the shortfall
+        for batch, take in allocation:
+            available[batch.id] += take
+        raise InsufficientStockError(
+            product_id, quantity, quantity - remaining)
+    return allocation
@@ -0,0 +1,61 @@
+# app/utils/catalog_cache.py
+import threading
+
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.models.stock import CatalogVersion
+
+# Generics, products and suppliers change a few times a day but are listed
+# on nearly every page load. Each worker keeps the serialised JSON of those
+# lists keyed by the entity's row in catalog_versions; write endpoints bump
+# the version in their own transaction, so every worker sees the change on
+# its next request at the cost of one primary-key lookup.
+
+_lock = threading.Lock()
+_cache: "dict[str, tuple[int, bytes]]" = {}
+
+
+def bump_catalog_version(db, *entities: str):
+    """Marks `entities` as changed; call before the write commits."""
+    for entity in entities:
+        stmt = pg_insert(CatalogVersion).values(entity=entity, version=1)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[CatalogVersion.entity],
+            set_={"version": CatalogVersion.version + 1, "updated_at": func.now()}))
+
+
+def catalog_versions(db, *entities: str) -> tuple:
+    """Current versions of `entities`, 0 for one never written."""
+    rows = dict(db.execute(
+        select(CatalogVersion.entity, CatalogVersion.version)
+        .where(CatalogVersion.entity.in_(entities))).all())
+    return tuple(rows.get(e, 0) for e in entities)
+
+
+def catalog_response(request: Request, db, entity: str, schema, load) -> Response:
+    """
+    Serves the `entity` list as JSON with an ETag derived from its version.
+    Returns 304 when the client already holds this version, otherwise the
+    cached body, serialising `load()` with `schema` only after a change.
+    """
+    (version,) = catalog_versions(db, entity)
+    etag = f'W/"{entity}-{version}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+
+    with _lock:
+        cached = _cache.get(entity)
+    if cached is not None and cached[0] == version:
+        body = cached[1]
+    else:
+        adapter = TypeAdapter(list[schema])
+        body = adapter.dump_json(adapter.validate_python(load(), from_attributes=True))
+        with _lock:
+            _cache[entity] = (version, body)
+
+    return Response(content=body, media_type="application/json", headers=headers)
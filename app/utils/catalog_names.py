@@ -0,0 +1,110 @@
+# app/utils/catalog_names.py
+from contextlib import contextmanager
+
+import structlog
+from fastapi import HTTPException
+from sqlalchemy import func, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+
+from app.models.stock import GenericDrug, Product, Supplier
+
+logger = structlog.get_logger()
+
+# Generics, products and suppliers are unique on their normalised name
+# (lower(trim(name))), enforced by expression indexes declared on the
+# models. Adds are single INSERT ... ON CONFLICT statements against that
+# expression, so the duplicate check uses the index and cannot race.
+
+
+def normalised(column):
+    return func.lower(func.trim(column))
+
+
+def upsert_by_name(db, model, name_column, values: dict, update: dict):
+    """
+    Inserts `values`, or applies `update` to the row with the same
+    normalised name. Returns the stored ORM object either way.
+    """
+    stmt = pg_insert(model).values(**values)
+    # An empty update still has to touch the row for RETURNING to yield it
+    set_ = update or {name_column.key: name_column}
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[normalised(name_column)], set_=set_)
+    return db.scalars(
+        stmt.returning(model),
+        execution_options={"populate_existing": True}).one()
+
+
+@contextmanager
+def catalog_rename(db, label: str):
+    """Turns a clash with another row's name inside the block into a 409."""
+    try:
+        yield
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(
+            status_code=409, detail=f"{label} with this name already exists")
+
+
+def commit_catalog_rename(db, label: str):
+    """Commits an edit, turning a clash with another row's name into a 409."""
+    with catalog_rename(db, label):
+        db.commit()
+
+
+# (table, name column, [(referencing table, referencing column), ...])
+_MERGES = [
+    ("generic_drugs", "name", [("products", "generic_id")]),
+    ("suppliers", "name", [("drugs", "supplier_id")]),
+    ("products", "brand_name", [("drugs", "product_id"),
+                                ("dda_register", "product_id"),
+                                ("dda_balance_checkpoints", "product_id")]),
+]
+
+_ENTITIES = {"generic_drugs": "generics", "suppliers": "suppliers", "products": "products"}
+
+
+def merge_catalog_duplicates(conn):
+    """
+    Startup step, run before the unique name indexes are created: folds
+    rows whose names differ only in case or surrounding spaces into the
+    oldest one (lowest id), repointing the rows that reference them.
+    """
+    merged, kept_products = [], []
+    for table, column, references in _MERGES:
+        dupes = (f"SELECT id, min(id) OVER (PARTITION BY lower(trim({column}))) AS keep "
+                 f"FROM {table}")
+        if conn.execute(text(f"SELECT 1 FROM ({dupes}) d WHERE id <> keep LIMIT 1")).first() is None:
+            continue
+
+        for ref_table, ref_column in references:
+            conn.execute(text(
+                f"UPDATE {ref_table} AS r SET {ref_column} = d.keep FROM ({dupes}) d "
+                f"WHERE r.{ref_column} = d.id AND d.id <> d.keep"))
+        if table == "products":
+            # A product stays controlled if any of its duplicates was
+            conn.execute(text(
+                f"UPDATE products AS p SET is_controlled = true FROM ({dupes}) d "
+                f"JOIN products dup ON dup.id = d.id "
+                f"WHERE p.id = d.keep AND d.id <> d.keep AND dup.is_controlled"))
+            kept_products = [r.keep for r in conn.execute(text(
+                f"SELECT DISTINCT keep FROM ({dupes}) d WHERE id <> keep"))]
+        removed = conn.execute(text(
+            f"DELETE FROM {table} WHERE id IN "
+            f"(SELECT id FROM ({dupes}) d WHERE id <> keep)")).rowcount
+        logger.info("catalog_duplicates_merged", table=table, removed=removed)
+        merged.append(table)
+
+    if merged:
+        from app.utils.catalog_cache import bump_catalog_version
+        bump_catalog_version(conn, *[_ENTITIES[t] for t in merged])
+    if kept_products:
+        from app.utils.stock_summary import rebuild_stock_summary
+        from app.utils.sales_rollup import rebuild_sales_rollup
+        from app.utils.dda_register import recompute_dda_balances
+        rebuild_stock_summary(conn)
+        rebuild_sales_rollup(conn)
+        # The kept product's register now interleaves its duplicates' rows:
+        # one running balance through all of them
+        recompute_dda_balances(conn, kept_products)
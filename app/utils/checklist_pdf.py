@@ -0,0 +1,54 @@
+# app/utils/checklist_pdf.py
+from datetime import date
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+from reportlab.lib.styles import getSampleStyleSheet
+
+from app.utils.pdf_stream import build_pdf, chunked_tables
+
+HEADER = ["Brand Name", "Batch", "Expiry", "System Qty", "Physical Count"]
+COL_WIDTHS = [180, 80, 80, 60, 80]
+TABLE_STYLE = [
+    ('BACKGROUND', (0, 0), (-1, 0), colors.whitesmoke),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+]
+
+
+def _rows(data):
+    for brand_name, batch_number, expiry_date, quantity in data:
+        yield [
+            brand_name,
+            batch_number,
+            str(expiry_date),
+            str(quantity),
+            "__________"  # Line for manual handwriting
+        ]
+
+
+def _flowables(data, generated_by):
+    styles = getSampleStyleSheet()
+
+    # Title and Meta
+    yield Paragraph("Full Dispensary Inventory Checklist", styles['Title'])
+    yield Paragraph(
+        f"Audit Date: {date.today().strftime('%d %b %Y')}", styles['Normal'])
+    yield Paragraph(f"Generated by: {generated_by}", styles['Normal'])
+    yield Spacer(1, 15)
+
+    yield from chunked_tables(HEADER, _rows(data), COL_WIDTHS, TABLE_STYLE)
+
+
+def generate_checklist_pdf(data, generated_by="System"):
+    """
+    Renders (brand_name, batch_number, expiry_date, quantity) rows (any
+    iterable, consumed once) into a spooled file, a chunk at a time.
+    """
+    return build_pdf(SimpleDocTemplate, _flowables(data, generated_by), pagesize=A4)
@@ -0,0 +1,87 @@
+# app/utils/clinical_search.py
+from sqlalchemy import Float, cast, func, literal, literal_column, or_, select, tuple_, union
+
+from app.models.sales import PrescriptionDetail, SaleItem, SalesTransaction
+from app.models.stock import Drug, Product
+
+# Ranked search over patient, prescriber, institution and dosage
+# instructions. Each field has its own database index (trigram GIN on the
+# lower-cased names, full-text GIN on the instructions; see STATEMENTS in
+# app/database/migrations.py), so matches are collected per field and
+# UNIONed: an OR across two tables could not use any of them.
+
+# Must match the indexed expressions exactly
+TS_CONFIG = literal_column("'simple'")
+
+
+def _lower(column):
+    return func.lower(column)
+
+
+def instructions_vector():
+    return func.to_tsvector(
+        TS_CONFIG, func.coalesce(PrescriptionDetail.dosage_instructions, literal_column("''")))
+
+
+def _like_pattern(term: str) -> str:
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def _matches(column, term, pattern):
+    # Substring, or a close (typo-tolerant) match on one of its words
+    return or_(_lower(column).like(pattern),
+               literal(term).op("<%")(_lower(column)))
+
+
+def clinical_search_query(db, q: str, cursor=None):
+    """
+    Sales matching `q`, best match first, as (rank, id)-ordered rows with
+    the prescription columns and the medicines aggregated in SQL.
+    `cursor` is the (rank, id) of the last row already served.
+    """
+    term = " ".join(q.lower().split())
+    pattern = _like_pattern(term)
+    tsquery = func.plainto_tsquery(TS_CONFIG, term)
+
+    # 1. Candidate transactions, each branch answered by its own index
+    hits = union(
+        select(SalesTransaction.id.label("transaction_id"))
+        .where(_matches(SalesTransaction.patient_name, term, pattern)),
+        select(PrescriptionDetail.transaction_id)
+        .where(_matches(PrescriptionDetail.prescriber_name, term, pattern)),
+        select(PrescriptionDetail.transaction_id)
+        .where(_matches(PrescriptionDetail.medical_institution, term, pattern)),
+        select(PrescriptionDetail.transaction_id)
+        .where(instructions_vector().op("@@")(tsquery)),
+    ).subquery()
+
+    # 2. Rank: closest name match, or the instructions' text rank (as double
+    #    precision so the value round-trips through the cursor exactly)
+    rank = cast(func.greatest(
+        func.coalesce(func.word_similarity(term, _lower(SalesTransaction.patient_name)), 0),
+        func.coalesce(func.word_similarity(term, _lower(PrescriptionDetail.prescriber_name)), 0),
+        func.coalesce(func.word_similarity(term, _lower(PrescriptionDetail.medical_institution)), 0),
+        func.ts_rank(instructions_vector(), tsquery),
+    ), Float)
+
+    query = db.query(
+        SalesTransaction.id, SalesTransaction.timestamp,
+        SalesTransaction.receipt_number, SalesTransaction.patient_name,
+        PrescriptionDetail.patient_age, PrescriptionDetail.patient_sex,
+        PrescriptionDetail.prescriber_name, PrescriptionDetail.medical_institution,
+        PrescriptionDetail.dosage_instructions,
+        func.string_agg(Product.brand_name, literal_column("', '")).label("drugs"),
+        rank.label("rank")
+    ).join(hits, hits.c.transaction_id == SalesTransaction.id)\
+     .outerjoin(PrescriptionDetail, PrescriptionDetail.transaction_id == SalesTransaction.id)\
+     .outerjoin(SaleItem, SaleItem.transaction_id == SalesTransaction.id)\
+     .outerjoin(Drug, SaleItem.drug_id == Drug.id)\
+     .outerjoin(Product, Drug.product_id == Product.id)\
+     .group_by(SalesTransaction.id, PrescriptionDetail.id)
+
+    # 3. Keyset on (rank, id), best first
+    if cursor:
+        last_rank, last_id = cursor
+        query = query.filter(tuple_(rank, SalesTransaction.id) < tuple_(last_rank, last_id))
+    return query.order_by(rank.desc(), SalesTransaction.id.desc())
@@ -1,53 +1,72 @@
 # app/utils/dda_pdf.py
-import io
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4, landscape
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.styles import getSampleStyleSheet
 
+from app.utils.pdf_stream import build_pdf, chunked_tables
 
+# Add Running Balance to the Header
+HEADER = ["Date", "Medication", "Type",
+          "Entity", "Ref", "Qty", "Balance", "User"]
+# Table styling with specific widths for landscape
+COL_WIDTHS = [70, 140, 70, 140, 90, 40, 60, 80]
+TABLE_STYLE = [
+    ('BACKGROUND', (0, 0), (-1, 0), colors.black),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ('FONTSIZE', (0, 0), (-1, -1), 8),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+]
 
-def generate_dda_pdf(data, start_date, end_date):
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=landscape(A4))
-    elements = []
-    styles = getSampleStyleSheet()
-
-    # Header Section
-    elements.append(
-        Paragraph("DANGEROUS DRUGS REGISTER (DDA)", styles['Heading1']))
-    date_text = f"Period: {start_date} to {end_date}" if start_date else "Complete Audit Trail"
-    elements.append(Paragraph(date_text, styles['Normal']))
-    elements.append(Spacer(1, 15))
-
-    # Add Running Balance to the Header
-    header = ["Date", "Medication", "Type",
-              "Entity", "Ref", "Qty", "Balance", "User"]
-    table_data = [header]
 
+def _rows(data):
     for entry in data:
-        table_data.append([
+        yield [
             entry["timestamp"][:10],
             f"{entry['brand_name']}\n({entry['batch_number']})",
             entry["entry_type"],
             entry["entity_name"],
             entry["ref_number"],
             str(entry["quantity"]),
-            str(entry["running_balance"]),  # New Column
+            str(entry["running_balance"]),
             entry["user_name"]
-        ])
-
-    # Table styling with specific widths for landscape
-    t = Table(table_data, colWidths=[70, 140, 70, 140, 90, 40, 60, 80])
-    t.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.black),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ('FONTSIZE', (0, 0), (-1, -1), 8),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-    ]))
-
-    elements.append(t)
-    doc.build(elements)
-    buffer.seek(0)
-    return buffer
+        ]
+
+
+def _flowables(data, start_date, end_date, opening_balances):
+    styles = getSampleStyleSheet()
+
+    # Header Section
+    yield Paragraph("DANGEROUS DRUGS REGISTER (DDA)", styles['Heading1'])
+    date_text = f"Period: {start_date} to {end_date}" if start_date else "Complete Audit Trail"
+    yield Paragraph(date_text, styles['Normal'])
+    yield Spacer(1, 15)
+
+    # Stock brought forward into the period, per batch
+    if opening_balances:
+        yield Paragraph(
+            f"Balances brought forward at {start_date}", styles['Heading3'])
+        opening = [["Medication", "Batch", "Balance"]] + [
+            [b["brand_name"], b["batch_number"], str(b["balance"])]
+            for b in opening_balances]
+        ot = Table(opening, colWidths=[200, 120, 60])
+        ot.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+            ('FONTSIZE', (0, 0), (-1, -1), 8),
+        ]))
+        yield ot
+        yield Spacer(1, 15)
+
+    yield from chunked_tables(HEADER, _rows(data), COL_WIDTHS, TABLE_STYLE)
+
+
+def generate_dda_pdf(data, start_date, end_date, opening_balances=None):
+    """
+    Renders register entries (any iterable, consumed once) into a spooled
+    file, laying them out a chunk at a time.
+    """
+    return build_pdf(SimpleDocTemplate,
+                     _flowables(data, start_date, end_date, opening_balances),
+                     pagesize=landscape(A4))
@@ -0,0 +1,280 @@
+# app/utils/dda_register.py
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import Date, case, cast, exists, func, insert, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import aliased
+
+from app.core.config import settings
+from app.models.dda import DDABalanceCheckpoint, DDARegister
+from app.models.sales import PrescriptionDetail, SalesTransaction
+from app.models.stock import Drug, Product, Supplier
+from app.models.stock_movement import StockMovement
+from app.models.user import User
+from app.utils.stock_locks import lock_rows
+
+# Every stock write on an is_controlled product appends its register rows
+# through record_dda_movements(), inside the write's transaction. The
+# product rows are locked first, so the balance each row builds on is the
+# latest committed one and concurrent tills append in turn.
+#
+# Days and months are cut at midnight in BUSINESS_TIMEZONE, like the
+# movements' business_date: period filters compare the timestamp with
+# the local midnight as an instant (so the timestamp indexes still serve
+# them) and checkpoint months are taken from the local time.
+
+REGISTER_COLUMNS = [
+    "drug_id", "product_id", "movement_id", "user_id", "entry_type", "timestamp",
+    "person_entity_name", "prescription_invoice_ref", "quantity_in",
+    "quantity_out", "balance_after", "batch_number", "remarks",
+]
+
+
+def _local_midnight(day: date) -> datetime:
+    """The instant `day` begins in the business time zone."""
+    return datetime.combine(day, time.min, tzinfo=ZoneInfo(settings.BUSINESS_TIMEZONE))
+
+
+def _register_select(movement_filter, live: bool):
+    """
+    Register rows for the controlled movements matching `movement_filter`,
+    with balances running on from the product's latest register row. A
+    product without one opens at its stock on hand before these movements.
+    """
+    qty_in = func.greatest(StockMovement.quantity_changed, 0)
+    qty_out = func.greatest(-StockMovement.quantity_changed, 0)
+    net = qty_in - qty_out
+
+    latest = select(DDARegister.balance_after)\
+        .where(DDARegister.product_id == Drug.product_id)\
+        .order_by(DDARegister.timestamp.desc(), DDARegister.id.desc())\
+        .limit(1).scalar_subquery()
+    batch = aliased(Drug)
+    on_hand = select(func.coalesce(func.sum(batch.quantity), 0))\
+        .where(batch.product_id == Drug.product_id).scalar_subquery()
+    opening = func.coalesce(
+        latest, on_hand - func.sum(net).over(partition_by=Drug.product_id))
+    balance = opening + func.sum(net).over(
+        partition_by=Drug.product_id,
+        order_by=(StockMovement.timestamp, StockMovement.id))
+
+    is_receipt = StockMovement.movement_type == "RECEIVE"
+    is_sale = SalesTransaction.id.isnot(None)
+
+    return select(
+        StockMovement.drug_id, Drug.product_id, StockMovement.id,
+        StockMovement.user_id, StockMovement.movement_type,
+        # Live rows are stamped when appended (under the product lock), so
+        # register order by time is also the order balances were built in
+        func.clock_timestamp() if live else StockMovement.timestamp,
+        case((is_receipt, func.coalesce(Supplier.name, "Direct Entry")),
+             (is_sale, func.coalesce(SalesTransaction.patient_name, "Walk-in Client")),
+             (StockMovement.movement_type == "RECONCILE", "Stock Audit"),
+             else_="Unknown"),
+        case((is_receipt, Drug.batch_number),
+             (is_sale, SalesTransaction.receipt_number),
+             else_=StockMovement.reason),
+        qty_in, qty_out, balance, Drug.batch_number, StockMovement.reason
+    ).select_from(StockMovement)\
+     .join(Drug, StockMovement.drug_id == Drug.id)\
+     .join(Product, Drug.product_id == Product.id)\
+     .outerjoin(Supplier, Drug.supplier_id == Supplier.id)\
+     .outerjoin(SalesTransaction, StockMovement.transaction_id == SalesTransaction.id)\
+     .where(Product.is_controlled == True, movement_filter)
+
+
+def _lock_controlled(db, product_ids, operation) -> list:
+    query = db.query(Product.id).filter(Product.is_controlled == True)
+    if product_ids is not None:
+        query = query.filter(Product.id.in_(sorted(set(product_ids))))
+    return [r.id for r in lock_rows(db, query.order_by(Product.id), operation)]
+
+
+def record_dda_movements(db, product_ids, movement_filter):
+    """
+    Appends register rows for the movements matching `movement_filter`
+    (already flushed, all on `product_ids`). A no-op, one query, when none
+    of the products is controlled.
+    """
+    if not _lock_controlled(db, [p for p in product_ids if p is not None], "dda_register"):
+        return
+    db.execute(insert(DDARegister).from_select(
+        REGISTER_COLUMNS, _register_select(movement_filter, live=True)))
+
+
+def recompute_dda_balances(db, product_ids):
+    """
+    Recomputes the running balance of every register row of `product_ids`
+    in time order, anchored so the latest balance equals the stock on
+    hand. Works on a Session or a Connection; the caller commits.
+    """
+    net = DDARegister.quantity_in - DDARegister.quantity_out
+    on_hand = select(func.coalesce(func.sum(Drug.quantity), 0))\
+        .where(Drug.product_id == DDARegister.product_id).scalar_subquery()
+    running = select(
+        DDARegister.id,
+        (on_hand - func.sum(net).over(partition_by=DDARegister.product_id)
+         + func.sum(net).over(partition_by=DDARegister.product_id,
+                              order_by=(DDARegister.timestamp, DDARegister.id))
+         ).label("balance")
+    ).where(DDARegister.product_id.in_(product_ids)).subquery()
+    db.execute(update(DDARegister)
+               .where(DDARegister.id == running.c.id)
+               .values(balance_after=running.c.balance)
+               .execution_options(synchronize_session=False))
+
+
+def backfill_dda_register(db) -> dict:
+    """
+    Adds register rows for controlled movements that have none, then
+    recomputes every controlled product's running balance in time order,
+    anchored so the latest balance equals the stock on hand. The caller
+    commits.
+    """
+    # 1. Live writers wait on these locks until the rebuild commits
+    product_ids = _lock_controlled(db, None, "dda_backfill")
+    if not product_ids:
+        return {"products": 0, "entries_added": 0}
+
+    # 2. Missing rows, in movement time order
+    missing = ~exists().where(DDARegister.movement_id == StockMovement.id)
+    added = db.execute(insert(DDARegister).from_select(
+        REGISTER_COLUMNS, _register_select(missing, live=False))).rowcount
+
+    # 3. Running balances with window functions, in one UPDATE
+    recompute_dda_balances(db, product_ids)
+
+    # 4. Balances moved, so every checkpoint is recomputed
+    refresh_dda_checkpoints(db, full=True)
+
+    return {"products": len(product_ids), "entries_added": added}
+
+
+def register_query(db, start_date=None, end_date=None, product_id=None):
+    """Register rows with brand, user and prescription columns, in one query."""
+    query = db.query(
+        DDARegister.id, DDARegister.timestamp, DDARegister.entry_type,
+        DDARegister.person_entity_name, DDARegister.prescription_invoice_ref,
+        DDARegister.quantity_in, DDARegister.quantity_out,
+        DDARegister.balance_after, DDARegister.batch_number,
+        Product.brand_name, User.username.label("user_name"),
+        PrescriptionDetail.patient_age, PrescriptionDetail.prescriber_name
+    ).join(Product, DDARegister.product_id == Product.id)\
+     .outerjoin(User, DDARegister.user_id == User.id)\
+     .outerjoin(StockMovement, DDARegister.movement_id == StockMovement.id)\
+     .outerjoin(PrescriptionDetail,
+                PrescriptionDetail.transaction_id == StockMovement.transaction_id)
+
+    if start_date:
+        query = query.filter(DDARegister.timestamp >= _local_midnight(start_date))
+    if end_date:
+        query = query.filter(
+            DDARegister.timestamp < _local_midnight(end_date + timedelta(days=1)))
+    if product_id:
+        query = query.filter(DDARegister.product_id == product_id)
+    return query
+
+
+CHECKPOINT_COLUMNS = ["drug_id", "month", "product_id",
+                      "quantity_in", "quantity_out", "closing_balance"]
+
+
+def refresh_dda_checkpoints(db, full: bool = False) -> int:
+    """
+    Stores a closing balance per batch for every complete month with
+    register entries, from the month after the latest checkpoint (or from
+    the start with `full`). A batch's closing balance is its current
+    quantity less everything registered after that month, so each run only
+    reads the register from its first month onwards. The caller commits.
+    """
+    this_month = datetime.now(ZoneInfo(settings.BUSINESS_TIMEZONE)).date().replace(day=1)
+    since = None
+    if not full:
+        last = db.execute(select(func.max(DDABalanceCheckpoint.month))).scalar()
+        if last is not None:
+            since = (last + timedelta(days=32)).replace(day=1)
+            pending = db.execute(
+                select(DDARegister.id)
+                .where(DDARegister.timestamp >= _local_midnight(since),
+                       DDARegister.timestamp < _local_midnight(this_month))
+                .limit(1)).first()
+            if pending is None:
+                return 0
+
+    # 1. In/out per batch and month, the current month included
+    local_time = func.timezone(settings.BUSINESS_TIMEZONE, DDARegister.timestamp)
+    month = cast(func.date_trunc("month", local_time), Date)
+    monthly = select(
+        DDARegister.drug_id, month.label("month"),
+        func.max(DDARegister.product_id).label("product_id"),
+        func.sum(DDARegister.quantity_in).label("quantity_in"),
+        func.sum(DDARegister.quantity_out).label("quantity_out")
+    ).group_by(DDARegister.drug_id, month)
+    if since is not None:
+        monthly = monthly.where(DDARegister.timestamp >= _local_midnight(since))
+    m = monthly.subquery()
+
+    # 2. Net of every later month, newest first
+    net = m.c.quantity_in - m.c.quantity_out
+    later = func.coalesce(func.sum(net).over(
+        partition_by=m.c.drug_id, order_by=m.c.month.desc(), rows=(None, -1)), 0)
+    closings = select(
+        m.c.drug_id, m.c.month, m.c.product_id, m.c.quantity_in,
+        m.c.quantity_out, (Drug.quantity - later).label("closing_balance")
+    ).join(Drug, Drug.id == m.c.drug_id).subquery()
+
+    # 3. Only complete months are stored
+    ins = pg_insert(DDABalanceCheckpoint).from_select(
+        CHECKPOINT_COLUMNS,
+        select(*[closings.c[c] for c in CHECKPOINT_COLUMNS])
+        .where(closings.c.month < this_month))
+    return db.execute(ins.on_conflict_do_update(
+        index_elements=[DDABalanceCheckpoint.drug_id, DDABalanceCheckpoint.month],
+        set_={c: ins.excluded[c] for c in CHECKPOINT_COLUMNS[2:]})).rowcount
+
+
+def period_opening_balances(db, start_date: date, product_id=None) -> list:
+    """
+    Balance of every controlled batch when `start_date` begins: the nearest
+    checkpoint before that month plus the register entries between the
+    month start and `start_date`. Zero balances are left out.
+    """
+    month_start = start_date.replace(day=1)
+    balances = {}
+
+    # 1. Latest checkpoint per batch before the start month
+    latest = select(
+        DDABalanceCheckpoint.drug_id,
+        func.max(DDABalanceCheckpoint.month).label("month")
+    ).where(DDABalanceCheckpoint.month < month_start)
+    if product_id:
+        latest = latest.where(DDABalanceCheckpoint.product_id == product_id)
+    latest = latest.group_by(DDABalanceCheckpoint.drug_id).subquery()
+    for drug_id, balance in db.execute(
+            select(DDABalanceCheckpoint.drug_id, DDABalanceCheckpoint.closing_balance)
+            .join(latest, (latest.c.drug_id == DDABalanceCheckpoint.drug_id)
+                  & (latest.c.month == DDABalanceCheckpoint.month))):
+        balances[drug_id] = balance
+
+    # 2. Entries from the start of that month up to start_date
+    partial = select(
+        DDARegister.drug_id,
+        func.sum(DDARegister.quantity_in - DDARegister.quantity_out)
+    ).where(DDARegister.timestamp >= _local_midnight(month_start),
+            DDARegister.timestamp < _local_midnight(start_date))
+    if product_id:
+        partial = partial.where(DDARegister.product_id == product_id)
+    for drug_id, net in db.execute(partial.group_by(DDARegister.drug_id)):
+        balances[drug_id] = balances.get(drug_id, 0) + net
+
+    balances = {k: v for k, v in balances.items() if v}
+    if not balances:
+        return []
+    names = db.execute(
+        select(Drug.id, Drug.batch_number, Product.brand_name)
+        .join(Product, Drug.product_id == Product.id)
+        .where(Drug.id.in_(balances))
+        .order_by(Product.brand_name, Drug.batch_number))
+    return [{"brand_name": n.brand_name, "batch_number": n.batch_number,
+             "balance": balances[n.id]} for n in names]
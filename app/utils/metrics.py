@@ -0,0 +1,40 @@
+# app/utils/metrics.py
+import os
+import threading
+from collections import defaultdict
+
+# Minimal in-process metrics registry, read through GET /api/admin/metrics.
+# Values are kept per worker process (the pid is reported alongside them)
+# and reset when the worker restarts.
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_timings = {}
+
+
+def increment(name: str, value: int = 1):
+    with _lock:
+        _counters[name] += value
+
+
+def observe_ms(name: str, elapsed_ms: float):
+    """Records one timing sample (count / total / max are kept)."""
+    with _lock:
+        stat = _timings.setdefault(
+            name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+        stat["count"] += 1
+        stat["total_ms"] += elapsed_ms
+        stat["max_ms"] = max(stat["max_ms"], elapsed_ms)
+
+
+def snapshot() -> dict:
+    with _lock:
+        timings = {
+            name: {
+                "count": s["count"],
+                "avg_ms": round(s["total_ms"] / s["count"], 3),
+                "max_ms": round(s["max_ms"], 3),
+                "total_ms": round(s["total_ms"], 3),
+            } for name, s in _timings.items()
+        }
+        return {"pid": os.getpid(), "counters": dict(_counters), "timings": timings}
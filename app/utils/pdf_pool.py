@@ -0,0 +1,141 @@
+# app/utils/pdf_pool.py
+import multiprocessing
+import os
+import pickle
+import tempfile
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+
+import structlog
+from fastapi import HTTPException
+
+from app.core.config import settings
+
+logger = structlog.get_logger()
+
+# ReportLab layout is pure Python: run in the API process it holds the GIL
+# and every request on that worker (checkouts included) waits behind it.
+# PDFs are therefore rendered in a separate pool of PDF_RENDER_PROCESSES
+# processes. The caller reads its rows off the database as before and
+# spools them, as plain tuples/dicts, into a temp file; the renderer
+# process lays them out from there a chunk at a time and sends back the
+# finished document as bytes. At most PDF_RENDER_QUEUE_LIMIT report
+# renders may be waiting or running per API process; receipts and report
+# jobs skip that limit and wait (their own thread pools already bound them).
+
+_lock = threading.Lock()
+_pool = None
+_in_flight = 0
+_exempt: ContextVar[bool] = ContextVar("pdf_queue_exempt", default=False)
+
+
+@contextmanager
+def queue_exempt():
+    """Renders inside this block are not held to the report queue limit."""
+    token = _exempt.set(True)
+    try:
+        yield
+    finally:
+        _exempt.reset(token)
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _lock:
+        if _pool is None:
+            # spawn: the renderers must not inherit the parent's threads
+            # or database connections
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.PDF_RENDER_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _spool_rows(rows) -> str:
+    """Pickles `rows` into a temp file, REPORT_CHUNK_ROWS per frame."""
+    fd, path = tempfile.mkstemp(prefix="pdf-rows-")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            rows = iter(rows)
+            while True:
+                chunk = list(islice(rows, settings.REPORT_CHUNK_ROWS))
+                if not chunk:
+                    break
+                pickle.dump(chunk, out, protocol=pickle.HIGHEST_PROTOCOL)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+
+def _read_rows(path: str):
+    with open(path, "rb") as f:
+        while True:
+            try:
+                chunk = pickle.load(f)
+            except EOFError:
+                return
+            yield from chunk
+
+
+def _render(render, args, rows_path):
+    # Runs in a renderer process
+    if rows_path is not None:
+        args = (_read_rows(rows_path),) + args
+    out = render(*args)
+    try:
+        return out.read()
+    finally:
+        out.close()
+
+
+def render_pdf(render, *args, rows=None, bounded: bool = True) -> bytes:
+    """
+    Calls `render(*args)` (or `render(rows, *args)`) in the renderer pool
+    and returns the PDF bytes. `render` is a module-level function that
+    returns a rewound file; `rows` is any iterable of plain data, read here
+    before the render starts. Raises 429 when `bounded` and the report
+    queue is full.
+    """
+    global _in_flight, _pool
+    bounded = bounded and not _exempt.get()
+    if bounded:
+        with _lock:
+            if _in_flight >= settings.PDF_RENDER_QUEUE_LIMIT:
+                raise HTTPException(
+                    status_code=429, detail="PDF renderer is busy, try again shortly")
+            _in_flight += 1
+
+    rows_path = None
+    try:
+        if rows is not None:
+            rows_path = _spool_rows(rows)
+        pool = _get_pool()
+        try:
+            return pool.submit(_render, render, args, rows_path).result()
+        except BrokenProcessPool:
+            # A renderer died (killed, out of memory): start a fresh pool
+            # for the next caller
+            logger.error("pdf_pool_broken", render=render.__name__)
+            with _lock:
+                if _pool is pool:
+                    _pool = None
+            raise
+    finally:
+        if rows_path is not None:
+            os.remove(rows_path)
+        if bounded:
+            with _lock:
+                _in_flight -= 1
+
+
+def shutdown_pdf_pool():
+    global _pool
+    with _lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
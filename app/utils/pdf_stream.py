@@ -0,0 +1,91 @@
+# app/utils/pdf_stream.py
+import tempfile
+
+from reportlab.platypus import Table, TableStyle
+
+from app.core.config import settings
+
+# Large reports (registers, checklists) are laid out as a stream: rows come
+# from a server-side cursor, are grouped into tables of REPORT_CHUNK_ROWS
+# (each repeating its header row on every page it spans) and handed to
+# platypus one at a time. Only the chunk being laid out is held as Table
+# objects; the finished document is spooled to a temp file once it passes
+# REPORT_SPOOL_MEMORY_BYTES and streamed to the client from there.
+
+READ_SIZE = 64 * 1024
+
+
+class FlowableStream(list):
+    """
+    The flowables list platypus consumes from the front, filled lazily from
+    an iterator so the whole document never exists at once.
+    """
+
+    def __init__(self, flowables):
+        super().__init__()
+        self._source = iter(flowables)
+
+    def _fill(self):
+        # Two buffered: platypus peeks one ahead for keepWithNext
+        while self._source is not None and list.__len__(self) < 2:
+            try:
+                self.append(next(self._source))
+            except StopIteration:
+                self._source = None
+
+    def __len__(self):
+        self._fill()
+        return list.__len__(self)
+
+    def __getitem__(self, index):
+        self._fill()
+        return list.__getitem__(self, index)
+
+    def __delitem__(self, index):
+        self._fill()
+        list.__delitem__(self, index)
+
+
+def chunked_tables(header, rows, col_widths, style, chunk_rows=None):
+    """Yields one Table per `chunk_rows` rows, each starting with `header`."""
+    chunk_rows = chunk_rows or settings.REPORT_CHUNK_ROWS
+    style = TableStyle(style)
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_rows:
+            yield Table([header] + chunk, colWidths=col_widths,
+                        repeatRows=1, style=style)
+            chunk = []
+    if chunk:
+        yield Table([header] + chunk, colWidths=col_widths,
+                    repeatRows=1, style=style)
+
+
+def build_pdf(doc_class, flowables, **doc_kwargs):
+    """
+    Builds a platypus document from a (lazy) iterable of flowables into a
+    spooled temp file, rewound and ready to stream.
+    """
+    out = tempfile.SpooledTemporaryFile(
+        max_size=settings.REPORT_SPOOL_MEMORY_BYTES)
+    doc = doc_class(out, **doc_kwargs)
+    try:
+        doc.build(FlowableStream(flowables))
+    except Exception:
+        out.close()
+        raise
+    out.seek(0)
+    return out
+
+
+def iter_file(fileobj):
+    """Streams a spooled document in READ_SIZE pieces, closing it after."""
+    try:
+        while True:
+            data = fileobj.read(READ_SIZE)
+            if not data:
+                break
+            yield data
+    finally:
+        fileobj.close()
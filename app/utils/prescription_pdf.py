@@ -1,50 +1,52 @@
 # app/utils/prescription_pdf.py
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4, landscape
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet
-import io
 
+from app.utils.pdf_stream import build_pdf, chunked_tables
 
-def generate_prescription_book_pdf(data, start_date, end_date):
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=landscape(A4))
-    elements = []
-    styles = getSampleStyleSheet()
-
-    # Title
-    elements.append(
-        Paragraph("PRESCRIPTION REGISTER (TREATMENT RECORD BOOK)", styles['Title']))
-    date_range = f"Period: {start_date} to {end_date}" if start_date else "Full Clinical History"
-    elements.append(Paragraph(date_range, styles['Normal']))
-    elements.append(Spacer(1, 12))
+# Table Header
+HEADER = ['Date', 'Receipt', 'Patient',
+          'Prescriber', 'Medicines', 'Instructions']
+# Column widths for landscape A4
+COL_WIDTHS = [70, 80, 120, 130, 150, 180]
+TABLE_STYLE = [
+    ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('FONTSIZE', (0, 0), (-1, -1), 9),
+]
 
-    # Table Header
-    header = ['Date', 'Receipt', 'Patient',
-              'Prescriber', 'Medicines', 'Instructions']
-    table_data = [header]
 
+def _rows(data, styles):
     for item in data:
-        table_data.append([
+        yield [
             item['date'],
             item['receipt_number'],
             f"{item['patient_name']}\n({item['age_sex']})",
             item['prescriber'],
             Paragraph(item['drugs'], styles['Normal']),
             Paragraph(item['instructions'], styles['Normal'])
-        ])
-
-    # Column widths for landscape A4
-    table = Table(table_data, colWidths=[70, 80, 120, 130, 150, 180])
-
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-    ]))
-
-    elements.append(table)
-    doc.build(elements)
-    buffer.seek(0)
-    return buffer
+        ]
+
+
+def _flowables(data, start_date, end_date):
+    styles = getSampleStyleSheet()
+
+    # Title
+    yield Paragraph("PRESCRIPTION REGISTER (TREATMENT RECORD BOOK)", styles['Title'])
+    date_range = f"Period: {start_date} to {end_date}" if start_date else "Full Clinical History"
+    yield Paragraph(date_range, styles['Normal'])
+    yield Spacer(1, 12)
+
+    yield from chunked_tables(HEADER, _rows(data, styles), COL_WIDTHS, TABLE_STYLE)
+
+
+def generate_prescription_book_pdf(data, start_date, end_date):
+    """
+    Renders prescription entries (any iterable, consumed once) into a
+    spooled file, laying them out a chunk at a time.
+    """
+    return build_pdf(SimpleDocTemplate, _flowables(data, start_date, end_date),
+                     pagesize=landscape(A4))
@@ -0,0 +1,80 @@
+# app/utils/product_search.py
+import threading
+from bisect import bisect_left
+
+from app.models.stock import GenericDrug, Product
+from app.utils.catalog_cache import catalog_versions
+
+# In-process prefix index over product brand names and generic names, so
+# type-ahead lookups from the tills are a binary search in memory instead
+# of a table scan. Every word of a name is indexed, so "500" finds
+# "Amoxil 500mg" and "amox" finds products whose generic is Amoxicillin.
+# The index is rebuilt whenever the products or generics catalog version
+# moves, so a change made through any worker reaches every worker.
+
+
+# Upper bound on index entries examined per lookup (one-letter queries)
+MAX_SCAN = 5000
+
+
+def normalise(text: str) -> str:
+    return " ".join((text or "").lower().split())
+
+
+class ProductPrefixIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = []      # sorted search keys
+        self._entries = []   # (key, rank, product_id), same order as _keys
+        self._versions = None
+
+    def rebuild(self, db, versions=None):
+        rows = db.query(Product.id, Product.brand_name, GenericDrug.name)\
+            .outerjoin(GenericDrug, Product.generic_id == GenericDrug.id).all()
+
+        entries = []
+        for product_id, brand_name, generic_name in rows:
+            brand = normalise(brand_name)
+            # rank 0: whole brand name, 1: later word of the brand, 2: generic
+            entries.append((brand, 0, product_id))
+            entries.extend((brand[i + 1:], 1, product_id)
+                           for i, ch in enumerate(brand) if ch == " ")
+            if generic_name:
+                generic = normalise(generic_name)
+                entries.append((generic, 2, product_id))
+                entries.extend((generic[i + 1:], 2, product_id)
+                               for i, ch in enumerate(generic) if ch == " ")
+        entries.sort()
+
+        with self._lock:
+            self._entries = entries
+            self._keys = [e[0] for e in entries]
+            self._versions = versions
+
+    def ensure_fresh(self, db):
+        versions = catalog_versions(db, "products", "generics")
+        if versions != self._versions:
+            self.rebuild(db, versions)
+
+    def search(self, query: str, limit: int) -> list:
+        """Product ids whose names have a word starting with `query`."""
+        q = normalise(query)
+        if not q:
+            return []
+        with self._lock:
+            keys, entries = self._keys, self._entries
+
+        matches = {}
+        i = bisect_left(keys, q)
+        end = min(len(keys), i + MAX_SCAN)
+        while i < end and keys[i].startswith(q):
+            key, rank, product_id = entries[i]
+            best = matches.get(product_id)
+            if best is None or (rank, key) < best:
+                matches[product_id] = (rank, key)
+            i += 1
+        ranked = sorted(matches.items(), key=lambda m: (m[1], m[0]))
+        return [product_id for product_id, _ in ranked[:limit]]
+
+
+product_index = ProductPrefixIndex()
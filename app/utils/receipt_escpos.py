@@ -0,0 +1,78 @@
+# app/utils/receipt_escpos.py
+# Plain-text and ESC/POS receipts for 80mm thermal printers.
+# Takes the same receipt dict as generate_receipt_pdf.
+
+# 80mm paper, font A: 48 characters per line
+LINE_WIDTH = 48
+
+ESC = b"\x1b"
+GS = b"\x1d"
+INIT = ESC + b"@"
+ALIGN_LEFT = ESC + b"a\x00"
+ALIGN_CENTER = ESC + b"a\x01"
+BOLD_ON = ESC + b"E\x01"
+BOLD_OFF = ESC + b"E\x00"
+DOUBLE_ON = GS + b"!\x11"
+DOUBLE_OFF = GS + b"!\x00"
+FEED_AND_CUT = ESC + b"d\x04" + GS + b"V\x42\x00"
+
+# Item | Qty | Price | Total
+COLS = (22, 5, 10, 11)
+
+
+def _row(cells):
+    name, qty, price, total = cells
+    return (f"{name[:COLS[0]]:<{COLS[0]}}{qty:>{COLS[1]}}"
+            f"{price:>{COLS[2]}}{total:>{COLS[3]}}")
+
+
+def _body_lines(data):
+    lines = [
+        f"Date: {data.get('date', '')}",
+        f"Client: {data.get('client_name', 'Walk-in')}",
+        f"Receipt No: {data.get('receipt_number', '')}",
+    ]
+    if data.get("ticket_number"):
+        lines.append(f"Ticket No: {data['ticket_number']}")
+    lines.append("-" * LINE_WIDTH)
+    lines.append(_row(("Item", "Qty", "Price", "Total")))
+    lines.append("-" * LINE_WIDTH)
+    for item in data.get("items", []):
+        lines.append(_row((
+            item["name"],
+            str(item["qty"]),
+            f"{item['price']:,.2f}",
+            f"{item['subtotal']:,.2f}"
+        )))
+    lines.append("-" * LINE_WIDTH)
+    return lines
+
+
+def _total_line(data):
+    return f"GRAND TOTAL: KES {data.get('total_amount', 0):,.2f}".rjust(LINE_WIDTH)
+
+
+def generate_receipt_text(data) -> str:
+    """Fixed-width receipt, printable as-is on any text printer."""
+    lines = ["PHARMACY RECEIPT".center(LINE_WIDTH), ""]
+    lines += _body_lines(data)
+    lines.append(_total_line(data))
+    lines.append("")
+    lines.append(f"Served by: {data.get('served_by', 'Staff')}")
+    lines.append("Thank you for your visit!".center(LINE_WIDTH))
+    return "\n".join(lines) + "\n"
+
+
+def generate_receipt_escpos(data) -> bytes:
+    """Raw ESC/POS byte stream, sent straight to the thermal printer."""
+
+    def enc(text):
+        return text.encode("cp437", errors="replace") + b"\n"
+
+    out = [INIT, ALIGN_CENTER, BOLD_ON, DOUBLE_ON,
+           enc("PHARMACY RECEIPT"), DOUBLE_OFF, BOLD_OFF, ALIGN_LEFT]
+    out += [enc(line) for line in _body_lines(data)]
+    out += [BOLD_ON, enc(_total_line(data)), BOLD_OFF, b"\n",
+            enc(f"Served by: {data.get('served_by', 'Staff')}"),
+            ALIGN_CENTER, enc("Thank you for your visit!"), FEED_AND_CUT]
+    return b"".join(out)
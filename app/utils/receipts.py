@@ -0,0 +1,133 @@
+# app/utils/receipts.py
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import structlog
+
+from app.core.config import settings
+from app.models.sales import SalesTransaction, SaleItem
+from app.models.stock import Drug, Product
+from app.models.user import User
+from app.utils.pdf_pool import render_pdf
+from app.utils.receipt_pdf import generate_receipt_pdf
+from app.utils.receipt_escpos import generate_receipt_escpos, generate_receipt_text
+
+logger = structlog.get_logger()
+
+# Receipt PDFs are rendered off the sale request, on a small worker pool,
+# and kept in an in-process LRU keyed by receipt number. The first print
+# and every reprint are served from here; a worker that has not seen the
+# receipt rebuilds it from the database on demand. Reprints carry a
+# "REPRINT" ticket label and are cached under their own key, so a copy can
+# always be told apart from the original.
+
+_executor = ThreadPoolExecutor(
+    max_workers=settings.RECEIPT_RENDER_WORKERS, thread_name_prefix="receipt")
+_lock = threading.Lock()
+_cache: "OrderedDict[str, bytes]" = OrderedDict()
+_pending: "dict[str, Future]" = {}
+
+
+def receipt_data(db, tx: SalesTransaction) -> dict:
+    """Builds the receipt payload for a stored transaction in one query."""
+    served_by = db.query(User.username).filter(User.id == tx.user_id).scalar()
+    lines = db.query(
+        SaleItem.quantity, SaleItem.unit_price, SaleItem.subtotal,
+        Product.brand_name
+    ).outerjoin(Drug, SaleItem.drug_id == Drug.id)\
+     .outerjoin(Product, Drug.product_id == Product.id)\
+     .filter(SaleItem.transaction_id == tx.id)\
+     .order_by(SaleItem.id).all()
+
+    return {
+        "receipt_number": str(tx.receipt_number),
+        "client_name": str(tx.patient_name),
+        "total_amount": float(tx.total_amount),
+        "date": tx.timestamp.strftime("%Y-%m-%d %H:%M"),
+        "served_by": str(served_by or "System"),
+        "items": [{
+            "name": str(line.brand_name or "Item"),
+            "qty": int(line.quantity),
+            "price": float(line.unit_price),
+            "subtotal": float(line.subtotal)
+        } for line in lines]
+    }
+
+
+def _render(data: dict) -> bytes:
+    # Laid out in the PDF renderer pool; receipts are not held to its
+    # report queue limit
+    return render_pdf(generate_receipt_pdf, data, bounded=False)
+
+
+def _store(key: str, pdf: bytes):
+    with _lock:
+        _cache[key] = pdf
+        _cache.move_to_end(key)
+        while len(_cache) > settings.RECEIPT_CACHE_SIZE:
+            _cache.popitem(last=False)
+        _pending.pop(key, None)
+
+
+def _render_and_store(key: str, data: dict) -> bytes:
+    try:
+        pdf = _render(data)
+    except Exception as e:
+        with _lock:
+            _pending.pop(key, None)
+        logger.error("receipt_render_failed",
+                     receipt_no=data["receipt_number"], error=str(e))
+        raise
+    _store(key, pdf)
+    return pdf
+
+
+def schedule_receipt_pdf(data: dict):
+    """Queues background rendering of a receipt that was just sold."""
+    receipt_number = data["receipt_number"]
+    with _lock:
+        if receipt_number in _cache or receipt_number in _pending:
+            return
+        _pending[receipt_number] = _executor.submit(
+            _render_and_store, receipt_number, data)
+
+
+def get_receipt_pdf(key: str, load_data) -> bytes:
+    """
+    Returns the PDF cached under `key` (the receipt number, or the reprint
+    key), waiting for a render already in flight, or rendering it now from
+    `load_data()`.
+    """
+    with _lock:
+        pdf = _cache.get(key)
+        if pdf is not None:
+            _cache.move_to_end(key)
+            return pdf
+        future = _pending.get(key)
+
+    if future is not None:
+        return future.result()
+    return _render_and_store(key, load_data())
+
+
+def render_receipt(receipt_number: str, fmt: str, load_data, reprint: bool = False):
+    """
+    Returns (content, media_type, extension) for a receipt in the requested
+    format. "pdf" goes through the cache above; "escpos" (raw thermal
+    printer bytes) and "text" are cheap enough to render on every request.
+    A reprint is labelled as such in every format.
+    """
+    key = receipt_number
+    if reprint:
+        key = f"{receipt_number}:reprint"
+        original = load_data
+
+        def load_data():
+            return {**original(), "ticket_number": "REPRINT"}
+
+    if fmt == "escpos":
+        return generate_receipt_escpos(load_data()), "application/octet-stream", "bin"
+    if fmt == "text":
+        return generate_receipt_text(load_data()).encode("utf-8"), "text/plain; charset=utf-8", "txt"
+    return get_receipt_pdf(key, load_data), "application/pdf", "pdf"
@@ -0,0 +1,317 @@
+# app/utils/report_jobs.py
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Iterable, NamedTuple, Optional
+
+import structlog
+from fastapi import HTTPException
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import func, text, update
+
+from app.core.config import settings
+from app.database.db import SessionLocal, engine
+from app.models.report_job import ReportJob
+from app.models.user import User
+from app.utils.pdf_pool import queue_exempt
+
+logger = structlog.get_logger()
+
+# Long reports (exports, registers, checklists) can be run as background
+# jobs instead of inside the request: a job row records the request and
+# its progress, a bounded thread pool builds the file into
+# REPORT_ARTIFACT_DIR, and the client polls the job and downloads the
+# file when it is done. Each report is a "kind" registered by the router
+# that also serves it synchronously, so both paths share one builder.
+# Jobs run in the process that accepted them, which refreshes their
+# heartbeat_at every REPORT_JOB_HEARTBEAT_SECONDS. A queued or running job
+# whose heartbeat has gone stale belonged to a process that is gone
+# (restart, crash, a replaced container) and is failed by the next
+# startup or submission; jobs of live processes, other workers included,
+# are left alone.
+
+PROGRESS_INTERVAL_SECONDS = 1.0
+LIVE_STATUSES = ("queued", "running")
+# Heartbeats missed before a job counts as abandoned
+STALE_HEARTBEATS = 3
+
+_executor = ThreadPoolExecutor(
+    max_workers=settings.REPORT_JOB_WORKERS, thread_name_prefix="report")
+_lock = threading.Lock()
+_active: "set[str]" = set()
+_stop = threading.Event()
+_heartbeat: Optional[threading.Thread] = None
+
+
+class ReportFile(NamedTuple):
+    """What a builder returns: the content in pieces, and how to serve it."""
+    chunks: Iterable[bytes]
+    filename: str
+    media_type: str
+
+
+class ReportKind(NamedTuple):
+    params: type
+    build: Callable  # (db, params, user, progress) -> ReportFile
+    admin_only: bool
+
+
+REPORT_KINDS: "dict[str, ReportKind]" = {}
+
+
+def report_kind(name: str, params: type, admin_only: bool = False):
+    """Registers a builder as a report kind that can run as a job."""
+    def register(build):
+        REPORT_KINDS[name] = ReportKind(params, build, admin_only)
+        return build
+    return register
+
+
+def track(rows, progress: Optional[Callable] = None):
+    """Passes rows through, reporting the running count to `progress`."""
+    if progress is None:
+        yield from rows
+        return
+    n = 0
+    for n, row in enumerate(rows, start=1):
+        progress(n)
+        yield row
+    progress(n, final=True)
+
+
+class _Progress:
+    # Writes rows_done at most once per PROGRESS_INTERVAL_SECONDS, on its
+    # own connection so the builder's transaction is left alone
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self._last = 0.0
+
+    def __call__(self, rows: int, final: bool = False):
+        now = time.monotonic()
+        if not final and now - self._last < PROGRESS_INTERVAL_SECONDS:
+            return
+        self._last = now
+        with engine.begin() as conn:
+            conn.execute(update(ReportJob)
+                         .where(ReportJob.id == self.job_id)
+                         .values(rows_done=rows))
+
+
+def _request_key(kind: str, params: BaseModel, user_id: int) -> str:
+    raw = json.dumps({"kind": kind, "params": params.model_dump(mode="json"),
+                      "user": user_id}, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _expiry() -> datetime:
+    return datetime.now(timezone.utc) + timedelta(seconds=settings.REPORT_JOB_TTL_SECONDS)
+
+
+def job_status(job: ReportJob) -> dict:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "params": job.params,
+        "status": job.status,
+        "rows_done": job.rows_done,
+        "error": job.error,
+        "filename": job.filename,
+        "size_bytes": job.size_bytes,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "expires_at": job.expires_at,
+        "download_url": f"/api/reports/jobs/{job.id}/download" if job.status == "done" else None
+    }
+
+
+def _remove_artifact(path: Optional[str]):
+    if path:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def purge_expired_jobs(db) -> int:
+    """Deletes finished jobs past their expiry, and their files."""
+    expired = db.query(ReportJob.id, ReportJob.artifact_path).filter(
+        ReportJob.status.in_(("done", "failed")),
+        ReportJob.expires_at < func.now()).all()
+    for job in expired:
+        _remove_artifact(job.artifact_path)
+    if expired:
+        db.query(ReportJob).filter(ReportJob.id.in_([j.id for j in expired]))\
+            .delete(synchronize_session=False)
+    return len(expired)
+
+
+def fail_stale_jobs(db) -> int:
+    """
+    Fails queued or running jobs whose heartbeat is older than
+    STALE_HEARTBEATS intervals. Works on a Session or a Connection.
+    """
+    cutoff = func.now() - timedelta(
+        seconds=STALE_HEARTBEATS * settings.REPORT_JOB_HEARTBEAT_SECONDS)
+    failed = db.execute(
+        update(ReportJob)
+        .where(ReportJob.status.in_(LIVE_STATUSES),
+               func.coalesce(ReportJob.heartbeat_at, ReportJob.created_at) < cutoff)
+        .values(status="failed", error="The server running this report stopped",
+                finished_at=func.now(), expires_at=_expiry())
+        .execution_options(synchronize_session=False)).rowcount
+    if failed:
+        logger.warning("report_jobs_stale_failed", count=failed)
+    return failed
+
+
+def submit_report_job(db, kind: str, raw_params: dict, user: User) -> ReportJob:
+    """
+    Returns the live job for an identical request, or queues a new one.
+    Raises 404 for an unknown kind, 403 for an admin-only kind, 422 for
+    invalid params and 429 when the pool's queue is full.
+    """
+    spec = REPORT_KINDS.get(kind)
+    if spec is None:
+        raise HTTPException(status_code=404, detail=f"Unknown report '{kind}'")
+    if spec.admin_only and user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    try:
+        params = spec.params.model_validate(raw_params or {})
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(
+            include_url=False, include_context=False))
+
+    key = _request_key(kind, params, user.id)
+    # Serialise identical requests so only one of them creates the job
+    db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:key))"), {"key": key})
+    purge_expired_jobs(db)
+    fail_stale_jobs(db)
+
+    existing = db.query(ReportJob).filter(
+        ReportJob.request_key == key,
+        ReportJob.status != "failed",
+        ReportJob.expires_at > func.now()
+    ).order_by(ReportJob.created_at.desc()).first()
+    if existing is not None:
+        db.commit()
+        return existing
+
+    with _lock:
+        if len(_active) >= settings.REPORT_JOB_QUEUE_LIMIT:
+            db.rollback()
+            raise HTTPException(
+                status_code=429, detail="Report queue is full, try again shortly")
+        job = ReportJob(
+            id=uuid.uuid4().hex, kind=kind, params=params.model_dump(mode="json"),
+            request_key=key, created_by=user.id, status="queued",
+            rows_done=0, heartbeat_at=func.now(), expires_at=_expiry())
+        db.add(job)
+        db.commit()
+        _active.add(job.id)
+
+    _executor.submit(_run_job, job.id)
+    logger.info("report_job_queued", job_id=job.id, kind=kind, user=user.username)
+    return job
+
+
+def _write_artifact(job_id: str, report: ReportFile) -> tuple:
+    os.makedirs(settings.REPORT_ARTIFACT_DIR, exist_ok=True)
+    ext = os.path.splitext(report.filename)[1]
+    path = os.path.join(settings.REPORT_ARTIFACT_DIR, f"{job_id}{ext}")
+    partial = path + ".part"
+    size = 0
+    try:
+        with open(partial, "wb") as out:
+            for chunk in report.chunks:
+                out.write(chunk)
+                size += len(chunk)
+        os.replace(partial, path)
+    except Exception:
+        _remove_artifact(partial)
+        raise
+    return path, size
+
+
+def _run_job(job_id: str):
+    db = SessionLocal()
+    started = time.perf_counter()
+    try:
+        job = db.get(ReportJob, job_id)
+        if job is None or job.status != "queued":
+            return  # purged, or failed as stale while it waited
+        job.status, job.started_at = "running", func.now()
+        db.commit()
+
+        spec = REPORT_KINDS[job.kind]
+        params = spec.params.model_validate(job.params)
+        user = db.get(User, job.created_by) if job.created_by else None
+        # The job pool already bounds these: wait for a PDF renderer
+        # slot rather than failing on a full queue
+        with queue_exempt():
+            report = spec.build(db, params, user, _Progress(job_id))
+            path, size = _write_artifact(job_id, report)
+
+        db.rollback()  # end the builder's read transaction
+        finished = db.execute(
+            update(ReportJob)
+            .where(ReportJob.id == job_id, ReportJob.status == "running")
+            .values(status="done", filename=report.filename,
+                    media_type=report.media_type, artifact_path=path,
+                    size_bytes=size, finished_at=func.now(), expires_at=_expiry())
+        ).rowcount
+        db.commit()
+        if not finished:
+            # Already failed as stale: clients were told so, drop the file
+            _remove_artifact(path)
+            return
+        logger.info("report_job_done", job_id=job_id, kind=job.kind, bytes=size,
+                    duration_ms=round((time.perf_counter() - started) * 1000))
+    except Exception as e:
+        db.rollback()
+        logger.error("report_job_failed", job_id=job_id, error=str(e))
+        db.execute(update(ReportJob).where(ReportJob.id == job_id).values(
+            status="failed", error=str(e)[:2000],
+            finished_at=func.now(), expires_at=_expiry()))
+        db.commit()
+    finally:
+        db.close()
+        with _lock:
+            _active.discard(job_id)
+
+
+def _beat():
+    # Refreshes the heartbeat of every job this process holds
+    while not _stop.wait(settings.REPORT_JOB_HEARTBEAT_SECONDS):
+        with _lock:
+            job_ids = list(_active)
+        if not job_ids:
+            continue
+        try:
+            with engine.begin() as conn:
+                conn.execute(update(ReportJob)
+                             .where(ReportJob.id.in_(job_ids),
+                                    ReportJob.status.in_(LIVE_STATUSES))
+                             .values(heartbeat_at=func.now()))
+        except Exception as e:
+            logger.error("report_job_heartbeat_failed", error=str(e))
+
+
+def start_report_jobs():
+    """Startup: fails jobs abandoned by dead processes, starts the heartbeat."""
+    global _heartbeat
+    with engine.begin() as conn:
+        fail_stale_jobs(conn)
+    _heartbeat = threading.Thread(
+        target=_beat, name="report-heartbeat", daemon=True)
+    _heartbeat.start()
+
+
+def shutdown_report_jobs():
+    _stop.set()
+    _executor.shutdown(wait=False, cancel_futures=True)
@@ -1,67 +1,160 @@
 # app/utils/reports.py
+import csv
 import io
-import pandas as pd
+import tempfile
 from datetime import datetime
 from reportlab.lib.pagesizes import letter, landscape
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from reportlab.platypus import SimpleDocTemplate, Table, Paragraph, Spacer
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+from openpyxl.utils import get_column_letter
 
+from app.core.config import settings
+from app.utils.pdf_stream import build_pdf, chunked_tables
 
-def generate_excel_report(data):
-    output = io.BytesIO()
-    df = pd.DataFrame(data)
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Sales Report')
-        ws = writer.sheets['Sales Report']
-        for idx, col in enumerate(df.columns):
-            max_len = max(df[col].astype(str).map(len).max(), len(col)) + 2
-            ws.column_dimensions[chr(65 + idx)].width = max_len
+# Sales exports are written as the rows come off a server-side cursor:
+# CSV is streamed to the client piece by piece, XLSX goes through
+# openpyxl's write-only mode (rows are flushed to the workbook's temp
+# files, never held as cells) and PDF through the chunked table stream,
+# in the PDF renderer pool (app/utils/pdf_pool.py).
+
+SALES_REPORT_HEADER = ["Date", "Receipt #", "Patient", "Staff", "Revenue", "Profit"]
+# Character widths for XLSX, points for PDF
+SALES_REPORT_XLSX_WIDTHS = [18, 14, 28, 16, 14, 14]
+SALES_REPORT_PDF_WIDTHS = [110, 90, 160, 100, 90, 90]
+
+TABLE_STYLE = [
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2d3748')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (3, -1), 'LEFT'),   # Text columns
+    ('ALIGN', (4, 0), (5, -1), 'RIGHT'),  # Money columns
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.whitesmoke, colors.white]),
+]
+TOTALS_STYLE = [
+    ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#edf2f7')),
+    ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
+    ('ALIGN', (4, 0), (5, -1), 'RIGHT'),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ('LINEABOVE', (0, 0), (-1, 0), 1.5, colors.black),
+]
+
+# CSV rows buffered per piece sent to the client
+CSV_PIECE_ROWS = 500
+
+
+class SalesReportRows:
+    """
+    Iterates report rows built from (timestamp, receipt_number,
+    patient_name, username, total_amount, profit) rows, keeping the
+    running totals for the closing TOTALS row.
+    """
+
+    def __init__(self, rows):
+        self._rows = rows
+        self.count = 0
+        self.revenue = 0.0
+        self.profit = 0.0
+
+    def __iter__(self):
+        for timestamp, receipt_number, patient_name, username, total, profit in self._rows:
+            revenue, profit = float(total or 0), float(profit or 0)
+            self.count += 1
+            self.revenue += revenue
+            self.profit += profit
+            yield [
+                timestamp.strftime("%Y-%m-%d %H:%M") if timestamp else "N/A",
+                receipt_number,
+                patient_name or "Walk-in",
+                username or "System",
+                round(revenue, 2),
+                round(profit, 2)
+            ]
+
+    def totals(self):
+        """The TOTALS row, once the rows have been consumed (None if empty)."""
+        if not self.count:
+            return None
+        return ["TOTALS", f"{self.count} Sales", "-", "-",
+                round(self.revenue, 2), round(self.profit, 2)]
+
+
+def iter_csv(report: SalesReportRows):
+    """Yields the CSV export in pieces as the rows are produced."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    # BOM so Excel opens the file as UTF-8
+    buf.write("\ufeff")
+    writer.writerow(SALES_REPORT_HEADER)
+    for n, row in enumerate(report, start=1):
+        writer.writerow(row)
+        if n % CSV_PIECE_ROWS == 0:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate()
+    totals = report.totals()
+    if totals:
+        writer.writerow(totals)
+    yield buf.getvalue().encode("utf-8")
+
+
+def generate_excel_report(report: SalesReportRows):
+    """Writes the XLSX export in write-only mode into a spooled temp file."""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Sales Report")
+    # Write-only sheets need their widths before the first row
+    for idx, width in enumerate(SALES_REPORT_XLSX_WIDTHS, start=1):
+        ws.column_dimensions[get_column_letter(idx)].width = width
+
+    bold = Font(bold=True)
+
+    def styled(values):
+        cells = []
+        for value in values:
+            cell = WriteOnlyCell(ws, value=value)
+            cell.font = bold
+            cells.append(cell)
+        return cells
+
+    ws.append(styled(SALES_REPORT_HEADER))
+    for row in report:
+        ws.append(row)
+    totals = report.totals()
+    if totals:
+        ws.append(styled(totals))
+
+    output = tempfile.SpooledTemporaryFile(
+        max_size=settings.REPORT_SPOOL_MEMORY_BYTES)
+    wb.save(output)
     output.seek(0)
     return output
 
 
-def generate_pdf_report(data, title="Sales Report"):
-    output = io.BytesIO()
-    doc = SimpleDocTemplate(output, pagesize=landscape(letter),
-                            rightMargin=20, leftMargin=20, topMargin=30, bottomMargin=20)
-    elements = []
+def generate_pdf_report(rows, title="Sales Report"):
+    """
+    Renders (timestamp, receipt_number, patient_name, username,
+    total_amount, profit) tuples into a spooled file. Takes the raw rows
+    rather than a SalesReportRows so it can run in the PDF renderer pool.
+    """
+    report = SalesReportRows(rows)
     styles = getSampleStyleSheet()
 
-    elements.append(Paragraph(title, styles['Title']))
-    elements.append(Paragraph(
-        f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')}", styles['Normal']))
-    elements.append(Spacer(1, 15))
-
-    if data:
-        cols = list(data[0].keys())
-        table_data = [cols] + [[str(row[c]) for c in cols] for row in data]
-
-        # Column Widths: Date, Receipt, Patient, Staff, Revenue, Profit
-        widths = [110, 90, 160, 100, 90, 90]
-        t = Table(table_data, colWidths=widths)
-
-        style = [
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2d3748')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (3, -1), 'LEFT'),   # Text columns
-            ('ALIGN', (4, 0), (5, -1), 'RIGHT'),  # Money columns
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1),
-             [colors.whitesmoke, colors.white]),
-        ]
-
-        if data[-1].get("Date") == "TOTALS":
-            style.extend([
-                ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#edf2f7')),
-                ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-                ('LINEABOVE', (0, -1), (-1, -1), 1.5, colors.black),
-            ])
-
-        t.setStyle(TableStyle(style))
-        elements.append(t)
-
-    doc.build(elements)
-    output.seek(0)
-    return output
+    def flowables():
+        yield Paragraph(title, styles['Title'])
+        yield Paragraph(
+            f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')}", styles['Normal'])
+        yield Spacer(1, 15)
+        yield from chunked_tables(SALES_REPORT_HEADER, report,
+                                  SALES_REPORT_PDF_WIDTHS, TABLE_STYLE)
+        totals = report.totals()
+        if totals:
+            yield Table([totals], colWidths=SALES_REPORT_PDF_WIDTHS, style=TOTALS_STYLE)
+        else:
+            yield Paragraph("No data found", styles['Normal'])
+
+    return build_pdf(SimpleDocTemplate, flowables(), pagesize=landscape(letter),
+                     rightMargin=20, leftMargin=20, topMargin=30, bottomMargin=20)
@@ -0,0 +1,115 @@
+# app/utils/sales_rollup.py
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.core.config import settings
+from app.models.sales import SalesTransaction, SaleItem, SalesDailyRollup, SalesDailyTotal
+from app.models.stock import Drug
+
+# Dashboards over past days read sales_daily_rollup (per day, cashier and
+# product) and sales_daily_totals (per day and cashier) instead of every
+# sale, so their cost grows with the number of days, not of sales. The sale
+# path adds each sale to both tables inside its own transaction; the
+# additive upserts need no lock, concurrent sales simply queue on the row.
+# A sale with no cashier is keyed under user 0, and a line whose batch has
+# lost its product (deleted) under product 0.
+
+ROLLUP_COLUMNS = ["day", "user_id", "product_id", "revenue", "cost",
+                  "profit", "units", "transaction_count"]
+TOTAL_COLUMNS = ["day", "user_id", "revenue", "transaction_count"]
+
+# Cost and profit of a sale line, from the cost captured at sale time
+LINE_COST = SaleItem.unit_cost * SaleItem.quantity
+LINE_PROFIT = (SaleItem.unit_price - SaleItem.unit_cost) * SaleItem.quantity
+
+
+def sale_day():
+    """The day a sale is reported under."""
+    return SalesTransaction.business_date
+
+
+def rollup_complete_before():
+    """Days before this one (the local business day) are fully rolled up."""
+    return datetime.now(ZoneInfo(settings.BUSINESS_TIMEZONE)).date()
+
+
+def rollup_select(transaction_filter=None):
+    """Aggregates the per-product rollup columns straight from the sales."""
+    day = sale_day()
+    user_id = func.coalesce(SalesTransaction.user_id, 0)
+    product_id = func.coalesce(Drug.product_id, 0)
+    stmt = select(
+        day.label("day"),
+        user_id.label("user_id"),
+        product_id.label("product_id"),
+        func.sum(SaleItem.subtotal).label("revenue"),
+        func.sum(LINE_COST).label("cost"),
+        func.sum(LINE_PROFIT).label("profit"),
+        func.sum(SaleItem.quantity).label("units"),
+        func.count(SalesTransaction.id.distinct()).label("transaction_count"),
+    ).select_from(SaleItem)\
+     .join(SalesTransaction, SaleItem.transaction_id == SalesTransaction.id)\
+     .join(Drug, SaleItem.drug_id == Drug.id)\
+     .group_by(day, user_id, product_id)
+
+    if transaction_filter is not None:
+        stmt = stmt.where(transaction_filter)
+    return stmt
+
+
+def totals_select(transaction_filter=None):
+    """Aggregates the per-day receipt totals straight from the sales."""
+    day = sale_day()
+    user_id = func.coalesce(SalesTransaction.user_id, 0)
+    stmt = select(
+        day.label("day"),
+        user_id.label("user_id"),
+        func.sum(SalesTransaction.total_amount).label("revenue"),
+        func.count(SalesTransaction.id).label("transaction_count"),
+    ).group_by(day, user_id)
+
+    if transaction_filter is not None:
+        stmt = stmt.where(transaction_filter)
+    return stmt
+
+
+def _add_from(model, columns, keys, stmt):
+    ins = pg_insert(model).from_select(columns, stmt)
+    return ins.on_conflict_do_update(
+        index_elements=keys,
+        set_={c: getattr(model, c) + ins.excluded[c]
+              for c in columns if c not in keys})
+
+
+def add_sale_to_rollup(db, transaction_id: int):
+    """Adds one sale (already flushed with its items) to the rollups."""
+    sale = SalesTransaction.id == transaction_id
+    db.execute(_add_from(SalesDailyRollup, ROLLUP_COLUMNS,
+                         ["day", "user_id", "product_id"], rollup_select(sale)))
+    db.execute(_add_from(SalesDailyTotal, TOTAL_COLUMNS,
+                         ["day", "user_id"], totals_select(sale)))
+
+
+def rebuild_sales_rollup(db) -> int:
+    """
+    Recomputes both rollups from scratch. Works on a Session or a
+    Connection; the caller commits. Sales made meanwhile wait for the
+    rebuild to commit, so none is lost or counted twice.
+    """
+    db.execute(text("LOCK TABLE sales_daily_rollup, sales_daily_totals "
+                    "IN EXCLUSIVE MODE"))
+    db.execute(delete(SalesDailyRollup))
+    db.execute(delete(SalesDailyTotal))
+    db.execute(pg_insert(SalesDailyRollup).from_select(ROLLUP_COLUMNS, rollup_select()))
+    db.execute(pg_insert(SalesDailyTotal).from_select(TOTAL_COLUMNS, totals_select()))
+    return db.execute(select(func.count()).select_from(SalesDailyTotal)).scalar()
+
+
+def seed_sales_rollup(conn):
+    """Startup step: fills the rollups the first time they are deployed."""
+    if conn.execute(select(SalesDailyTotal.day).limit(1)).first() is None \
+            and conn.execute(select(SalesTransaction.id).limit(1)).first() is not None:
+        rebuild_sales_rollup(conn)
@@ -0,0 +1,251 @@
+# app/utils/stock_import.py
+import csv
+import io
+from datetime import date, datetime
+
+from sqlalchemy import case, insert, tuple_, update
+
+from app.models.stock import Drug, Product, Supplier
+from app.models.stock_movement import StockMovement
+from app.utils.stock_locks import lock_rows
+
+# Goods-received import: streams rows out of an uploaded CSV/XLSX invoice,
+# validates them against products and suppliers held in memory, and writes
+# the batches and RECEIVE movements in chunks of set-based statements.
+
+CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 500
+
+# Accepted header spellings -> canonical column
+HEADER_ALIASES = {
+    "product": "product", "brand": "product", "brand_name": "product",
+    "product_id": "product_id",
+    "supplier": "supplier", "supplier_name": "supplier",
+    "supplier_id": "supplier_id",
+    "batch": "batch_number", "batch_no": "batch_number", "batch_number": "batch_number",
+    "expiry": "expiry_date", "expiry_date": "expiry_date",
+    "quantity": "quantity", "qty": "quantity",
+    "buying_price": "buying_price", "cost": "buying_price", "cost_price": "buying_price",
+    "unit_price": "unit_price", "selling_price": "unit_price", "price": "unit_price",
+    "expiry_alert_days": "expiry_alert_days",
+}
+REQUIRED = ("batch_number", "expiry_date", "quantity", "buying_price", "unit_price")
+
+
+class RowError(ValueError):
+    pass
+
+
+def _normalise_header(value) -> str:
+    key = str(value or "").strip().lower().replace(" ", "_").replace("#", "")
+    return HEADER_ALIASES.get(key, key)
+
+
+def iter_rows(filename: str, fileobj):
+    """Yields (row_number, {column: value}) without loading the whole file."""
+    if filename.lower().endswith((".xlsx", ".xlsm")):
+        from openpyxl import load_workbook
+        wb = load_workbook(fileobj, read_only=True, data_only=True)
+        try:
+            rows = wb.active.iter_rows(values_only=True)
+            header = [_normalise_header(h) for h in next(rows, [])]
+            for n, values in enumerate(rows, start=2):
+                if any(v not in (None, "") for v in values):
+                    yield n, dict(zip(header, values))
+        finally:
+            wb.close()
+    else:
+        text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+        reader = csv.reader(text)
+        header = [_normalise_header(h) for h in next(reader, [])]
+        for n, values in enumerate(reader, start=2):
+            if any(v.strip() for v in values):
+                yield n, dict(zip(header, values))
+
+
+def _parse_date(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = str(value or "").strip()
+    for fmt in ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%m/%Y"):
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    raise RowError(f"Invalid expiry_date '{text}'")
+
+
+def _parse_number(value, name, cast):
+    try:
+        number = float(str(value).strip().replace(",", ""))
+    except (TypeError, ValueError):
+        raise RowError(f"Invalid {name} '{value}'")
+    if cast is int:
+        if not number.is_integer():
+            raise RowError(f"{name} must be a whole number")
+        number = int(number)
+    if number < 0:
+        raise RowError(f"{name} cannot be negative")
+    return number
+
+
+class StockImporter:
+    """Validates and applies goods-received rows inside the caller's transaction."""
+
+    def __init__(self, db, user_id: int):
+        self.db = db
+        self.user_id = user_id
+        # Catalogue held in memory so validation costs no queries per row
+        products = db.query(Product.id, Product.brand_name).all()
+        self.product_ids = {p.id for p in products}
+        self.products_by_name = {
+            p.brand_name.strip().lower(): p.id for p in products}
+        suppliers = db.query(Supplier.id, Supplier.name).all()
+        self.supplier_ids = {s.id for s in suppliers}
+        self.suppliers_by_name = {
+            s.name.strip().lower(): s.id for s in suppliers}
+
+        self.rows_read = 0
+        self.batches_created = 0
+        self.batches_updated = 0
+        self.units_received = 0
+        self.error_count = 0
+        self.errors = []
+        # (drug_id, product_id, quantity) for every batch received
+        self.received = []
+        self.movement_ids = []
+
+    def _error(self, row_number, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row_number, "error": message})
+
+    def _resolve(self, row, id_col, name_col, ids, by_name, label, required):
+        if row.get(id_col) not in (None, ""):
+            ref = _parse_number(row[id_col], id_col, int)
+            if ref not in ids:
+                raise RowError(f"{label} id {ref} not found")
+            return ref
+        name = str(row.get(name_col) or "").strip()
+        if not name:
+            if required:
+                raise RowError(f"Missing {label.lower()}")
+            return None
+        ref = by_name.get(name.lower())
+        if ref is None:
+            raise RowError(f"{label} '{name}' not found")
+        return ref
+
+    def parse(self, row_number, row) -> dict:
+        for col in REQUIRED:
+            if row.get(col) in (None, ""):
+                raise RowError(f"Missing {col}")
+        quantity = _parse_number(row["quantity"], "quantity", int)
+        if quantity == 0:
+            raise RowError("quantity must be greater than zero")
+        parsed = {
+            "product_id": self._resolve(row, "product_id", "product", self.product_ids,
+                                        self.products_by_name, "Product", True),
+            "supplier_id": self._resolve(row, "supplier_id", "supplier", self.supplier_ids,
+                                         self.suppliers_by_name, "Supplier", False),
+            "batch_number": str(row["batch_number"]).strip(),
+            "expiry_date": _parse_date(row["expiry_date"]),
+            "quantity": quantity,
+            "buying_price": _parse_number(row["buying_price"], "buying_price", float),
+            "unit_price": _parse_number(row["unit_price"], "unit_price", float),
+        }
+        if row.get("expiry_alert_days") not in (None, ""):
+            parsed["expiry_alert_days"] = _parse_number(
+                row["expiry_alert_days"], "expiry_alert_days", int)
+        return parsed
+
+    def run(self, rows):
+        chunk = []
+        for row_number, row in rows:
+            self.rows_read += 1
+            try:
+                chunk.append(self.parse(row_number, row))
+            except RowError as e:
+                self._error(row_number, str(e))
+                continue
+            if len(chunk) >= CHUNK_SIZE:
+                self._apply(chunk)
+                chunk = []
+        if chunk:
+            self._apply(chunk)
+
+    def _apply(self, chunk):
+        # Merge repeated (product, batch) lines within the chunk
+        merged = {}
+        for r in chunk:
+            key = (r["product_id"], r["batch_number"])
+            if key in merged:
+                merged[key]["quantity"] += r["quantity"]
+            else:
+                merged[key] = dict(r)
+
+        # One query for every batch of the chunk that already exists, locked
+        # in id order like the sale and reconcile paths so an import and a
+        # till touching the same batches queue instead of deadlocking
+        existing = {
+            (d.product_id, d.batch_number): d.id
+            for d in lock_rows(
+                self.db,
+                self.db.query(Drug.id, Drug.product_id, Drug.batch_number)
+                .filter(tuple_(Drug.product_id, Drug.batch_number).in_(list(merged)))
+                .order_by(Drug.id),
+                "stock_import")
+        }
+
+        # Existing batches: add the received quantity in one UPDATE
+        top_up = {existing[k]: r["quantity"] for k, r in merged.items() if k in existing}
+        if top_up:
+            self.db.execute(
+                update(Drug)
+                .where(Drug.id.in_(top_up))
+                .values(quantity=Drug.quantity + case(top_up, value=Drug.id))
+                .execution_options(synchronize_session=False))
+
+        # New batches: one multi-row INSERT returning their ids
+        new_rows = [r for k, r in merged.items() if k not in existing]
+        created = {}
+        if new_rows:
+            result = self.db.execute(
+                insert(Drug).returning(
+                    Drug.id, Drug.product_id, Drug.batch_number,
+                    sort_by_parameter_order=True),
+                new_rows)
+            created = {(d.product_id, d.batch_number): d.id for d in result}
+
+        ids = {**existing, **created}
+        movements = []
+        for key, r in merged.items():
+            drug_id = ids[key]
+            self.received.append((drug_id, r["product_id"], r["quantity"]))
+            movements.append({
+                "drug_id": drug_id,
+                "movement_type": "RECEIVE",
+                "quantity_changed": r["quantity"],
+                "reason": f"Batch {r['batch_number']} received",
+                "user_id": self.user_id
+            })
+        result = self.db.execute(
+            insert(StockMovement).returning(StockMovement.id), movements)
+        self.movement_ids.extend(m.id for m in result)
+
+        self.batches_updated += len(top_up)
+        self.batches_created += len(created)
+        self.units_received += sum(r["quantity"] for r in merged.values())
+
+    def summary(self) -> dict:
+        return {
+            "rows_read": self.rows_read,
+            "rows_imported": self.rows_read - self.error_count,
+            "batches_created": self.batches_created,
+            "batches_updated": self.batches_updated,
+            "units_received": self.units_received,
+            "error_count": self.error_count,
+            "errors": self.errors,
+        }
@@ -0,0 +1,49 @@
+# app/utils/stock_locks.py
+import time
+
+import structlog
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app.core.config import settings
+from app.utils import metrics
+
+logger = structlog.get_logger()
+
+# SQLSTATE raised by Postgres when lock_timeout expires
+LOCK_NOT_AVAILABLE = "55P03"
+
+
+def lock_rows(db, query, operation: str, of=None) -> list:
+    """
+    Runs `query` as SELECT ... FOR UPDATE inside the current transaction.
+
+    Callers must order the query by primary key: every writer then takes its
+    row locks in the same order, so overlapping carts queue behind each
+    other instead of deadlocking. Waits are bounded by STOCK_LOCK_TIMEOUT_MS
+    (answered with 409 so the till can retry) and recorded as metrics.
+    Pass `of` to lock only that entity's rows when the query joins others.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text(
+            f"SET LOCAL lock_timeout = '{int(settings.STOCK_LOCK_TIMEOUT_MS)}ms'"))
+
+    started = time.perf_counter()
+    try:
+        rows = query.with_for_update(of=of).all()
+    except OperationalError as e:
+        if getattr(e.orig, "pgcode", None) != LOCK_NOT_AVAILABLE:
+            raise
+        metrics.increment(f"stock_lock_timeouts.{operation}")
+        logger.warning("stock_lock_timeout", operation=operation)
+        raise HTTPException(
+            status_code=409,
+            detail="Stock is being updated by another till, please retry")
+
+    waited_ms = (time.perf_counter() - started) * 1000
+    metrics.observe_ms(f"stock_lock_wait_ms.{operation}", waited_ms)
+    if waited_ms >= settings.STOCK_LOCK_SLOW_MS:
+        logger.warning("stock_lock_slow", operation=operation,
+                       waited_ms=round(waited_ms, 1), rows=len(rows))
+    return rows
@@ -0,0 +1,122 @@
+# app/utils/stock_summary.py
+from sqlalchemy import and_, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.models.stock import Drug, Product, ProductStockSummary
+
+# product_stock_summary holds one row per product so that dashboards read
+# O(products) rows instead of scanning every batch. Stock write paths call
+# refresh_product_summaries() for the products they touched, inside their
+# own transaction, so the summary commits (or rolls back) with the write.
+
+SUMMARY_COLUMNS = ["product_id", "total_quantity", "batch_count",
+                   "nearest_expiry", "avg_cost", "below_reorder"]
+
+
+def summary_select(product_ids=None):
+    """Aggregates the summary columns straight from the batches."""
+    on_hand = and_(
+        Drug.product_id == Product.id,
+        Drug.quantity > 0,
+        ~Drug.batch_number.ilike("PLACEHOLDER-%")
+    )
+    total = func.coalesce(func.sum(Drug.quantity), 0)
+    stmt = select(
+        Product.id.label("product_id"),
+        total.label("total_quantity"),
+        func.count(Drug.id).label("batch_count"),
+        func.min(Drug.expiry_date).label("nearest_expiry"),
+        func.coalesce(
+            func.sum(Drug.quantity * Drug.buying_price)
+            / func.nullif(func.sum(Drug.quantity), 0), 0.0
+        ).label("avg_cost"),
+        (total <= func.coalesce(Product.reorder_level, 0)).label("below_reorder"),
+    ).select_from(Product).outerjoin(Drug, on_hand)\
+     .group_by(Product.id, Product.reorder_level)
+
+    if product_ids is not None:
+        stmt = stmt.where(Product.id.in_(product_ids))
+    return stmt
+
+
+def _upsert_from(stmt):
+    ins = pg_insert(ProductStockSummary).from_select(SUMMARY_COLUMNS, stmt)
+    return ins.on_conflict_do_update(
+        index_elements=[ProductStockSummary.product_id],
+        set_={
+            **{c: ins.excluded[c] for c in SUMMARY_COLUMNS[1:]},
+            "updated_at": func.now()
+        })
+
+
+def refresh_product_summaries(db, product_ids):
+    """
+    Recomputes the summary rows of `product_ids` in the current transaction.
+
+    The rows are locked (in id order) before aggregating: a concurrent write
+    to another batch of the same product then waits for this transaction and
+    aggregates over its committed result, so the last writer never stores a
+    total computed from a stale snapshot.
+    """
+    ids = sorted({p for p in product_ids if p is not None})
+    if not ids:
+        return
+
+    db.execute(pg_insert(ProductStockSummary)
+               .values([{"product_id": i} for i in ids])
+               .on_conflict_do_nothing())
+    db.execute(select(ProductStockSummary.product_id)
+               .where(ProductStockSummary.product_id.in_(ids))
+               .order_by(ProductStockSummary.product_id)
+               .with_for_update())
+    db.execute(_upsert_from(summary_select(ids)))
+
+
+def rebuild_stock_summary(db) -> int:
+    """
+    Recomputes every summary row from scratch. Works on a Session or a
+    Connection; the caller commits.
+    """
+    db.execute(_upsert_from(summary_select()))
+    return db.execute(
+        select(func.count()).select_from(ProductStockSummary)).scalar()
+
+
+def seed_stock_summary(conn):
+    """Startup step: fills the summary the first time it is deployed."""
+    if conn.execute(select(ProductStockSummary.product_id).limit(1)).first() is None:
+        rebuild_stock_summary(conn)
+
+
+def find_summary_drift(db) -> list:
+    """Returns the products whose stored summary differs from the batches."""
+    fresh = summary_select().subquery()
+    stored = ProductStockSummary
+    rows = db.execute(
+        select(fresh, stored.total_quantity.label("stored_total_quantity"),
+               stored.batch_count.label("stored_batch_count"),
+               stored.nearest_expiry.label("stored_nearest_expiry"),
+               stored.avg_cost.label("stored_avg_cost"),
+               stored.below_reorder.label("stored_below_reorder"))
+        .select_from(fresh)
+        .outerjoin(stored, stored.product_id == fresh.c.product_id)
+    ).mappings()
+
+    drift = []
+    for r in rows:
+        diffs = {}
+        for col in SUMMARY_COLUMNS[1:]:
+            expected, actual = r[col], r[f"stored_{col}"]
+            if col == "avg_cost" and expected is not None and actual is not None:
+                same = abs(float(expected) - float(actual)) < 0.005
+            else:
+                same = expected == actual
+            if not same:
+                diffs[col] = {"expected": expected, "stored": actual}
+        if diffs:
+            drift.append({
+                "product_id": r["product_id"],
+                "missing": r["stored_total_quantity"] is None,
+                "differences": diffs
+            })
+    return drift
@@ -0,0 +1,85 @@
+# benchmarks/concurrent_sales.py
+"""
+Concurrency stress check for the sale path.
+
+Fires many parallel one-line sales at the same batch of a running API and
+verifies that stock never goes negative and that every unit sold is
+accounted for exactly once. Empty carts are mixed into the burst: each
+must be rejected with 422 without touching stock.
+
+    python benchmarks/concurrent_sales.py --token <jwt> --batch-id 12 \
+        --workers 48 --sales 200
+
+Run it against a disposable database: it really sells the stock.
+"""
+import argparse
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+
+def batch_quantity(client, batch_id):
+    rows = client.get("/api/stock/").json()
+    return next(r["quantity"] for r in rows if r["id"] == batch_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--token", required=True)
+    parser.add_argument("--batch-id", type=int, required=True)
+    parser.add_argument("--workers", type=int, default=48)
+    parser.add_argument("--sales", type=int, default=200)
+    parser.add_argument("--qty", type=int, default=1)
+    parser.add_argument("--empty", type=int, default=20,
+                        help="empty-cart requests mixed into the burst")
+    args = parser.parse_args()
+
+    headers = {"Authorization": f"Bearer {args.token}"}
+    client = httpx.Client(base_url=args.url, headers=headers, timeout=60)
+    before = batch_quantity(client, args.batch_id)
+
+    def sell(empty):
+        started = time.perf_counter()
+        items = [] if empty else [{"batch_id": args.batch_id, "quantity": args.qty}]
+        r = client.post("/api/stock/bulk-sell", json={
+            "client_name": "stress-test",
+            "items": items,
+        })
+        return empty, r.status_code, (time.perf_counter() - started) * 1000
+
+    # Empty carts spread evenly through the sales
+    requests = [False] * args.sales
+    for i in range(args.empty):
+        requests.insert((i * len(requests)) // args.empty, True)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        outcomes = list(pool.map(sell, requests))
+    elapsed = time.perf_counter() - started
+
+    results = [(code, ms) for empty, code, ms in outcomes if not empty]
+    empty_statuses = Counter(code for empty, code, _ in outcomes if empty)
+
+    after = batch_quantity(client, args.batch_id)
+    statuses = Counter(code for code, _ in results)
+    latencies = sorted(ms for _, ms in results)
+    sold = statuses[200] * args.qty
+
+    print(f"stock before={before} after={after} sold={sold}")
+    print(f"statuses={dict(statuses)} empty carts={dict(empty_statuses)} "
+          f"in {elapsed:.2f}s")
+    print(f"latency p50={latencies[len(latencies) // 2]:.1f}ms "
+          f"p95={latencies[int(len(latencies) * 0.95) - 1]:.1f}ms")
+    print("lock metrics:", client.get("/api/admin/metrics").json().get("timings"))
+
+    assert after >= 0, "stock went negative"
+    assert before - after == sold, "lost update: stock and sales disagree"
+    assert set(empty_statuses) <= {422}, "empty cart was not rejected"
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# benchmarks/pdf_offload.py
+"""
+Checkout latency while a register PDF renders: in-process vs the renderer pool.
+
+A "checkout" thread repeats the pure-Python part of a sale (FEFO
+allocation over a product's batches plus the ESC/POS receipt) every
+--interval ms and records how long each one takes from when it was due:
+first with nothing else running, then while a DDA register of --rows
+entries is laid out on a thread of this process (how the PDFs used to
+run), then while the same register is laid out through render_pdf().
+
+    python benchmarks/pdf_offload.py --rows 20000
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.allocation import allocate_fefo  # noqa: E402
+from app.utils.dda_pdf import generate_dda_pdf  # noqa: E402
+from app.utils.pdf_pool import render_pdf, shutdown_pdf_pool  # noqa: E402
+from app.utils.receipt_escpos import generate_receipt_escpos  # noqa: E402
+
+from report_pdf import sample_entries  # noqa: E402
+
+
+def checkout(batches):
+    available = {b.id: b.quantity for b in batches}
+    lines = allocate_fefo(1, batches, 25, available)
+    return generate_receipt_escpos({
+        "receipt_number": "RCPT-BENCH1",
+        "client_name": "Walk-in Client",
+        "total_amount": 150.0 * 25,
+        "date": "2026-01-01 09:00",
+        "served_by": "bench",
+        "items": [{
+            "name": f"Amoxicillin 500mg Caps ({batch.batch_number})",
+            "qty": units,
+            "price": 150.0,
+            "subtotal": 150.0 * units
+        } for batch, units in lines]
+    })
+
+
+def measure_checkouts(stop, interval):
+    batches = [SimpleNamespace(id=i, quantity=3, batch_number=f"B{i:04d}")
+               for i in range(40)]
+    # Timed from when each checkout was due, so waiting for the GIL counts
+    latencies = []
+    due = time.perf_counter()
+    while not stop.is_set():
+        checkout(batches)
+        latencies.append((time.perf_counter() - due) * 1000)
+        due += interval / 1000
+        time.sleep(max(0.0, due - time.perf_counter()))
+    return latencies
+
+
+def in_process(n):
+    with generate_dda_pdf(sample_entries(n), None, None) as pdf:
+        return len(pdf.read())
+
+
+def in_pool(n):
+    return len(render_pdf(generate_dda_pdf, None, None, rows=sample_entries(n)))
+
+
+def run(render, n, interval, idle_seconds):
+    stop = threading.Event()
+    result = {}
+    checkouts = threading.Thread(
+        target=lambda: result.setdefault("ms", measure_checkouts(stop, interval)))
+    checkouts.start()
+
+    started = time.perf_counter()
+    if render is None:
+        time.sleep(idle_seconds)
+        size = 0
+    else:
+        size = render(n)
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    checkouts.join()
+    return elapsed, size, result["ms"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--interval", type=float, default=20,
+                        help="ms between checkouts")
+    parser.add_argument("--idle", type=float, default=3,
+                        help="seconds of checkouts with no PDF running")
+    args = parser.parse_args()
+
+    # Start the renderer processes outside the measurement
+    in_pool(10)
+
+    print(f"{args.rows} register rows, a checkout every {args.interval:g} ms")
+    for name, render in (("idle", None), ("in-process", in_process), ("pool", in_pool)):
+        elapsed, size, ms = run(render, args.rows, args.interval, args.idle)
+        ms.sort()
+        p95 = ms[int(len(ms) * 0.95) - 1] if len(ms) >= 20 else ms[-1]
+        pdf = f", pdf {size / 2**10:6.0f} KiB in {elapsed:5.2f} s" if render else ""
+        print(f"{name:>10}: {len(ms):5d} checkouts, median {statistics.median(ms):6.2f} ms, "
+              f"p95 {p95:6.2f} ms, max {ms[-1]:7.2f} ms{pdf}")
+
+    shutdown_pdf_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# benchmarks/receipt_render.py
+"""
+Compares receipt rendering cost: ReportLab PDF vs ESC/POS vs plain text.
+
+    python benchmarks/receipt_render.py --items 8 --runs 200
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.receipt_pdf import generate_receipt_pdf  # noqa: E402
+from app.utils.receipt_escpos import (  # noqa: E402
+    generate_receipt_escpos, generate_receipt_text)
+
+
+def sample_receipt(n_items):
+    items = [{
+        "name": f"Amoxicillin 500mg Caps #{i}",
+        "qty": 2,
+        "price": 150.0,
+        "subtotal": 300.0
+    } for i in range(n_items)]
+    return {
+        "receipt_number": "RCPT-BENCH1",
+        "client_name": "Walk-in Client",
+        "total_amount": 300.0 * n_items,
+        "date": "2026-01-01 09:00",
+        "served_by": "bench",
+        "items": items
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--items", type=int, default=8)
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    data = sample_receipt(args.items)
+    renderers = {
+        "pdf": lambda: generate_receipt_pdf(data).getvalue(),
+        "escpos": lambda: generate_receipt_escpos(data),
+        "text": lambda: generate_receipt_text(data),
+    }
+
+    print(f"{args.items} items, best of 3 x {args.runs} runs")
+    baseline = None
+    for name, fn in renderers.items():
+        best = min(timeit.repeat(fn, number=args.runs, repeat=3)) / args.runs
+        baseline = baseline or best
+        print(f"{name:>7}: {best * 1e6:10.1f} us/receipt "
+              f"({baseline / best:6.0f}x vs pdf), {len(fn())} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# benchmarks/report_pdf.py
+"""
+Tracks peak Python memory and build time of the streamed DDA register PDF
+as the row count grows, against laying the same rows out as one table.
+
+    python benchmarks/report_pdf.py --rows 2000 20000 50000
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reportlab.lib.pagesizes import A4, landscape  # noqa: E402
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle  # noqa: E402
+
+from app.utils.dda_pdf import COL_WIDTHS, HEADER, TABLE_STYLE, _rows, generate_dda_pdf  # noqa: E402
+from app.utils.pdf_stream import iter_file  # noqa: E402
+
+
+def sample_entries(n):
+    """Generator, like the server-side cursor the endpoint reads from."""
+    for i in range(n):
+        yield {
+            "timestamp": "2026-01-01 09:00",
+            "brand_name": f"Morphine 10mg #{i % 40}",
+            "batch_number": f"B{i % 300:04d}",
+            "entry_type": "DISPENSE",
+            "entity_name": "Walk-in Client",
+            "ref_number": f"RCPT-{i:06X}",
+            "quantity": 2,
+            "running_balance": 1000 - i % 1000,
+            "user_name": "bench",
+        }
+
+
+def streamed(n):
+    return sum(len(chunk) for chunk in iter_file(
+        generate_dda_pdf(sample_entries(n), None, None)))
+
+
+def single_table(n):
+    import io
+    buffer = io.BytesIO()
+    table = Table([HEADER] + list(_rows(sample_entries(n))),
+                  colWidths=COL_WIDTHS, repeatRows=1, style=TableStyle(TABLE_STYLE))
+    SimpleDocTemplate(buffer, pagesize=landscape(A4)).build([table])
+    return len(buffer.getvalue())
+
+
+def measure(fn, n):
+    tracemalloc.start()
+    started = time.perf_counter()
+    size = fn(n)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, nargs="+", default=[2000, 20000])
+    parser.add_argument("--skip-single", action="store_true",
+                        help="only run the streamed build")
+    args = parser.parse_args()
+
+    builders = {"streamed": streamed}
+    if not args.skip_single:
+        builders["single"] = single_table
+
+    for n in args.rows:
+        for name, fn in builders.items():
+            elapsed, peak, size = measure(fn, n)
+            print(f"{n:>7} rows {name:>9}: {elapsed:7.2f} s, "
+                  f"peak {peak / 2**20:7.1f} MiB, {size / 2**10:8.0f} KiB pdf")
+
+
+if __name__ == "__main__":
+    main()
@@ -98,4 +98,22 @@ export const apiDelete = (url, data = null, config = {}) =>
     apiRequest("delete", url, data, null, config);
 
 export const apiPatch = (url, data = null, config = {}) =>
-    apiRequest("patch", url, data, null, config);
\ No newline at end of file
+    apiRequest("patch", url, data, null, config);
+
+/**
+ * GET one page of a keyset-paginated list
+ * @returns {Promise<{data: any, nextCursor: string|null}>} the page and the
+ *   cursor for the next one (X-Next-Cursor header), null on the last page
+ */
+export async function apiGetPage(url, params = null) {
+    try {
+        const response = await api({ method: "get", url, params });
+        return {
+            data: response.data,
+            nextCursor: response.headers["x-next-cursor"] || null,
+        };
+    } catch (error) {
+        console.error(`[API Error] GET ${url}:`, error.message);
+        throw error;
+    }
+}
@@ -107,6 +107,9 @@ function Alerts() {
 }
 
 function AlertSection({ title, color, data, type, calcDays, emptyMessage }) {
+    // Near-expiry rows are batches; low stock and controlled rows are products
+    const perProduct = type !== 'expiry';
+
     return (
         <section style={{ marginBottom: "3rem" }}>
             <h3 style={{ color, borderLeft: `4px solid ${color}`, paddingLeft: '12px', marginBottom: '1rem' }}>{title}</h3>
@@ -120,10 +123,10 @@ function AlertSection({ title, color, data, type, calcDays, emptyMessage }) {
                         <thead>
                             <tr style={{ background: "#f7fafc", textAlign: 'left' }}>
                                 <th style={{ padding: "1rem" }}>Brand Name</th>
-                                <th style={{ padding: "1rem" }}>Batch</th>
-                                <th style={{ padding: "1rem" }}>{type === 'stock' ? 'Quantity' : 'Expiry Date'}</th>
+                                <th style={{ padding: "1rem" }}>{perProduct ? 'Batches' : 'Batch'}</th>
+                                <th style={{ padding: "1rem" }}>{perProduct ? 'On Hand' : 'Expiry Date'}</th>
                                 <th style={{ padding: "1rem" }}>Status</th>
-                                <th style={{ padding: "1rem" }}>Unit Price</th>
+                                <th style={{ padding: "1rem" }}>{perProduct ? 'Nearest Expiry' : 'Unit Price'}</th>
                             </tr>
                         </thead>
                         <tbody>
@@ -144,11 +147,11 @@ function AlertSection({ title, color, data, type, calcDays, emptyMessage }) {
                                 }
 
                                 return (
-                                    <tr key={drug.id} style={{ borderBottom: "1px solid #edf2f7" }}>
+                                    <tr key={perProduct ? drug.product_id : drug.id} style={{ borderBottom: "1px solid #edf2f7" }}>
                                         <td style={{ padding: "1rem", fontWeight: "600" }}>{drug.brand_name}</td>
-                                        <td style={{ padding: "1rem" }}>{drug.batch_number}</td>
+                                        <td style={{ padding: "1rem" }}>{perProduct ? drug.batch_count : drug.batch_number}</td>
                                         <td style={{ padding: "1rem" }}>
-                                            {type === 'stock' ? `${drug.quantity} units` : drug.expiry_date}
+                                            {perProduct ? `${drug.total_quantity} units` : drug.expiry_date}
                                         </td>
                                         <td style={{ padding: "1rem" }}>
                                             <span style={{
@@ -164,7 +167,7 @@ function AlertSection({ title, color, data, type, calcDays, emptyMessage }) {
                                             </span>
                                         </td>
                                         <td style={{ padding: "1rem" }}>
-                                            KES {(drug.unit_price || 0).toFixed(2)}
+                                            {perProduct ? (drug.nearest_expiry || "—") : `KES ${(drug.unit_price || 0).toFixed(2)}`}
                                         </td>
                                     </tr>
                                 );
@@ -3,7 +3,10 @@ import {
     LineChart, Line, XAxis, YAxis, CartesianGrid, Tooltip,
     ResponsiveContainer, Legend, PieChart, Pie, Cell
 } from "recharts";
-import { apiGet } from "../api/api";
+import { apiGet, apiGetPage } from "../api/api";
+
+// Records fetched per page of /analytics/my-sales/records
+const RECORDS_PAGE = 50;
 
 export default function SalesReports() {
     const role = localStorage.getItem("user_role");
@@ -15,13 +18,16 @@ export default function SalesReports() {
         transaction_count: 0,
         chart_data: [],
         pie_data: [],
-        records: []
     });
+    const [records, setRecords] = useState([]);
+    const [recordsQuery, setRecordsQuery] = useState(null);
+    const [nextCursor, setNextCursor] = useState(null);
+    const [loadingMore, setLoadingMore] = useState(false);
     const [users, setUsers] = useState([]);
     const [filters, setFilters] = useState({
         user_id: "",
-        start_date: new Date().toISOString().split('T')[0],
-        end_date: new Date().toISOString().split('T')[0]
+        start_date: new Date().toLocaleDateString("en-CA"),
+        end_date: new Date().toLocaleDateString("en-CA")
     });
 
     const COLORS = ["#3182ce", "#38a169", "#d69e2e", "#e53e3e", "#805ad5"];
@@ -35,6 +41,26 @@ export default function SalesReports() {
         }
     };
 
+    // Pages through the cashier's records, newest first
+    const fetchRecords = async (query, cursor = null) => {
+        const params = { ...query, limit: RECORDS_PAGE };
+        if (cursor) params.cursor = cursor;
+        const page = await apiGetPage("/analytics/my-sales/records", params);
+        setRecords(prev => cursor ? [...prev, ...page.data] : page.data);
+        setNextCursor(page.nextCursor);
+    };
+
+    const handleLoadMore = async () => {
+        setLoadingMore(true);
+        try {
+            await fetchRecords(recordsQuery, nextCursor);
+        } catch (err) {
+            console.error("Error fetching records", err);
+        } finally {
+            setLoadingMore(false);
+        }
+    };
+
     const handleFilter = async () => {
         const path = isAdmin ? "/analytics/admin/overview" : "/analytics/my-sales";
         const params = new URLSearchParams();
@@ -47,6 +73,11 @@ export default function SalesReports() {
         try {
             const data = await apiGet(`${path}?${params.toString()}`);
             setStats(data);
+            if (!isAdmin) {
+                const query = { start_date: filters.start_date, end_date: filters.end_date };
+                setRecordsQuery(query);
+                await fetchRecords(query);
+            }
         } catch (err) {
             console.error("Error fetching analytics", err);
         }
@@ -80,13 +111,16 @@ export default function SalesReports() {
         try {
             // Ensure your apiGet is configured to handle the third argument (options) for blobs
             const responseData = await apiGet(`/analytics/export-report?${params.toString()}`, null, { responseType: 'blob' });
-            const blob = new Blob([responseData], {
-                type: format === 'pdf' ? 'application/pdf' : 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            });
+            const types = {
+                pdf: 'application/pdf',
+                excel: 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                csv: 'text/csv'
+            };
+            const blob = new Blob([responseData], { type: types[format] });
             const url = window.URL.createObjectURL(blob);
             const link = document.createElement('a');
             link.href = url;
-            link.setAttribute('download', `Sales_Report_${filters.start_date}.${format === 'pdf' ? 'pdf' : 'xlsx'}`);
+            link.setAttribute('download', `Sales_Report_${filters.start_date}.${{ pdf: 'pdf', excel: 'xlsx', csv: 'csv' }[format]}`);
             document.body.appendChild(link);
             link.click();
             link.remove();
@@ -145,6 +179,9 @@ export default function SalesReports() {
                             <button onClick={() => handleExport('excel')} style={{ ...btnStyle, backgroundColor: '#38a169' }}>
                                 📊 Export Excel
                             </button>
+                            <button onClick={() => handleExport('csv')} style={{ ...btnStyle, backgroundColor: '#718096' }}>
+                                🧾 Export CSV
+                            </button>
                         </>
                     )}
                 </div>
@@ -205,7 +242,7 @@ export default function SalesReports() {
             </div>
 
             <div style={{ marginTop: "2rem" }}>
-                <h3 style={{ color: "#2d3748", marginBottom: "1rem" }}>Recent Records</h3>
+                <h3 style={{ color: "#2d3748", marginBottom: "1rem" }}>Records</h3>
                 <div style={tableContainerStyle}>
                     <table style={{ width: '100%', borderCollapse: 'collapse' }}>
                         <thead style={{ background: '#f8fafc' }}>
@@ -218,8 +255,8 @@ export default function SalesReports() {
                             </tr>
                         </thead>
                         <tbody>
-                            {stats.records && stats.records.length > 0 ? (
-                                stats.records.map((tx) => (
+                            {records.length > 0 ? (
+                                records.map((tx) => (
                                     <tr key={tx.id} style={{ borderBottom: '1px solid #edf2f7' }}>
                                         <td style={tdStyle}>{new Date(tx.timestamp).toLocaleString([], { dateStyle: 'short', timeStyle: 'short' })}</td>
                                         <td style={tdStyle}>{tx.receipt_number}</td>
@@ -242,6 +279,13 @@ export default function SalesReports() {
                         </tbody>
                     </table>
                 </div>
+                {nextCursor && (
+                    <div style={{ textAlign: "center", marginTop: "1rem" }}>
+                        <button onClick={handleLoadMore} disabled={loadingMore} style={btnStyle}>
+                            {loadingMore ? "Loading..." : "Load More"}
+                        </button>
+                    </div>
+                )}
             </div>
         </div>
     );
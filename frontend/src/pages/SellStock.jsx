@@ -122,7 +122,9 @@ function SellStock() {
                 }))
             };
 
-            const responseData = await apiPost("/stock/bulk-sell", payload, {
+            // The sale returns a JSON receipt; the PDF is fetched separately
+            const sale = await apiPost("/stock/bulk-sell", payload);
+            const responseData = await apiGet(`/stock/receipts/${sale.receipt_number}`, null, {
                 responseType: 'blob'
             });
 